@@ -0,0 +1,114 @@
+"""
+Benchmark thread counts and batch sizes for each GGUF model on this host and
+save the fastest settings as the model's runtime profile.
+
+Decode speed is measured per thread count (n_threads) and prefill speed per
+thread count and batch size (n_threads_batch, n_batch).
+
+    python autotune.py                       # all models in models/, print only
+    python autotune.py --save                # also write the winners to config.json
+    python autotune.py --models qwen2.5-0.5b-instruct-q4_k_m.gguf --threads 2,4,8 --batches 128,512
+"""
+import os
+import sys
+import time
+import argparse
+
+from llama_cpp import Llama
+
+from backend.config import config_manager
+from backend.model_service import MODEL_DIR
+from backend.runtime_profiles import get_profile
+
+PROMPT_TEXT = "The quick brown fox jumps over the lazy dog while the committee reviews the quarterly report. "
+
+def default_thread_counts():
+    cores = os.cpu_count() or 1
+    counts = {1, cores}
+    n = 2
+    while n < cores:
+        counts.add(n)
+        n *= 2
+    return sorted(counts)
+
+def parse_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def measure(model_path, n_ctx, n_threads, n_batch, prompt_tokens, decode_tokens):
+    """Return (prefill tokens/sec, decode tokens/sec) for one configuration."""
+    llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, n_threads_batch=n_threads,
+                n_batch=n_batch, verbose=False)
+    try:
+        tokens = llm.tokenize(PROMPT_TEXT.encode("utf-8"))
+        prompt = (tokens * (prompt_tokens // len(tokens) + 1))[:prompt_tokens]
+
+        llm.reset()
+        start = time.perf_counter()
+        llm.eval(prompt)
+        prefill_tps = len(prompt) / (time.perf_counter() - start)
+
+        # Time only the tokens after the first, so the prompt evaluation is excluded
+        llm.reset()
+        generated = 0
+        decode_start = None
+        for _ in llm.generate(prompt[:32], top_k=1, temp=0.0):
+            if decode_start is None:
+                decode_start = time.perf_counter()
+            else:
+                generated += 1
+            if generated >= decode_tokens:
+                break
+        decode_tps = generated / (time.perf_counter() - decode_start) if generated else 0.0
+        return prefill_tps, decode_tps
+    finally:
+        llm.close()
+
+def tune(model_filename, thread_counts, batch_sizes, prompt_tokens, decode_tokens):
+    model_path = os.path.join(MODEL_DIR, model_filename)
+    n_ctx = max(get_profile(model_filename)["n_ctx"], prompt_tokens + decode_tokens + 32)
+    print(f"\n=== {model_filename} ===")
+    print(f"{'threads':>8} {'batch':>6} {'prefill tok/s':>14} {'decode tok/s':>13}")
+
+    best_prefill = (0.0, None, None)
+    best_decode = {}
+    for n_threads in thread_counts:
+        for n_batch in batch_sizes:
+            prefill_tps, decode_tps = measure(model_path, n_ctx, n_threads, n_batch, prompt_tokens, decode_tokens)
+            print(f"{n_threads:>8} {n_batch:>6} {prefill_tps:>14.1f} {decode_tps:>13.1f}")
+            if prefill_tps > best_prefill[0]:
+                best_prefill = (prefill_tps, n_threads, n_batch)
+            # Decode does not depend on the batch size; keep the best run per thread count
+            best_decode[n_threads] = max(best_decode.get(n_threads, 0.0), decode_tps)
+
+    decode_threads = max(best_decode, key=best_decode.get)
+    result = {"n_threads": decode_threads, "n_threads_batch": best_prefill[1], "n_batch": best_prefill[2]}
+    print(f"Best: decode {best_decode[decode_threads]:.1f} tok/s with {decode_threads} threads, "
+          f"prefill {best_prefill[0]:.1f} tok/s with {best_prefill[1]} threads and batch {best_prefill[2]}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="*", help="GGUF filenames in models/ (default: all)")
+    parser.add_argument("--threads", type=parse_list, default=default_thread_counts(), help="comma-separated thread counts")
+    parser.add_argument("--batches", type=parse_list, default=[128, 256, 512], help="comma-separated n_batch sizes")
+    parser.add_argument("--prompt-tokens", type=int, default=512)
+    parser.add_argument("--decode-tokens", type=int, default=64)
+    parser.add_argument("--save", action="store_true", help="save the fastest settings to config.json")
+    args = parser.parse_args()
+
+    models = args.models or sorted(f for f in os.listdir(MODEL_DIR) if f.endswith(".gguf"))
+    if not models:
+        print(f"No models found in {MODEL_DIR}. Please run download_model.py first.")
+        sys.exit(1)
+
+    results = {model: tune(model, args.threads, args.batches, args.prompt_tokens, args.decode_tokens) for model in models}
+
+    if args.save:
+        profiles = dict(config_manager.get("runtime_profiles", {}))
+        for model, tuned in results.items():
+            profiles[model] = {**profiles.get(model, {}), **tuned}
+        config_manager.set("runtime_profiles", profiles)
+        print("\nSaved runtime profiles to config.json; restart the backend (or reload the models) to apply them.")
+
+if __name__ == "__main__":
+    main()
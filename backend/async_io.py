@@ -0,0 +1,34 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from backend import database
+from backend.cache_manager import cache_manager
+
+# Disk I/O gets its own threads so it never queues behind (or starves) the
+# threadpool that drives token generation for open SSE streams
+io_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pocketllm-io")
+
+async def run_io(fn, *args, **kwargs):
+    """Run a blocking database or cache call on the I/O executor without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, functools.partial(fn, *args, **kwargs))
+
+class AsyncProxy:
+    """Awaitable facade over a blocking module or object: every method call runs on the I/O executor."""
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await run_io(attr, *args, **kwargs)
+
+        return call
+
+async_database = AsyncProxy(database)
+async_cache = AsyncProxy(cache_manager)
@@ -0,0 +1,133 @@
+import os
+import sqlite3
+from typing import Optional
+from backend.cache_codec import is_encoded
+
+# Everything but the value; diskcache records size 0 for inline values, so those use length()
+ROW_COLUMNS = (
+    "c.rowid, c.key, c.tag, c.store_time, c.expire_time, COALESCE(e.access_count, c.access_count), "
+    "e.accessed_at, e.cost_ms, CASE WHEN c.filename IS NULL THEN length(c.value) ELSE c.size END"
+)
+
+class CacheBrowser:
+    """
+    Read-only, paginated view of the response cache for the admin UI.
+
+    Rows are read straight from diskcache's Cache table, joined with the
+    eviction index for access counts and paged by rowid, so a page costs the
+    same however large the cache is. Values are only loaded and decoded for
+    the rows on the page, and only when asked for.
+    """
+
+    def __init__(self, manager, cache_db_path: str, eviction_db_path: str):
+        self.manager = manager
+        self.cache_db_path = cache_db_path
+        self.eviction_db_path = eviction_db_path
+
+    def _connect(self):
+        conn = sqlite3.connect(f"file:{self.cache_db_path}?mode=ro", uri=True)
+        conn.execute("ATTACH DATABASE ? AS ev", (f"file:{self.eviction_db_path}?mode=ro",))
+        return conn
+
+    def page(self, after: Optional[int] = None, limit: int = 50, session_prefix: Optional[str] = None,
+             stored_after: Optional[float] = None, stored_before: Optional[float] = None,
+             min_access: Optional[int] = None, include_values: bool = False) -> dict:
+        """One page of entries in storage order; pass next_after back as after for the next one."""
+        if limit < 1 or limit > 1000:
+            raise ValueError("limit must be between 1 and 1000")
+        if not os.path.exists(self.cache_db_path):
+            return {"entries": [], "next_after": None}
+        # Memory-tier hits are applied to the eviction index in batches; bring counts up to date
+        self.manager.flush_hits()
+
+        clauses, params = [], []
+        if after is not None:
+            clauses.append("c.rowid > ?")
+            params.append(after)
+        if session_prefix:
+            # A range on tag rather than LIKE, so the tag index can be used
+            clauses.append("c.tag >= ? AND c.tag < ?")
+            params.extend([session_prefix, session_prefix + "\uffff"])
+        if stored_after is not None:
+            clauses.append("c.store_time >= ?")
+            params.append(stored_after)
+        if stored_before is not None:
+            clauses.append("c.store_time < ?")
+            params.append(stored_before)
+        if min_access is not None:
+            clauses.append("COALESCE(e.access_count, c.access_count) >= ?")
+            params.append(min_access)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {ROW_COLUMNS} FROM Cache c LEFT JOIN ev.cache_entries e ON e.key = c.key {where} "
+                "ORDER BY c.rowid LIMIT ?",
+                params + [limit + 1],
+            ).fetchall()
+        finally:
+            conn.close()
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        entries = [self._entry(row, include_values) for row in rows]
+        return {"entries": entries, "next_after": rows[-1][0] if more else None}
+
+    def get(self, key: str) -> Optional[dict]:
+        """A single entry with its value."""
+        if not os.path.exists(self.cache_db_path):
+            return None
+        self.manager.flush_hits()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                f"SELECT {ROW_COLUMNS} FROM Cache c LEFT JOIN ev.cache_entries e ON e.key = c.key WHERE c.key = ?", (key,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return self._entry(row, include_values=True) if row else None
+
+    def iter_entries(self, include_values: bool = False, page_size: int = 500, **filters):
+        """Every matching entry, fetched a page at a time."""
+        after = None
+        while True:
+            page = self.page(after=after, limit=page_size, include_values=include_values, **filters)
+            yield from page["entries"]
+            if page["next_after"] is None:
+                break
+            after = page["next_after"]
+
+    def _entry(self, row, include_values: bool) -> dict:
+        rowid, key, tag, store_time, expire_time, access_count, accessed_at, cost_ms, size = row
+        entry = {
+            "id": rowid,
+            "key": _text(key),
+            "session_id": _text(tag) if tag is not None else None,
+            "store_time": store_time,
+            "expire_time": expire_time,
+            "access_count": access_count,
+            "last_access": accessed_at,
+            "generation_ms": cost_ms,
+            "size_bytes": size,
+        }
+        if include_values:
+            entry.update(self._value(key))
+        return entry
+
+    def _value(self, key) -> dict:
+        value = self.manager.cache.get(key)
+        if is_encoded(value):
+            stored = self.manager.codec.decode(value)
+            return {"value": stored.text, "meta": stored.meta, "codec": stored.codec}
+        if isinstance(value, bytes):
+            value = _text(value)
+        return {"value": value if isinstance(value, str) else repr(value), "meta": {}, "codec": None}
+
+def _text(value) -> str:
+    if isinstance(value, bytes):
+        try:
+            return value.decode("utf-8")
+        except UnicodeDecodeError:
+            return f"<Binary Data: {len(value)} bytes>"
+    return str(value)
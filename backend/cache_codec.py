@@ -0,0 +1,214 @@
+import os
+import json
+import zlib
+import struct
+import threading
+from collections import deque
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:  # zlib with a preset dictionary is used instead
+    zstandard = None
+
+# Stored values: MAGIC, codec id, dictionary id (0 = none), metadata length, metadata JSON, payload
+MAGIC = b"PC"
+HEADER = struct.Struct("!2sBIH")
+
+RAW, ZLIB, ZSTD = 0, 1, 2
+CODEC_NAMES = {RAW: "none", ZLIB: "zlib", ZSTD: "zstd"}
+CODEC_IDS = {name: codec for codec, name in CODEC_NAMES.items()}
+
+# Shorter responses are stored as they are; compressing them saves next to nothing
+MIN_COMPRESS_BYTES = 64
+ZLIB_WINDOW = -15  # Raw deflate: no zlib header or checksum, the value is already framed
+
+def is_encoded(value) -> bool:
+    return isinstance(value, bytes) and value[:2] == MAGIC
+
+class CacheEntry:
+    """
+    A stored response. The header and metadata are parsed up front; the text is
+    only decompressed when it is first read.
+    """
+
+    def __init__(self, blob: bytes, codec: "ResponseCodec"):
+        self._blob = blob
+        self._codec = codec
+        _, self.codec_id, self.dict_id, meta_len = HEADER.unpack_from(blob)
+        self._payload_at = HEADER.size + meta_len
+        self.meta = json.loads(blob[HEADER.size:self._payload_at]) if meta_len else {}
+        self._text = None
+
+    @property
+    def codec(self) -> str:
+        return CODEC_NAMES.get(self.codec_id, "unknown")
+
+    @property
+    def stored_bytes(self) -> int:
+        return len(self._blob)
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self._codec.decompress(self.codec_id, self.dict_id, memoryview(self._blob)[self._payload_at:])
+        return self._text
+
+class ResponseCodec:
+    """
+    Compresses cached responses, with zstd when it is installed and zlib otherwise.
+
+    Chat replies are short and share a lot of phrasing, so both codecs use a
+    dictionary built from the first responses seen: a trained zstd dictionary, or
+    for zlib a preset dictionary of recent sample text. Dictionaries are kept on
+    disk by id so entries written with an older one stay readable.
+    """
+
+    def __init__(self, dict_dir: str, codec: str = "auto", level: Optional[int] = None,
+                 train_samples: int = 256, dict_size: int = 32768):
+        self.dict_dir = dict_dir
+        os.makedirs(dict_dir, exist_ok=True)
+        self.codec_id = self._resolve(codec)
+        self.level = level
+        self.train_samples = train_samples
+        self.dict_size = dict_size
+        self._lock = threading.Lock()
+        self._dicts = {}  # (codec id, dict id) -> dictionary bytes
+        self._zstd = {}  # dict id -> (compressor, decompressor), used under the lock
+        self._samples = deque(maxlen=max(train_samples, 1))
+        self.dict_id = self._latest_dict()
+        self.entries = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def _resolve(self, codec: str) -> int:
+        if codec == "auto":
+            return ZSTD if zstandard is not None else ZLIB
+        if codec not in CODEC_IDS:
+            raise ValueError(f"Unknown cache codec: {codec}")
+        if codec == "zstd" and zstandard is None:
+            print("zstandard is not installed; compressing the cache with zlib")
+            return ZLIB
+        return CODEC_IDS[codec]
+
+    def _dict_path(self, codec_id: int, dict_id: int) -> str:
+        return os.path.join(self.dict_dir, f"{dict_id:08x}.{CODEC_NAMES[codec_id]}")
+
+    def _latest_dict(self) -> int:
+        """Pick up the newest dictionary for the active codec from an earlier run."""
+        suffix = "." + CODEC_NAMES[self.codec_id]
+        paths = [os.path.join(self.dict_dir, name) for name in os.listdir(self.dict_dir) if name.endswith(suffix)]
+        if not paths:
+            return 0
+        newest = max(paths, key=os.path.getmtime)
+        return int(os.path.basename(newest).split(".")[0], 16)
+
+    def _dictionary(self, codec_id: int, dict_id: int) -> bytes:
+        key = (codec_id, dict_id)
+        if key not in self._dicts:
+            with open(self._dict_path(codec_id, dict_id), "rb") as f:
+                self._dicts[key] = f.read()
+        return self._dicts[key]
+
+    def encode(self, text: str, meta: dict = None) -> bytes:
+        data = text.encode("utf-8")
+        meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8") if meta else b""
+        codec_id, dict_id = self.codec_id, self.dict_id
+        if codec_id == RAW or len(data) < MIN_COMPRESS_BYTES:
+            codec_id, dict_id, payload = RAW, 0, data
+        else:
+            payload = self._compress(codec_id, dict_id, data)
+            if len(payload) >= len(data):
+                codec_id, dict_id, payload = RAW, 0, data
+        blob = HEADER.pack(MAGIC, codec_id, dict_id, len(meta_bytes)) + meta_bytes + payload
+        with self._lock:
+            self.entries += 1
+            self.raw_bytes += len(data)
+            self.stored_bytes += len(blob)
+        self._add_sample(data)
+        return blob
+
+    def decode(self, value) -> CacheEntry:
+        return CacheEntry(value, self)
+
+    def _compress(self, codec_id: int, dict_id: int, data: bytes) -> bytes:
+        if codec_id == ZSTD:
+            with self._lock:
+                return self._zstd_pair(dict_id)[0].compress(data)
+        level = self.level if self.level is not None else 6
+        if dict_id:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, ZLIB_WINDOW, zdict=self._dictionary(ZLIB, dict_id))
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, ZLIB_WINDOW)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, codec_id: int, dict_id: int, payload) -> str:
+        if codec_id == RAW:
+            return bytes(payload).decode("utf-8")
+        if codec_id == ZSTD:
+            if zstandard is None:
+                raise RuntimeError("Cache entry is zstd-compressed but zstandard is not installed")
+            with self._lock:
+                return self._zstd_pair(dict_id)[1].decompress(payload).decode("utf-8")
+        if dict_id:
+            decompressor = zlib.decompressobj(ZLIB_WINDOW, zdict=self._dictionary(ZLIB, dict_id))
+        else:
+            decompressor = zlib.decompressobj(ZLIB_WINDOW)
+        return (decompressor.decompress(payload) + decompressor.flush()).decode("utf-8")
+
+    def _zstd_pair(self, dict_id: int):
+        if dict_id not in self._zstd:
+            level = self.level if self.level is not None else 3
+            dict_data = zstandard.ZstdCompressionDict(self._dictionary(ZSTD, dict_id)) if dict_id else None
+            self._zstd[dict_id] = (
+                zstandard.ZstdCompressor(level=level, dict_data=dict_data, write_content_size=True),
+                zstandard.ZstdDecompressor(dict_data=dict_data),
+            )
+        return self._zstd[dict_id]
+
+    def _add_sample(self, data: bytes):
+        if not self.train_samples or self.dict_id or self.codec_id == RAW:
+            return
+        with self._lock:
+            self._samples.append(data)
+            ready = len(self._samples) >= self.train_samples
+        if ready:
+            self.train()
+
+    def train(self, samples: list = None) -> int:
+        """Build a dictionary from samples (by default the responses seen so far) and use it for new entries."""
+        with self._lock:
+            samples = list(samples if samples is not None else self._samples)
+            self._samples.clear()
+        if not samples or self.codec_id == RAW:
+            return self.dict_id
+        try:
+            if self.codec_id == ZSTD:
+                dictionary = zstandard.train_dictionary(self.dict_size, samples).as_bytes()
+            else:
+                # zlib looks back at most 32 KB and favours the end of the dictionary,
+                # so keep the most recent text, newest last
+                dictionary = b"\n".join(samples)[-min(self.dict_size, 32768):]
+        except Exception as e:
+            print(f"Error training cache dictionary: {e}")
+            return self.dict_id
+        dict_id = zlib.crc32(dictionary) or 1
+        path = self._dict_path(self.codec_id, dict_id)
+        with open(path, "wb") as f:
+            f.write(dictionary)
+        with self._lock:
+            self._dicts[(self.codec_id, dict_id)] = dictionary
+            self.dict_id = dict_id
+        print(f"Trained a {len(dictionary)} byte {CODEC_NAMES[self.codec_id]} cache dictionary from {len(samples)} responses")
+        return dict_id
+
+    def stats(self):
+        with self._lock:
+            return {
+                "codec": CODEC_NAMES[self.codec_id],
+                "dictionary": f"{self.dict_id:08x}" if self.dict_id else None,
+                "entries_written": self.entries,
+                "raw_bytes": self.raw_bytes,
+                "stored_bytes": self.stored_bytes,
+                "compression_ratio": round(self.raw_bytes / self.stored_bytes, 3) if self.stored_bytes else None,
+            }
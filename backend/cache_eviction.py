@@ -0,0 +1,125 @@
+import time
+import sqlite3
+import threading
+
+# Each policy evicts the entries that sort first
+EVICTION_ORDER = {
+    "lrs": "stored_at",  # Least recently stored (diskcache's default)
+    "lru": "accessed_at",
+    "lfu": "access_count, accessed_at",
+    "greedy-dual": "priority",
+}
+EVICTION_POLICIES = tuple(EVICTION_ORDER)
+
+# Cost assumed for entries written without a recorded generation time
+DEFAULT_COST_MS = 1000.0
+
+class EvictionIndex:
+    """
+    Side table of response cache entries with what the eviction policies order by.
+
+    For greedy-dual, an entry's priority is L + cost / size, where cost is the
+    time it took to generate and L is the priority of the last evicted entry.
+    Entries that were slow to generate per byte are kept longer, and a hit
+    re-bases the entry on the current L, so old favourites still age out.
+    """
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, tag TEXT, size INTEGER NOT NULL, cost_ms REAL NOT NULL, "
+            "stored_at REAL NOT NULL, accessed_at REAL NOT NULL, access_count INTEGER NOT NULL DEFAULT 0, priority REAL NOT NULL)"
+        )
+        for column in ("tag", "stored_at", "accessed_at", "access_count", "priority"):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_cache_entries_{column} ON cache_entries ({column})")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS eviction_state (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+        row = self._conn.execute("SELECT value FROM eviction_state WHERE name = 'inflation'").fetchone()
+        self.inflation = row[0] if row else 0.0
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+
+    def add(self, key: str, size: int, cost_ms: float = None, tag: str = None, stored_at: float = None):
+        cost_ms = DEFAULT_COST_MS if cost_ms is None else cost_ms
+        now = stored_at or time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM cache_entries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT INTO cache_entries (key, tag, size, cost_ms, stored_at, accessed_at, access_count, priority) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tag = excluded.tag, size = excluded.size, cost_ms = excluded.cost_ms, "
+                "stored_at = excluded.stored_at, accessed_at = excluded.accessed_at, priority = excluded.priority",
+                (key, tag, size, cost_ms, now, now, self.inflation + cost_ms / max(size, 1)),
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+
+    def touch(self, key: str):
+        """Record a hit; returns the entry's generation cost in ms, or None if it is not indexed."""
+        with self._lock:
+            row = self._conn.execute("SELECT size, cost_ms FROM cache_entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            size, cost_ms = row
+            self._conn.execute(
+                "UPDATE cache_entries SET accessed_at = ?, access_count = access_count + 1, priority = ? WHERE key = ?",
+                (time.time(), self.inflation + cost_ms / max(size, 1), key),
+            )
+            return cost_ms
+
+    def touch_many(self, hits: dict):
+        """Apply hits counted elsewhere (the in-memory tier) in one transaction."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for key, count in hits.items():
+                    self._conn.execute(
+                        "UPDATE cache_entries SET accessed_at = ?, access_count = access_count + ?, "
+                        "priority = ? + cost_ms / MAX(size, 1) WHERE key = ?",
+                        (now, count, self.inflation, key),
+                    )
+            finally:
+                self._conn.execute("COMMIT")
+
+    def victims(self, policy: str, limit: int) -> list:
+        """The next entries to evict under policy: (key, size, cost_ms, priority) rows."""
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT key, size, cost_ms, priority FROM cache_entries ORDER BY {EVICTION_ORDER[policy]} LIMIT ?", (limit,)
+            ).fetchall()
+
+    def remove(self, keys: list):
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute("SELECT size FROM cache_entries WHERE key = ?", (key,)).fetchone()
+                if row:
+                    self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+                    self.total_bytes -= row[0]
+
+    def remove_tag(self, tag: str):
+        with self._lock:
+            size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE tag = ?", (tag,)).fetchone()[0]
+            self._conn.execute("DELETE FROM cache_entries WHERE tag = ?", (tag,))
+            self.total_bytes -= size
+
+    def set_inflation(self, value: float):
+        with self._lock:
+            self.inflation = value
+            self._conn.execute(
+                "INSERT INTO eviction_state (name, value) VALUES ('inflation', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+                (value,),
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries")
+            self._conn.execute("DELETE FROM eviction_state")
+            self.total_bytes = 0
+            self.inflation = 0.0
@@ -0,0 +1,27 @@
+import json
+import hashlib
+
+def _digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+def namespace_key(model: str, temperature: float, top_p: float, max_tokens: int, system_prompt: str) -> str:
+    """Canonical hash of everything besides the messages that shapes a response."""
+    settings = {
+        "model": model,
+        "temperature": round(float(temperature), 4),
+        "top_p": round(float(top_p), 4),
+        "max_tokens": int(max_tokens),
+        "system_prompt": system_prompt or "",
+    }
+    return _digest("ns", json.dumps(settings, sort_keys=True, separators=(",", ":")))
+
+def conversation_key(namespace: str, messages: list) -> str:
+    """Canonical hash of the whole conversation, chained one message at a time, independent of session."""
+    key = namespace
+    for message in messages:
+        key = _digest(key, message["role"], message["content"])
+    return key
@@ -1,28 +1,285 @@
 import os
 from diskcache import Cache
 import time
+import sqlite3
+import threading
+from collections import Counter
+from backend.config import config_manager
+from backend.semantic_cache import SemanticCache, HashingEmbedder, LlamaEmbedder
+from backend.cache_codec import ResponseCodec, is_encoded
+from backend.cache_eviction import EvictionIndex, EVICTION_POLICIES
+from backend.hot_tier import HotTier
+from backend.cache_browser import CacheBrowser
 
-CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache")
-SESSION_TRACKING_KEY = "_session_tracking"
+# Overridable so tools like the load test can keep the singleton out of the repo's cache/
+CACHE_DIR = os.environ.get("POCKETLLM_CACHE_DIR") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache")
+# Side files kept next to diskcache's own, inside the cache directory
+SEMANTIC_INDEX_FILE = "semantic_index.npz"
+SESSION_INDEX_FILE = "sessions.db"
+DICTIONARY_DIR = "dictionaries"
+EVICTION_INDEX_FILE = "eviction.db"
+EVICTION_BATCH = 64
+HOT_HIT_FLUSH = 256  # Memory-tier hits are applied to the eviction index in batches of this many keys
+SESSION_TRACKING_KEY = "_session_tracking"  # Legacy pickled {session_id: last_access} dict
 
 class CacheManager:
-    def __init__(self):
-        self.cache = Cache(CACHE_DIR)
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        # Index entry tags so a session's entries can be evicted without scanning every key
+        self.cache = Cache(cache_dir, tag_index=True)
+        self.sessions = SessionIndex(os.path.join(cache_dir, SESSION_INDEX_FILE))
+        # Responses are stored compressed, with metadata, as raw bytes (no pickling)
+        self.codec = ResponseCodec(
+            os.path.join(cache_dir, DICTIONARY_DIR),
+            codec=config_manager.get("cache_codec", "auto"),
+            level=config_manager.get("cache_compression_level", None),
+            train_samples=config_manager.get("cache_dictionary_samples", 256),
+            dict_size=config_manager.get("cache_dictionary_size", 32768),
+        )
+        self._migrate_legacy_sessions()
+        self._reference_tagged_entries()
+        self._semantic = None
+        self._semantic_lock = threading.Lock()
+        self.semantic_embedder = None  # Overrides the configured embedder when set
+        # Eviction is done here rather than by diskcache, so each policy can see generation cost
+        # and what gets evicted can be measured
+        self.cache.reset("eviction_policy", "none")
+        eviction_index_path = os.path.join(cache_dir, EVICTION_INDEX_FILE)
+        self.eviction = EvictionIndex(eviction_index_path)
+        self.eviction_policy = config_manager.get("cache_eviction_policy", "lrs")
+        self._evict_lock = threading.Lock()
+        self._stats_lock = threading.Lock()  # Guards the hit and eviction counters
+        self.evicted_entries = 0
+        self.evicted_bytes = 0
+        self.evicted_cost_seconds = 0.0
+        self.seconds_saved = 0.0
+        self._index_existing()
+        # Popular responses are also kept decoded in memory; diskcache stays the write-through second tier
+        self.hot_tier_bytes = int(config_manager.get("cache_hot_tier_mb", 64) * 1024 * 1024)
+        self.hot = HotTier(min(self.hot_tier_bytes, self.cache.size_limit))
+        self._hot_hits = Counter()
+        self.browser = CacheBrowser(self, os.path.join(cache_dir, "cache.db"), eviction_index_path)
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.conversation_lookups = 0
+        self.conversation_hits = 0
 
     def get(self, key: str):
-        return self.cache.get(key)
+        return self._lookup(key)
 
-    def set(self, key: str, value: str, expire: int = None):
-        self.cache.set(key, value, expire=expire)
+    def set(self, key: str, value: str, expire: int = None, tag: str = None, meta: dict = None):
+        """Store a response; meta (model, token count, generation time...) is kept alongside it."""
+        text = value if isinstance(value, str) else None
+        if text is not None:
+            value = self.codec.encode(text, meta)
+        self.cache.set(key, value, expire=expire, tag=tag)
+        cost_ms = (meta or {}).get("generation_ms")
+        self.eviction.add(key, len(value), cost_ms, tag=tag)
+        if text is not None:
+            self.hot.put(key, text, tag=tag, cost_ms=cost_ms, expires_at=time.time() + expire if expire else None)
+        else:
+            self.hot.remove(key)
+        self._evict()
+
+    def _lookup(self, key: str):
+        """A response from the memory tier, or from diskcache (promoting it) on a memory miss."""
+        entry = self.hot.get(key)
+        if entry is not None:
+            with self._stats_lock:
+                self.seconds_saved += entry.cost_ms / 1000
+                self._hot_hits[key] += 1
+                flush = len(self._hot_hits) >= HOT_HIT_FLUSH
+            if flush:
+                self.flush_hits()
+            return entry.text
+        value, expires_at, tag = self.cache.get(key, expire_time=True, tag=True)
+        with self._stats_lock:
+            if value is None:
+                self.l2_misses += 1
+            else:
+                self.l2_hits += 1
+        if value is None:
+            return None
+        text = self._text(value)
+        cost_ms = self._record_hit(key)
+        if isinstance(text, str):
+            self.hot.put(key, text, tag=tag, cost_ms=cost_ms, expires_at=expires_at)
+        return text
+
+    def flush_hits(self):
+        """Apply buffered memory-tier hits to the eviction index, so access counts are current."""
+        with self._stats_lock:
+            hits, self._hot_hits = self._hot_hits, Counter()
+        if hits:
+            self.eviction.touch_many(hits)
+
+    def get_entry(self, key: str):
+        """The stored entry with its metadata; the text is only decompressed when read."""
+        value = self.cache.get(key)
+        return self.codec.decode(value) if is_encoded(value) else None
+
+    def _text(self, value):
+        # Entries written before compression are plain strings
+        return self.codec.decode(value).text if is_encoded(value) else value
+
+    def train_dictionary(self, limit: int = 1000) -> int:
+        """Retrain the compression dictionary from responses already in the cache."""
+        samples = []
+        for key in self.cache.iterkeys():
+            text = self._text(self.cache.get(key))
+            if isinstance(text, str):
+                samples.append(text.encode("utf-8"))
+                if len(samples) >= limit:
+                    break
+        return self.codec.train(samples)
+
+    def get_conversation(self, key: str):
+        """Look up the response for a conversation by its key (see cache_keys), counting hits."""
+        response = self._lookup(key)
+        with self._stats_lock:
+            self.conversation_lookups += 1
+            if response is not None:
+                self.conversation_hits += 1
+        return response
+
+    def _record_hit(self, key: str):
+        cost_ms = self.eviction.touch(key)
+        if cost_ms is not None:
+            with self._stats_lock:
+                self.seconds_saved += cost_ms / 1000
+        return cost_ms
+
+    def _evict(self):
+        """Evict entries in policy order until the stored responses fit in size_limit."""
+        if self.eviction.total_bytes <= self.cache.size_limit:
+            return
+        # Recency and frequency from memory-tier hits count when picking victims
+        self.flush_hits()
+        with self._evict_lock:
+            while self.eviction.total_bytes > self.cache.size_limit:
+                victims = self.eviction.victims(self.eviction_policy, EVICTION_BATCH)
+                if not victims:
+                    break
+                for key, size, cost_ms, priority in victims:
+                    if self.eviction.total_bytes <= self.cache.size_limit:
+                        break
+                    # Entries can also go through expiry or a session purge; only count real evictions
+                    if self.cache.delete(key):
+                        with self._stats_lock:
+                            self.evicted_entries += 1
+                            self.evicted_bytes += size
+                            self.evicted_cost_seconds += cost_ms / 1000
+                    self.eviction.remove([key])
+                    self.hot.remove(key)
+                    if self.eviction_policy == "greedy-dual":
+                        self.eviction.set_inflation(priority)
+
+    def set_eviction_policy(self, policy: str):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.eviction_policy = policy
+        self._evict()
+
+    def eviction_stats(self):
+        self.flush_hits()
+        with self._stats_lock:
+            evicted = (self.evicted_entries, self.evicted_bytes, self.evicted_cost_seconds, self.seconds_saved)
+        return {
+            "policy": self.eviction_policy,
+            "indexed_entries": self.eviction.count(),
+            "indexed_bytes": self.eviction.total_bytes,
+            "evicted_entries": evicted[0],
+            "evicted_bytes": evicted[1],
+            "evicted_generation_seconds": round(evicted[2], 3),
+            "estimated_seconds_saved": round(evicted[3], 3),
+            "inflation": round(self.eviction.inflation, 6)
+        }
+
+    def _index_existing(self):
+        """Index entries written before the eviction index existed, from their stored metadata."""
+        if self.eviction.count() or not len(self.cache):
+            return
+        indexed = 0
+        for key in self.cache.iterkeys():
+            value = self.cache.get(key)
+            if isinstance(value, str):
+                value = value.encode("utf-8")
+            if not isinstance(value, bytes):
+                continue
+            meta = self.codec.decode(value).meta if is_encoded(value) else {}
+            self.eviction.add(key, len(value), meta.get("generation_ms"), stored_at=meta.get("created_at"))
+            indexed += 1
+        print(f"Indexed {indexed} existing cache entries for eviction")
 
     def clear(self):
         self.cache.clear()
+        self.hot.clear()
+        with self._stats_lock:
+            self._hot_hits.clear()
+        self.eviction.clear()
+        self.sessions.clear()
+        if self._semantic is not None:
+            self._semantic.clear()
+
+    @property
+    def semantic(self):
+        """The semantic tier, built on first use while it is enabled in config."""
+        if not config_manager.get("semantic_cache_enabled", False):
+            return None
+        with self._semantic_lock:
+            if self._semantic is None:
+                self._semantic = SemanticCache(
+                    self.semantic_embedder or self._make_embedder(),
+                    os.path.join(self.cache_dir, SEMANTIC_INDEX_FILE),
+                    threshold=config_manager.get("semantic_cache_threshold", 0.92),
+                    max_entries=config_manager.get("semantic_cache_max_entries", 50000),
+                )
+            self._semantic.threshold = config_manager.get("semantic_cache_threshold", 0.92)
+            return self._semantic
+
+    def _make_embedder(self):
+        embedder = config_manager.get("semantic_cache_embedder", "hashing")
+        if embedder == "hashing":
+            return HashingEmbedder()
+        from backend.model_service import MODEL_DIR
+        return LlamaEmbedder(os.path.join(MODEL_DIR, embedder))
+
+    def use_embedder(self, embedder):
+        """Plug in any object with an embed(text) method; the index is rebuilt from scratch."""
+        with self._semantic_lock:
+            self.semantic_embedder = embedder
+            if self._semantic is not None:
+                self._semantic.clear()
+                self._semantic = None
+
+    def get_similar(self, prompt: str, namespace: str):
+        """Serve a cached response for a prompt close enough to one answered before."""
+        semantic = self.semantic
+        if semantic is None:
+            return None
+        key, _ = semantic.lookup(prompt, namespace)
+        if key is None:
+            return None
+        value = self._lookup(key)
+        if value is None:
+            # The response was evicted from the exact tier; stop pointing at it
+            semantic.discard(key)
+        return value
+
+    def set_similar(self, prompt: str, namespace: str, key: str):
+        semantic = self.semantic
+        if semantic is not None:
+            semantic.add(prompt, namespace, key)
+
+    def flush(self):
+        if self._semantic is not None:
+            self._semantic.save()
 
     def stats(self):
         # diskcache doesn't have a direct 'hit_rate' metric built-in easily without tracking,
         # but we can return size and volume.
         try:
-            cached_sessions_count = len(self.get_cached_sessions())
+            cached_sessions_count = self.sessions.count()
         except Exception:
             cached_sessions_count = 0
         
@@ -41,77 +298,156 @@ class CacheManager:
         except Exception:
             size_limit = 1073741824  # Default 1GB
         
+        semantic = self.semantic
+        with self._stats_lock:
+            conversation = {"lookups": self.conversation_lookups, "hits": self.conversation_hits}
+            l2 = {"hits": self.l2_hits, "misses": self.l2_misses}
         return {
             "size_bytes": size_bytes,
             "count": count,
             "size_limit": size_limit,
-            "cached_sessions": cached_sessions_count
+            "cached_sessions": cached_sessions_count,
+            "conversation": conversation,
+            "semantic": semantic.stats() if semantic else None,
+            "l1": self.hot.stats(),
+            "l2": l2,
+            "compression": self.codec.stats(),
+            "eviction": self.eviction_stats()
         }
 
     def get_size_limit(self):
         return self.cache.size_limit
 
     def set_size_limit(self, size_bytes: int):
-        self.cache.size_limit = size_bytes
+        self.cache.reset("size_limit", size_bytes)
+        self._evict()
+        self.hot.resize(min(self.hot_tier_bytes, size_bytes))
+
+    def set_hot_tier_size(self, size_bytes: int):
+        self.hot_tier_bytes = size_bytes
+        self.hot.resize(min(size_bytes, self.cache.size_limit))
 
-    def track_session_cache(self, session_id: str):
-        """Track when a session uses cache by updating its last access time."""
-        session_tracking = self.cache.get(SESSION_TRACKING_KEY, {})
-        session_tracking[session_id] = time.time()
-        self.cache.set(SESSION_TRACKING_KEY, session_tracking)
+    def track_session_cache(self, session_id: str, key: str = None):
+        """Track when a session uses cache by updating its last access time; key is the entry it used."""
+        self.sessions.touch(session_id, key=key)
 
     def get_cached_sessions(self):
         """Get list of sessions with cached data, sorted by last access time."""
         try:
-            session_tracking = self.cache.get(SESSION_TRACKING_KEY, {})
-            if not isinstance(session_tracking, dict):
-                return []
-            # Sort by timestamp (oldest first)
-            return sorted(session_tracking.items(), key=lambda x: x[1])
+            return self.sessions.oldest()
         except Exception:
             return []
 
     def cleanup_old_sessions(self, max_sessions: int = 10):
         """Remove cache from oldest sessions if limit is exceeded."""
-        sessions = self.get_cached_sessions()
-        if len(sessions) > max_sessions:
-            # Delete oldest sessions
-            sessions_to_delete = sessions[:len(sessions) - max_sessions]
-            for session_id, _ in sessions_to_delete:
-                self.clear_session_cache(session_id)
+        for session_id in self.sessions.beyond_newest(max_sessions):
+            self.clear_session_cache(session_id)
 
     def clear_session_cache(self, session_id: str):
-        """Delete all cache entries for a specific session."""
+        """Drop a session's claim on its cache entries, deleting those no other session uses."""
         try:
-            # Find all keys that start with session_id
-            keys_to_delete = []
-            for key in self.cache:
-                try:
-                    # Handle both string and byte keys
-                    if isinstance(key, bytes):
-                        key_str = key.decode('utf-8', errors='ignore')
-                    elif isinstance(key, str):
-                        key_str = key
-                    else:
-                        continue
-                    
-                    if key_str.startswith(f"{session_id}:"):
-                        keys_to_delete.append(key)
-                except Exception:
-                    continue
-            
-            for key in keys_to_delete:
-                try:
-                    del self.cache[key]
-                except Exception:
-                    pass
-            
-            # Remove from session tracking
-            session_tracking = self.cache.get(SESSION_TRACKING_KEY, {})
-            if session_id in session_tracking:
-                del session_tracking[session_id]
-                self.cache.set(SESSION_TRACKING_KEY, session_tracking)
+            # Entries are shared across sessions, so only the ones this session alone referenced go
+            orphaned = self.sessions.remove(session_id)
+            for key in orphaned:
+                self.cache.delete(key)
+                self.hot.remove(key)
+            self.eviction.remove(orphaned)
         except Exception:
             pass
 
+    def _reference_tagged_entries(self):
+        """Entries stored before sessions held references are claimed by the session they are tagged with."""
+        if not self.sessions.created or not len(self.cache):
+            return
+        for key in self.cache.iterkeys():
+            _, tag = self.cache.get(key, tag=True)
+            if isinstance(tag, str):
+                self.sessions.touch(tag, key=key)
+
+    def _migrate_legacy_sessions(self):
+        """Move the old pickled tracking dict and session-prefixed keys onto the session index and tags."""
+        session_tracking = self.cache.get(SESSION_TRACKING_KEY)
+        if not isinstance(session_tracking, dict):
+            return
+        for session_id, last_access in session_tracking.items():
+            self.sessions.touch(session_id, last_access)
+        prefixes = tuple(f"{session_id}:" for session_id in session_tracking)
+        for key in list(self.cache):
+            if isinstance(key, str) and key.startswith(prefixes):
+                value = self.cache.get(key)
+                if value is not None:
+                    self.cache.set(key, value, tag=key.split(":", 1)[0])
+        self.cache.delete(SESSION_TRACKING_KEY)
+
+class SessionIndex:
+    """
+    Side table of sessions with cached entries, ordered by last access, and of
+    which entries each session has used. Responses are shared across sessions,
+    so an entry is only deleted with a session once no other session uses it.
+    """
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cached_sessions (session_id TEXT PRIMARY KEY, last_access REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cached_sessions_last_access ON cached_sessions (last_access)")
+        self.created = self._conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'session_entries'"
+        ).fetchone()[0] == 0
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_entries (session_id TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (session_id, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_session_entries_key ON session_entries (key)")
+
+    def touch(self, session_id: str, last_access: float = None, key: str = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO cached_sessions (session_id, last_access) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_access = excluded.last_access",
+                (session_id, last_access or time.time()),
+            )
+            if key is not None:
+                self._conn.execute("INSERT OR IGNORE INTO session_entries (session_id, key) VALUES (?, ?)", (session_id, key))
+
+    def remove(self, session_id: str) -> list:
+        """Forget a session; returns the keys of entries no other session references."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                rows = self._conn.execute(
+                    "SELECT key FROM session_entries s WHERE session_id = ? AND NOT EXISTS "
+                    "(SELECT 1 FROM session_entries o WHERE o.key = s.key AND o.session_id != s.session_id)",
+                    (session_id,),
+                ).fetchall()
+                self._conn.execute("DELETE FROM session_entries WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM cached_sessions WHERE session_id = ?", (session_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [row[0] for row in rows]
+
+    def oldest(self):
+        with self._lock:
+            return self._conn.execute("SELECT session_id, last_access FROM cached_sessions ORDER BY last_access ASC").fetchall()
+
+    def beyond_newest(self, keep: int):
+        """Sessions older than the keep most recently used ones."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id FROM cached_sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?", (keep,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cached_sessions").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cached_sessions")
+            self._conn.execute("DELETE FROM session_entries")
+
 cache_manager = CacheManager()
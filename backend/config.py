@@ -9,10 +9,46 @@ class ConfigManager:
             "max_prompts": 20,
             "max_cached_sessions": 10,
             "safety_enabled": True,
+            "safety_lexicon_paths": [],
+            "safety_reload_interval_s": 5.0,
+            "safety_output_action": "redact",
+            "safety_output_window": 48,
+            "stream_flush_ms": 20,
+            "stream_flush_bytes": 64,
             "default_temperature": 0.7,
             "default_top_p": 0.9,
             "default_max_tokens": 2048,
-            "system_prompt": "You are a helpful AI assistant."
+            "system_prompt": "You are a helpful AI assistant.",
+            "session_state_memory_mb": 512,
+            "session_state_disk_mb": 2048,
+            "model_pool_budget_mb": 4096,
+            "max_concurrent_inferences": 1,
+            "max_queued_inferences": 32,
+            "model_backend": "llama",
+            "inference_workers": 0,
+            "inference_worker_threads": None,
+            "inference_worker_max_inflight": 1,
+            "semantic_cache_enabled": False,
+            "semantic_cache_threshold": 0.92,
+            "semantic_cache_embedder": "hashing",
+            "semantic_cache_max_entries": 50000,
+            "cache_codec": "auto",
+            "cache_eviction_policy": "lrs",
+            "cache_hot_tier_mb": 64,
+            "cache_compression_level": None,
+            "cache_dictionary_samples": 256,
+            "cache_dictionary_size": 32768,
+            "message_durability": "batched",
+            "message_flush_count": 64,
+            "message_flush_interval_ms": 50,
+            "context_reserve_tokens": 512,
+            "context_summary_enabled": False,
+            "context_summary_max_tokens": 160,
+            "speculative_models": {},
+            "runtime_profiles": {},
+            "tracing_enabled": True,
+            "trace_buffer_size": 500,
+            "trace_jsonl_path": None
         }
         self.load_config()
 
@@ -0,0 +1,151 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+# Chat templates wrap every message in role markers; budget a few tokens for them
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below in a few sentences, keeping names, facts, "
+    "decisions and open questions. Reply with the summary only.\n\n{conversation}"
+)
+
+class TokenCounter:
+    """LRU cache of per-message token counts, so each message is tokenized once per model."""
+
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = max_entries
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, llm, model_path: str, text: str) -> int:
+        key = (model_path, hashlib.sha1(text.encode("utf-8")).hexdigest())
+        with self._lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return self._counts[key]
+        tokens = len(llm.tokenize(text.encode("utf-8"), add_bos=False))
+        with self._lock:
+            self.misses += 1
+            self._counts[key] = tokens
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._counts), "hits": self.hits, "misses": self.misses}
+
+class ContextBuilder:
+    """
+    Fits a conversation into the model's context window.
+
+    The system prompt and the latest message are always kept; earlier turns are
+    added newest first while they fit in the budget (n_ctx minus room for the
+    reply). History is dropped a whole exchange at a time, so the prompt never
+    opens with a reply whose question is gone. Turns that fall out of the window
+    can be folded into a rolling summary, updated incrementally per session as
+    more turns drop off.
+    """
+
+    def __init__(self, counter: TokenCounter = None):
+        self.counter = counter or TokenCounter()
+        self._summaries = {}  # (model_path, session_id) -> (turns summarized, summary)
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.trimmed_builds = 0
+        self.turns_dropped = 0
+
+    def build(self, llm, model_path: str, messages: list, max_tokens: int, reserve_tokens: int = 512,
+              session_id: Optional[str] = None, summarize: Optional[Callable[[str], str]] = None) -> list:
+        def cost(message):
+            return self.counter.count(llm, model_path, message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+        n_ctx = llm.n_ctx()
+        budget = n_ctx - min(max_tokens or reserve_tokens, reserve_tokens)
+        system = [m for m in messages[:1] if m.get("role") == "system"]
+        turns = messages[len(system):]
+        with self._lock:
+            self.builds += 1
+        if not turns:
+            return list(messages)
+
+        used = sum(cost(m) for m in system) + cost(turns[-1])
+        start = len(turns) - 1
+        while start > 0:
+            needed = cost(turns[start - 1])
+            if used + needed > budget:
+                break
+            used += needed
+            start -= 1
+        if start == 0:
+            return list(messages)
+        # A reply goes with the question it answers
+        while start < len(turns) - 1 and turns[start].get("role") == "assistant":
+            used -= cost(turns[start])
+            start += 1
+
+        with self._lock:
+            self.trimmed_builds += 1
+            self.turns_dropped += start
+        kept = turns[start:]
+        if summarize and session_id:
+            summary = self._summary(model_path, session_id, turns[:start], summarize)
+            if summary:
+                note = {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
+                # Make room for the summary by dropping the oldest kept turns if needed
+                used += cost(note)
+                while used > budget and len(kept) > 1:
+                    used -= cost(kept[0])
+                    kept = kept[1:]
+                    while len(kept) > 1 and kept[0].get("role") == "assistant":
+                        used -= cost(kept[0])
+                        kept = kept[1:]
+                return system + [note] + kept
+        return system + kept
+
+    def prompt_tokens(self, llm, model_path: str, messages: list) -> int:
+        """Approximate prompt size in tokens, from the cached per-message counts."""
+        return sum(self.counter.count(llm, model_path, m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+    def _summary(self, model_path: str, session_id: str, dropped: list, summarize: Callable[[str], str]) -> str:
+        key = (model_path, session_id)
+        with self._lock:
+            covered, summary = self._summaries.get(key, (0, ""))
+        if covered > len(dropped):
+            # The conversation was edited or restarted; summarize from scratch
+            covered, summary = 0, ""
+        if covered == len(dropped):
+            return summary
+        new_turns = "\n".join(f"{m['role']}: {m['content']}" for m in dropped[covered:])
+        conversation = f"Earlier summary: {summary}\n{new_turns}" if summary else new_turns
+        try:
+            summary = summarize(SUMMARY_PROMPT.format(conversation=conversation)).strip()
+        except Exception as e:
+            print(f"Error summarizing context: {e}")
+            return summary
+        with self._lock:
+            self._summaries[key] = (len(dropped), summary)
+        return summary
+
+    def forget(self, session_id: str = None, model_path: str = None):
+        with self._lock:
+            for key in list(self._summaries):
+                if (session_id is None or key[1] == session_id) and (model_path is None or key[0] == model_path):
+                    del self._summaries[key]
+
+    def stats(self):
+        with self._lock:
+            summaries = len(self._summaries)
+            builds, trimmed_builds, turns_dropped = self.builds, self.trimmed_builds, self.turns_dropped
+        return {
+            "builds": builds,
+            "trimmed_builds": trimmed_builds,
+            "turns_dropped": turns_dropped,
+            "summaries": summaries,
+            "token_counts": self.counter.stats(),
+        }
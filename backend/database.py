@@ -1,100 +1,360 @@
 import sqlite3
 import uuid
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 import os
+from backend.config import config_manager
+from backend.write_behind import WriteBehindQueue
 
 DB_PATH = "backend/db/chat.db"
 
+# Applied at connection time; WAL lets readers proceed while a writer commits
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+]
+
+# Schema migrations, applied in order and tracked through PRAGMA user_version
+MIGRATIONS = [
+    # 1: base schema
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES sessions (id) ON DELETE CASCADE
+        )
+        ''',
+    ],
+    # 2: serve history reads and session listing from indexes instead of table scans
+    [
+        "CREATE INDEX IF NOT EXISTS idx_messages_session_created ON messages (session_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_created ON sessions (created_at)",
+    ],
+    # 3: per-message token estimates and denormalized per-session counters, backfilled from history
+    [
+        "ALTER TABLE messages ADD COLUMN token_count INTEGER NOT NULL DEFAULT 0",
+        "UPDATE messages SET token_count = (length(content) + 3) / 4",
+        '''
+        CREATE TABLE IF NOT EXISTS session_stats (
+            session_id TEXT PRIMARY KEY,
+            user_messages INTEGER NOT NULL DEFAULT 0,
+            assistant_messages INTEGER NOT NULL DEFAULT 0,
+            user_tokens INTEGER NOT NULL DEFAULT 0,
+            assistant_tokens INTEGER NOT NULL DEFAULT 0,
+            last_activity TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES sessions (id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        INSERT OR REPLACE INTO session_stats
+        SELECT session_id,
+               SUM(role = 'user'), SUM(role = 'assistant'),
+               SUM(CASE WHEN role = 'user' THEN token_count ELSE 0 END),
+               SUM(CASE WHEN role = 'assistant' THEN token_count ELSE 0 END),
+               MAX(created_at)
+        FROM messages GROUP BY session_id
+        ''',
+    ],
+]
+
+STATS_FIELDS = ("user_messages", "assistant_messages", "user_tokens", "assistant_tokens")
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token) used for counters and budgets."""
+    return (len(text) + 3) // 4
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections shared across threads."""
+
+    def __init__(self, db_path: str, size: int = 8):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            conn = self._connect() if can_create else self._idle.get()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None or _pool.db_path != DB_PATH:
+        with _pool_lock:
+            if _pool is None or _pool.db_path != DB_PATH:
+                os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+                if _pool is not None:
+                    _pool.close()
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
 def get_db_connection():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_pool().connection()
 
 def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Create sessions table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS sessions (
-        id TEXT PRIMARY KEY,
-        title TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create messages table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS messages (
-        id TEXT PRIMARY KEY,
-        session_id TEXT NOT NULL,
-        role TEXT NOT NULL,
-        content TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (session_id) REFERENCES sessions (id) ON DELETE CASCADE
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            with conn:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {number}")
+            print(f"Applied database migration {number}")
 
 def create_session(title="New Chat"):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     session_id = str(uuid.uuid4())
-    cursor.execute('INSERT INTO sessions (id, title) VALUES (?, ?)', (session_id, title))
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        conn.execute('INSERT INTO sessions (id, title) VALUES (?, ?)', (session_id, title))
+        conn.commit()
     return {"id": session_id, "title": title, "created_at": datetime.now().isoformat()}
 
-def get_sessions():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM sessions ORDER BY created_at DESC')
-    sessions = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return sessions
+SESSION_COLUMNS = '''
+    SELECT s.*,
+           COALESCE(st.user_messages, 0) + COALESCE(st.assistant_messages, 0) AS message_count,
+           st.last_activity
+    FROM sessions s LEFT JOIN session_stats st ON st.session_id = s.id
+'''
+
+def get_sessions(before=None, limit=None):
+    """
+    Sessions newest first. With limit, one keyset page; pass the id of the last
+    session on a page as before for the next one. Raises LookupError for an unknown cursor.
+    """
+    with get_db_connection() as conn:
+        if before is None and limit is None:
+            rows = conn.execute(SESSION_COLUMNS + 'ORDER BY s.created_at DESC, s.rowid DESC').fetchall()
+            return [dict(row) for row in rows]
+        limit = limit or 50
+        if before is None:
+            rows = conn.execute(SESSION_COLUMNS + 'ORDER BY s.created_at DESC, s.rowid DESC LIMIT ?', (limit,)).fetchall()
+        else:
+            anchor = conn.execute('SELECT created_at, rowid FROM sessions WHERE id = ?', (before,)).fetchone()
+            if anchor is None:
+                raise LookupError(f"Session {before} not found")
+            rows = conn.execute(SESSION_COLUMNS + 'WHERE (s.created_at, s.rowid) < (?, ?) '
+                                'ORDER BY s.created_at DESC, s.rowid DESC LIMIT ?',
+                                (anchor[0], anchor[1], limit)).fetchall()
+    return [dict(row) for row in rows]
+
+def get_session_stats(session_id):
+    """Counters for one session, including messages still waiting in the write-behind queue."""
+    pending = message_writer.pending(lambda m: m["session_id"] == session_id)
+    with get_db_connection() as conn:
+        row = conn.execute('SELECT * FROM session_stats WHERE session_id = ?', (session_id,)).fetchone()
+        stats = dict(row) if row else {"session_id": session_id, **{field: 0 for field in STATS_FIELDS}, "last_activity": None}
+        pending = _unflushed(conn, pending)
+    for m in pending:
+        if m["role"] in ("user", "assistant"):
+            stats[f'{m["role"]}_messages'] += 1
+            stats[f'{m["role"]}_tokens'] += m["token_count"]
+        stats["last_activity"] = max(stats["last_activity"] or "", m["created_at"])
+    return stats
+
+def get_stats_totals():
+    """Aggregate counters across all sessions, read from session_stats rather than messages."""
+    with get_db_connection() as conn:
+        row = conn.execute('''
+            SELECT (SELECT COUNT(*) FROM sessions) AS sessions,
+                   COALESCE(SUM(user_messages), 0) AS user_messages,
+                   COALESCE(SUM(assistant_messages), 0) AS assistant_messages,
+                   COALESCE(SUM(user_tokens), 0) AS user_tokens,
+                   COALESCE(SUM(assistant_tokens), 0) AS assistant_tokens,
+                   MAX(last_activity) AS last_activity
+            FROM session_stats
+        ''').fetchone()
+    return dict(row)
 
 def delete_session(session_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    # Delete messages first (though CASCADE should handle this)
-    cursor.execute('DELETE FROM messages WHERE session_id = ?', (session_id,))
-    messages_deleted = cursor.rowcount
-    # Delete the session
-    cursor.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
-    sessions_deleted = cursor.rowcount
-    conn.commit()
-    conn.close()
+    # Make sure no buffered message for this session lands after the delete
+    message_writer.flush()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # Delete messages first (though CASCADE should handle this)
+        cursor.execute('DELETE FROM messages WHERE session_id = ?', (session_id,))
+        messages_deleted = cursor.rowcount
+        cursor.execute('DELETE FROM session_stats WHERE session_id = ?', (session_id,))
+        # Delete the session
+        cursor.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+        sessions_deleted = cursor.rowcount
+        conn.commit()
     print(f"Deleted session {session_id}: {sessions_deleted} session(s), {messages_deleted} message(s)")
     return {"sessions_deleted": sessions_deleted, "messages_deleted": messages_deleted}
 
 def update_session_title(session_id, title):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE sessions SET title = ? WHERE id = ?', (title, session_id))
-    conn.commit()
-    # Fetch the updated session to return all fields
-    cursor.execute('SELECT * FROM sessions WHERE id = ?', (session_id,))
-    session = cursor.fetchone()
-    conn.close()
+    with get_db_connection() as conn:
+        conn.execute('UPDATE sessions SET title = ? WHERE id = ?', (title, session_id))
+        conn.commit()
+        # Fetch the updated session to return all fields
+        session = conn.execute('SELECT * FROM sessions WHERE id = ?', (session_id,)).fetchone()
     return dict(session) if session else {"id": session_id, "title": title}
 
+def _insert_messages(rows):
+    """Insert a batch of messages and bump their sessions' counters in a single transaction."""
+    deltas = {}
+    for m in rows:
+        delta = deltas.setdefault(m["session_id"], {field: 0 for field in STATS_FIELDS})
+        if m["role"] in ("user", "assistant"):
+            delta[f'{m["role"]}_messages'] += 1
+            delta[f'{m["role"]}_tokens'] += m["token_count"]
+        delta["last_activity"] = m["created_at"]
+    with get_db_connection() as conn:
+        conn.executemany('INSERT INTO messages (id, session_id, role, content, created_at, token_count) VALUES (?, ?, ?, ?, ?, ?)',
+                         [(m["id"], m["session_id"], m["role"], m["content"], m["created_at"], m["token_count"]) for m in rows])
+        conn.executemany('''
+            INSERT INTO session_stats (session_id, user_messages, assistant_messages, user_tokens, assistant_tokens, last_activity)
+            VALUES (:session_id, :user_messages, :assistant_messages, :user_tokens, :assistant_tokens, :last_activity)
+            ON CONFLICT(session_id) DO UPDATE SET
+                user_messages = user_messages + excluded.user_messages,
+                assistant_messages = assistant_messages + excluded.assistant_messages,
+                user_tokens = user_tokens + excluded.user_tokens,
+                assistant_tokens = assistant_tokens + excluded.assistant_tokens,
+                last_activity = MAX(COALESCE(last_activity, ''), excluded.last_activity)
+        ''', [{"session_id": session_id, **delta} for session_id, delta in deltas.items()])
+        conn.commit()
+
+# Messages from every session are group-committed by a background writer
+message_writer = WriteBehindQueue(
+    _insert_messages,
+    flush_count=config_manager.get("message_flush_count", 64),
+    flush_interval=config_manager.get("message_flush_interval_ms", 50) / 1000,
+    durability=config_manager.get("message_durability", "batched"),
+)
+
 def add_message(session_id, role, content):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    message_id = str(uuid.uuid4())
-    cursor.execute('INSERT INTO messages (id, session_id, role, content) VALUES (?, ?, ?, ?)', 
-                   (message_id, session_id, role, content))
-    conn.commit()
-    conn.close()
-    return {"id": message_id, "session_id": session_id, "role": role, "content": content, "created_at": datetime.now().isoformat()}
+    message = {
+        "id": str(uuid.uuid4()),
+        "session_id": session_id,
+        "role": role,
+        "content": content,
+        "token_count": estimate_tokens(content),
+        # Stamped at enqueue time, in the same format as CURRENT_TIMESTAMP, so batching keeps message order
+        "created_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    message_writer.add(message)
+    return dict(message)
+
+def _unflushed(conn, pending):
+    """Drop pending rows committed between the queue snapshot and this read."""
+    if not pending:
+        return pending
+    ids = [m["id"] for m in pending]
+    stored = {row[0] for row in conn.execute(
+        f'SELECT id FROM messages WHERE id IN ({",".join("?" * len(ids))})', ids)}
+    return [dict(m) for m in pending if m["id"] not in stored]
+
+def get_messages_page(session_id, before=None, after=None, limit=50):
+    """
+    One page of a session's history in chronological order, keyed on message ids.
+    With no cursor the newest page is returned; before/after page backwards/forwards
+    from the given message. Raises LookupError for an unknown cursor.
+    """
+    if before and after:
+        raise ValueError("Pass either before or after, not both")
+    pending = message_writer.pending(lambda m: m["session_id"] == session_id)
+    cursor_id = before or after
+    with get_db_connection() as conn:
+        pending = _unflushed(conn, pending)
+        # Queued rows are always newer than committed ones, so they extend the end of the timeline
+        pending_ids = [m["id"] for m in pending]
+        anchor = None
+        if cursor_id and cursor_id not in pending_ids:
+            anchor = conn.execute('SELECT created_at, rowid FROM messages WHERE id = ? AND session_id = ?',
+                                  (cursor_id, session_id)).fetchone()
+            if anchor is None:
+                raise LookupError(f"Message {cursor_id} not found in session {session_id}")
+
+        if after:
+            if anchor is None:
+                return pending[pending_ids.index(after) + 1:][:limit]
+            rows = conn.execute('SELECT * FROM messages WHERE session_id = ? AND (created_at, rowid) > (?, ?) '
+                                'ORDER BY created_at ASC, rowid ASC LIMIT ?',
+                                (session_id, anchor[0], anchor[1], limit)).fetchall()
+            return ([dict(row) for row in rows] + pending)[:limit]
+
+        if before and anchor is None:
+            newer = pending[:pending_ids.index(before)]
+        elif before:
+            newer = []
+        else:
+            newer = pending
+        newer = newer[-limit:]
+        remaining = limit - len(newer)
+        rows = []
+        if remaining:
+            if anchor is None:
+                rows = conn.execute('SELECT * FROM messages WHERE session_id = ? '
+                                    'ORDER BY created_at DESC, rowid DESC LIMIT ?', (session_id, remaining)).fetchall()
+            else:
+                rows = conn.execute('SELECT * FROM messages WHERE session_id = ? AND (created_at, rowid) < (?, ?) '
+                                    'ORDER BY created_at DESC, rowid DESC LIMIT ?',
+                                    (session_id, anchor[0], anchor[1], remaining)).fetchall()
+    return [dict(row) for row in reversed(rows)] + newer
+
+def get_first_messages(session_id, limit=50):
+    """The oldest page of a session's history, the starting point for paging forwards."""
+    pending = message_writer.pending(lambda m: m["session_id"] == session_id)
+    with get_db_connection() as conn:
+        pending = _unflushed(conn, pending)
+        rows = conn.execute('SELECT * FROM messages WHERE session_id = ? ORDER BY created_at ASC, rowid ASC LIMIT ?',
+                            (session_id, limit)).fetchall()
+    return ([dict(row) for row in rows] + pending)[:limit]
 
 def get_messages(session_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM messages WHERE session_id = ? ORDER BY created_at ASC', (session_id,))
-    messages = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    # Snapshot unflushed rows first: anything committed meanwhile shows up in the query instead
+    pending = message_writer.pending(lambda m: m["session_id"] == session_id)
+    with get_db_connection() as conn:
+        # rowid breaks ties between messages written within the same second
+        rows = conn.execute('SELECT * FROM messages WHERE session_id = ? ORDER BY created_at ASC, rowid ASC', (session_id,)).fetchall()
+    messages = [dict(row) for row in rows]
+    stored_ids = {m["id"] for m in messages}
+    messages.extend(dict(m) for m in pending if m["id"] not in stored_ids)
     return messages
@@ -0,0 +1,153 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+class HotEntry(NamedTuple):
+    text: str
+    size: int
+    tag: Optional[str]
+    cost_ms: float
+    expires_at: Optional[float]
+
+class FrequencySketch:
+    """
+    Count-min sketch of recent key frequencies. Counts are halved once enough
+    increments have been seen, so popularity reflects recent traffic.
+    """
+
+    def __init__(self, width: int = 4096, depth: int = 4, sample_size: int = 40960):
+        self.width = width
+        self.depth = depth
+        self.sample_size = sample_size
+        self._rows = [[0] * width for _ in range(depth)]
+        self._additions = 0
+
+    def _slots(self, key: str):
+        return [hash((row, key)) % self.width for row in range(self.depth)]
+
+    def add(self, key: str):
+        for row, slot in zip(self._rows, self._slots(key)):
+            row[slot] += 1
+        self._additions += 1
+        if self._additions >= self.sample_size:
+            for row in self._rows:
+                for i, count in enumerate(row):
+                    row[i] = count >> 1
+            self._additions //= 2
+
+    def estimate(self, key: str) -> int:
+        return min(row[slot] for row, slot in zip(self._rows, self._slots(key)))
+
+class HotTier:
+    """
+    In-memory LRU of decoded responses, bounded in bytes, with TinyLFU admission:
+    when room has to be made, a newcomer only gets in if it has been asked for
+    more often recently than the entry it would push out. One-off responses
+    therefore do not flush the popular ones.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tags = {}  # tag -> keys, for session invalidation
+        self._sketch = FrequencySketch()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[HotEntry]:
+        with self._lock:
+            self._sketch.add(key)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= time.time():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, text: str, tag: str = None, cost_ms: float = 0.0, expires_at: float = None) -> bool:
+        size = len(text.encode("utf-8"))
+        entry = HotEntry(text, size, tag, cost_ms or 0.0, expires_at)
+        with self._lock:
+            # Any older copy goes even if the new one is not admitted
+            self._drop(key)
+            if size > self.max_bytes:
+                return False
+            # Make room, unless the newcomer is less popular than what it would displace
+            frequency = self._sketch.estimate(key)
+            victims, freed = [], 0
+            for victim, victim_entry in self._entries.items():
+                if self.size_bytes - freed + size <= self.max_bytes:
+                    break
+                if self._sketch.estimate(victim) > frequency:
+                    self.rejected += 1
+                    return False
+                victims.append(victim)
+                freed += victim_entry.size
+            for victim in victims:
+                self._drop(victim)
+                self.evictions += 1
+            self._entries[key] = entry
+            self.size_bytes += size
+            if tag:
+                self._tags.setdefault(tag, set()).add(key)
+            self.admitted += 1
+            return True
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size_bytes -= entry.size
+        if entry.tag:
+            keys = self._tags.get(entry.tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[entry.tag]
+
+    def remove(self, key: str):
+        with self._lock:
+            self._drop(key)
+
+    def remove_tag(self, tag: str):
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._drop(key)
+
+    def resize(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            while self.size_bytes > max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self.size_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "evictions": self.evictions,
+            }
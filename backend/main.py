@@ -1,13 +1,33 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from backend.routers import chat, admin, sessions
 import uvicorn
 from pydantic import BaseModel
-import sqlite3
-import os
-from backend.database import init_db
+from backend.database import init_db, message_writer
+from backend.worker_pool import worker_pool
+from backend.cache_manager import cache_manager
+from backend.async_io import io_executor
+from backend.scheduler import inference_scheduler
+from backend.telemetry import telemetry_manager
+from contextlib import asynccontextmanager
 
-app = FastAPI(title="PocketLLM Portal")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if worker_pool.num_workers > 0:
+        worker_pool.start()
+        # Let the scheduler keep every worker busy
+        inference_scheduler.configure(max_concurrency=max(inference_scheduler.max_concurrency, worker_pool.num_workers * worker_pool.max_inflight))
+    yield
+    if worker_pool.running:
+        worker_pool.stop()
+    cache_manager.flush()
+    io_executor.shutdown(wait=True)
+    # Commit any buffered messages before exiting
+    message_writer.stop()
+
+app = FastAPI(title="PocketLLM Portal", lifespan=lifespan)
 
 # Initialize database
 init_db()
@@ -20,59 +40,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+ROUTER_PREFIXES = ("/chat", "/admin", "/sessions")
+
 app.include_router(chat.router, prefix="/chat", tags=["chat"])
 app.include_router(admin.router, prefix="/admin", tags=["admin"])
 app.include_router(sessions.router, prefix="/sessions", tags=["sessions"])
 
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    telemetry_manager.record_route(request.method, _route_template(request), response.status_code, time.perf_counter() - start)
+    return response
+
+def _route_template(request: Request) -> str:
+    # Label by route template rather than raw path so session ids don't explode the label set
+    route = request.scope.get("route")
+    if route is None:
+        return "unmatched"
+    path = route.path
+    # Depending on the FastAPI version the matched route may not carry its router's prefix
+    prefix = "/" + request.url.path.split("/")[1]
+    if prefix in ROUTER_PREFIXES and not path.startswith(prefix):
+        path = prefix + path
+    return path
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint"""
+    scheduler = inference_scheduler.stats()
+    cache = cache_manager.stats()
+    gauges = {
+        "pocketllm_inference_active": ("Inferences currently running", scheduler["running"]),
+        "pocketllm_inference_queued": ("Requests waiting for an inference slot", scheduler["queued"]),
+        "pocketllm_cache_entries": ("Entries in the response cache", cache["count"]),
+        "pocketllm_cache_size_bytes": ("Size of the response cache", cache["size_bytes"]),
+    }
+    # These only grow (until restart), so they are counters and can be rate()d
+    counters = {
+        "pocketllm_cache_evicted_entries_total": ("Response cache entries evicted", cache["eviction"]["evicted_entries"]),
+        "pocketllm_cache_evicted_bytes_total": ("Bytes of responses evicted from the cache", cache["eviction"]["evicted_bytes"]),
+        "pocketllm_cache_evicted_generation_seconds_total": ("Generation time of the evicted responses", cache["eviction"]["evicted_generation_seconds"]),
+        "pocketllm_cache_seconds_saved_total": ("Generation time saved by cache hits", cache["eviction"]["estimated_seconds_saved"]),
+    }
+    return PlainTextResponse(telemetry_manager.render_prometheus(gauges, counters), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
-@app.get("/cache")
-async def get_cache():
-    db_path = "cache/cache.db"
-    if not os.path.exists(db_path):
-        return []
-    
-    try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT key, value, store_time, access_count FROM Cache")
-        rows = cursor.fetchall()
-        conn.close()
-        
-        cache_data = []
-        for row in rows:
-            key = row[0]
-            value = row[1]
-            
-            # Handle binary keys
-            if isinstance(key, bytes):
-                try:
-                    key = key.decode('utf-8')
-                except:
-                    key = str(key)
-            
-            # Handle binary values (likely pickled)
-            if isinstance(value, bytes):
-                try:
-                    # Try to decode as utf-8 first (in case it's just a string)
-                    value = value.decode('utf-8')
-                except:
-                    # If binary/pickled, just show representation
-                    value = f"<Binary Data: {len(value)} bytes>"
-
-            cache_data.append({
-                "key": key,
-                "value": value,
-                "store_time": row[2],
-                "access_count": row[3]
-            })
-        return cache_data
-    except Exception as e:
-        print(f"Error reading cache: {e}")
-        return []
-
 @app.get("/")
 def read_root():
     return {"message": "PocketLLM Portal Backend is running"}
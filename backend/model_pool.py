@@ -0,0 +1,127 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+class ModelPool:
+    """
+    Keeps several loaded models resident up to a RAM budget.
+    The budget is checked against each GGUF's file size, which is what mmap-ed
+    weights cost; when a new model does not fit, the least recently used idle ones are evicted.
+    A model is idle when its generation lock (from generation_lock) is free; it is held
+    through the eviction, so a model is never dropped in the middle of a turn.
+    """
+
+    def __init__(self, loader: Callable[[str], object], budget_bytes: int, on_evict: Callable[[str], None] = None,
+                 generation_lock: Callable[[str], object] = None):
+        self.loader = loader
+        self.budget_bytes = budget_bytes
+        self.on_evict = on_evict
+        self.generation_lock = generation_lock
+        self._lock = threading.RLock()
+        self._models = OrderedDict()  # model_path -> (llm, size)
+        self._loading = {}  # model_path -> Event set when its load finishes
+        self._resident_bytes = 0
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, model_path: str):
+        while True:
+            with self._lock:
+                if model_path in self._models:
+                    self._models.move_to_end(model_path)
+                    self.hits += 1
+                    return self._models[model_path][0]
+                loading = self._loading.get(model_path)
+                if loading is None:
+                    # Take the loading slot; other callers for this model wait on it
+                    loading = self._loading[model_path] = threading.Event()
+                    # Stub models have no file behind them and cost nothing
+                    size = os.path.getsize(model_path) if os.path.exists(model_path) else 0
+                    # Make room before loading, so the old weights are gone first
+                    self._shrink(self.budget_bytes - size, keep=0)
+                    break
+            # Someone else is loading it; check again once they are done (or have failed)
+            loading.wait()
+
+        # Load without holding the pool lock, so models that are already resident stay available
+        try:
+            llm = self.loader(model_path)
+        except BaseException:
+            with self._lock:
+                del self._loading[model_path]
+            loading.set()
+            raise
+
+        with self._lock:
+            self._models[model_path] = (llm, size)
+            self._resident_bytes += size
+            self.loads += 1
+            del self._loading[model_path]
+            # Other models may have been loaded meanwhile; always keep the requested one,
+            # even if it alone exceeds the budget
+            self._shrink(self.budget_bytes, keep=1)
+        loading.set()
+        return llm
+
+    def peek(self, model_path: str):
+        """Return the loaded model without loading it or touching its LRU position."""
+        with self._lock:
+            entry = self._models.get(model_path)
+            return entry[0] if entry else None
+
+    def evict(self, model_path: str):
+        with self._lock:
+            if model_path in self._models:
+                self._evict(model_path)
+
+    def clear(self):
+        with self._lock:
+            for model_path in list(self._models):
+                self._evict(model_path)
+
+    def set_budget(self, budget_bytes: int):
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            # Shrink to the new budget but keep the most recently used model
+            self._shrink(self.budget_bytes, keep=1)
+
+    def loaded_models(self):
+        with self._lock:
+            return [os.path.basename(path) for path in self._models]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded_models": [os.path.basename(path) for path in self._models],
+                "resident_bytes": self._resident_bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+    def _shrink(self, target_bytes: int, keep: int):
+        """Evict least recently used idle models until target_bytes fit, leaving at least keep resident."""
+        for old_path in list(self._models):
+            if len(self._models) <= keep or self._resident_bytes <= target_bytes:
+                return
+            lock = self.generation_lock(old_path) if self.generation_lock else None
+            if lock is not None and not lock.acquire(blocking=False):
+                continue  # Generating right now; it can go on a later load once idle
+            try:
+                print(f"Evicting model from pool: {os.path.basename(old_path)}")
+                self._evict(old_path)
+            finally:
+                if lock is not None:
+                    lock.release()
+        if len(self._models) > keep and self._resident_bytes > target_bytes:
+            print("Model pool is over budget: the other resident models are busy generating")
+
+    def _evict(self, model_path: str):
+        _, size = self._models.pop(model_path)
+        self._resident_bytes -= size
+        self.evictions += 1
+        if self.on_evict:
+            self.on_evict(model_path)
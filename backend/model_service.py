@@ -1,34 +1,84 @@
 import os
-from llama_cpp import Llama
+import time
+import threading
+from collections import defaultdict
+from backend.stub_model import StubLlama
+try:
+    from llama_cpp import Llama
+except ImportError:  # Only the stub backend works without llama-cpp-python
+    Llama = None
 from typing import Generator
+from backend.config import config_manager
+from backend.session_state import SessionStateStore
+from backend.model_pool import ModelPool
+from backend.context_builder import ContextBuilder
+from backend.speculative import build_draft
+from backend.runtime_profiles import get_profile, llama_kwargs
 
 MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models")
 DEFAULT_MODEL_PATH = os.path.join(MODEL_DIR, "model.gguf")
+STUB_MODEL_PATH = os.path.join(MODEL_DIR, "stub.gguf")
 
 class ModelService:
-    def __init__(self):
-        self.llm = None
+    def __init__(self, n_threads: int = None):
         self.current_model_path = DEFAULT_MODEL_PATH
-        self.current_session_id = None  # Track current session to detect switches
+        self.n_threads = n_threads or os.cpu_count()
+        # Session whose KV state is live in each resident model, to detect switches
+        self.current_session_ids = {}
+        # A Llama context is not thread-safe, so each resident model serves one generation at a time
+        self._model_locks = defaultdict(threading.Lock)
+        self.session_states = SessionStateStore(
+            memory_budget=config_manager.get("session_state_memory_mb", 512) * 1024**2,
+            disk_budget=config_manager.get("session_state_disk_mb", 2048) * 1024**2,
+        )
+        self.pool = ModelPool(
+            self._create_llm,
+            budget_bytes=config_manager.get("model_pool_budget_mb", 4096) * 1024**2,
+            on_evict=self._on_model_evicted,
+            generation_lock=lambda model_path: self._model_locks[model_path],
+        )
+        self.context = ContextBuilder()
+        self.drafts = {}  # model_path -> speculative draft attached to the resident model
         if not os.path.exists(MODEL_DIR):
             os.makedirs(MODEL_DIR)
 
+    @property
+    def llm(self):
+        """The default model, if it is currently resident"""
+        return self.pool.peek(self.current_model_path)
+
+    @property
+    def backend(self) -> str:
+        return config_manager.get("model_backend", "llama")
+
     def list_models(self):
         if not os.path.exists(MODEL_DIR):
-            return []
-        return [f for f in os.listdir(MODEL_DIR) if f.endswith(".gguf")]
+            models = []
+        else:
+            models = [f for f in os.listdir(MODEL_DIR) if f.endswith(".gguf")]
+        if self.backend == "stub" and not models:
+            models = [os.path.basename(STUB_MODEL_PATH)]
+        return models
 
     def set_model(self, model_filename: str):
         new_path = os.path.join(MODEL_DIR, model_filename)
-        if not os.path.exists(new_path):
+        if model_filename not in self.list_models():
             raise FileNotFoundError(f"Model {model_filename} not found")
         
         self.current_model_path = new_path
-        # Reload model if it's already loaded
-        if self.llm:
-            self.load_model()
+        # Warm the new default if we are already serving; other resident models stay loaded
+        if self.pool.loaded_models():
+            self.pool.get(new_path)
+
+    def resolve_model_path(self, model_filename: str = None) -> str:
+        if model_filename:
+            if model_filename not in self.list_models():
+                raise FileNotFoundError(f"Model {model_filename} not found")
+            return os.path.join(MODEL_DIR, model_filename)
+
+        if self.backend == "stub" and not os.path.exists(self.current_model_path):
+            self.current_model_path = os.path.join(MODEL_DIR, self.list_models()[0])
 
-    def load_model(self):
         # If current path doesn't exist, try to find any .gguf file in models dir
         if not os.path.exists(self.current_model_path):
             models = self.list_models()
@@ -40,34 +90,128 @@ class ModelService:
                     self.current_model_path = DEFAULT_MODEL_PATH
                 else:
                     raise FileNotFoundError(f"No models found in {MODEL_DIR}. Please run download_model.py first.")
-        
-        # Initialize Llama model with CPU settings
-        # n_ctx=2048 is a reasonable default for small models
-        self.llm = Llama(
-            model_path=self.current_model_path,
-            n_ctx=2048,
-            n_threads=os.cpu_count(), # Use all available cores
-            verbose=True
+        return self.current_model_path
+
+    def load_model(self, model_filename: str = None):
+        """Return the requested (or default) model, loading it into the pool if needed"""
+        return self.pool.get(self.resolve_model_path(model_filename))
+
+    def _create_llm(self, model_path: str):
+        profile = get_profile(os.path.basename(model_path))
+        if self.backend == "stub":
+            return StubLlama(model_path=model_path, n_ctx=profile["n_ctx"], **config_manager.get("stub_model_options", {}))
+        if Llama is None:
+            raise RuntimeError("llama-cpp-python is not installed")
+
+        # Opt-in speculative decoding, configured per model
+        settings = self.speculative_settings(os.path.basename(model_path))
+        draft = build_draft(settings, lambda draft_filename: self._load_draft_llm(draft_filename, profile["n_ctx"]))
+        if draft is not None:
+            self.drafts[model_path] = draft
+            print(f"Speculative decoding enabled for {os.path.basename(model_path)}: {settings['mode']}")
+
+        # Context size, threads, batching, mmap/mlock and KV cache type come from the model's runtime profile;
+        # threads default to all cores, or this worker's share
+        llm = Llama(
+            model_path=model_path,
+            draft_model=draft,
+            **llama_kwargs(profile, self.n_threads)
         )
-        print(f"Model loaded successfully: {os.path.basename(self.current_model_path)}")
-
-    def reset_for_session(self, session_id: str):
-        """Reset model state when switching to a different session to prevent KV cache conflicts"""
-        if session_id != self.current_session_id:
-            print(f"[DEBUG] Session switch detected: {self.current_session_id} -> {session_id}")
-            self.current_session_id = session_id
-            # Reload the model to clear KV cache
-            if self.llm:
-                print(f"[DEBUG] Resetting model to clear KV cache for new session")
-                self.load_model()
-
-    def stream_chat(self, messages: list, temperature: float = 0.7, top_p: float = 0.9, max_tokens: int = 2048, system_prompt: str = None, session_id: str = None) -> Generator[str, None, None]:
-        if not self.llm:
-            self.load_model()
+        print(f"Model loaded successfully: {os.path.basename(model_path)}")
+        return llm
+
+    def _load_draft_llm(self, draft_filename: str, n_ctx: int):
+        draft_path = os.path.join(MODEL_DIR, draft_filename)
+        if not os.path.exists(draft_path):
+            raise FileNotFoundError(f"Draft model {draft_filename} not found")
+        # Must share the target's context size, since it drafts from the same sequence
+        return Llama(model_path=draft_path, n_ctx=n_ctx, n_threads=self.n_threads, verbose=False)
+
+    def speculative_settings(self, model_filename: str) -> dict:
+        return config_manager.get("speculative_models", {}).get(model_filename, {"mode": "off"})
+
+    def apply_speculative(self, model_filename: str, settings: dict):
+        """Store a model's speculative settings and reload it so they take effect on next use"""
+        # Llama only takes a draft model at construction time
+        self._reload_with("speculative_models", model_filename, settings)
+
+    def apply_profile(self, model_filename: str, profile: dict):
+        """Store a model's runtime profile overrides and reload it so they take effect on next use"""
+        self._reload_with("runtime_profiles", model_filename, profile)
+
+    def _reload_with(self, config_key: str, model_filename: str, value: dict):
+        settings = dict(config_manager.get(config_key, {}))
+        settings[model_filename] = value
+        config_manager.config[config_key] = settings
+        model_path = os.path.join(MODEL_DIR, model_filename)
+        with self._model_locks[model_path]:
+            self.pool.evict(model_path)
+
+    def speculative_stats(self) -> dict:
+        return {
+            os.path.basename(model_path): {"mode": self.speculative_settings(os.path.basename(model_path)).get("mode", "off"), **draft.stats()}
+            for model_path, draft in list(self.drafts.items())
+        }
+
+    def _on_model_evicted(self, model_path: str):
+        # Snapshots taken from an evicted model cannot be restored into a fresh load
+        self.current_session_ids.pop(model_path, None)
+        self.session_states.discard_where(lambda key: key[0] == model_path)
+        draft = self.drafts.pop(model_path, None)
+        if draft is not None:
+            draft.close()
+
+    def set_pool_budget(self, budget_mb: int):
+        self.pool.set_budget(budget_mb * 1024**2)
+
+    def reset_for_session(self, session_id: str, model_filename: str = None):
+        """Swap the KV cache to the given session's snapshot, or clear it if there is none"""
+        model_path = self.resolve_model_path(model_filename)
+        llm = self.pool.get(model_path)
+        current_session_id = self.current_session_ids.get(model_path)
+        if session_id != current_session_id:
+            print(f"[DEBUG] Session switch detected: {current_session_id} -> {session_id}")
+            if current_session_id:
+                self.session_states.save((model_path, current_session_id), llm.save_state())
+            state = self.session_states.load((model_path, session_id))
+            if state is not None:
+                print(f"[DEBUG] Restoring saved KV state for session {session_id}")
+                llm.load_state(state)
+            else:
+                print(f"[DEBUG] Resetting KV cache for new session")
+                llm.reset()
+            self.current_session_ids[model_path] = session_id
+
+    def forget_session(self, session_id: str):
+        """Drop any saved KV state for a session that no longer exists"""
+        self.session_states.discard_where(lambda key: key[1] == session_id)
+        self.context.forget(session_id)
+        for model_path, current_session_id in list(self.current_session_ids.items()):
+            if current_session_id == session_id:
+                del self.current_session_ids[model_path]
+                llm = self.pool.peek(model_path)
+                if llm:
+                    llm.reset()
+
+    def stream_chat(self, messages: list, temperature: float = 0.7, top_p: float = 0.9, max_tokens: int = 2048, system_prompt: str = None, session_id: str = None, model: str = None, stats: dict = None) -> Generator[str, None, None]:
+        """Stream reply tokens. If a stats dict is given, it is filled with stage timings and prompt size for tracing."""
+        stats = {} if stats is None else stats
+        model_path = self.resolve_model_path(model)
+        start = time.perf_counter()
+        with self._model_locks[model_path]:
+            stats["lock_wait_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            yield from self._stream_chat(model_path, messages, temperature, top_p, max_tokens, system_prompt, session_id, stats)
+
+    def _stream_chat(self, model_path: str, messages: list, temperature: float, top_p: float, max_tokens: int, system_prompt: str, session_id: str, stats: dict) -> Generator[str, None, None]:
+        start = time.perf_counter()
+        llm = self.pool.get(model_path)
+        stats["model_load_ms"] = round((time.perf_counter() - start) * 1000, 3)
         
         # Reset model if switching sessions
+        start = time.perf_counter()
         if session_id:
-            self.reset_for_session(session_id)
+            self.reset_for_session(session_id, os.path.basename(model_path))
+        stats["session_switch_ms"] = round((time.perf_counter() - start) * 1000, 3)
         
         # Create a copy to avoid mutating the original
         messages_copy = list(messages)
@@ -86,10 +230,26 @@ class ModelService:
         else:
             print(f"[DEBUG] No system prompt provided")
         
+        # Keep the prompt within the context window, however long the session has grown
+        start = time.perf_counter()
+        messages_copy = self.context.build(
+            llm, model_path, messages_copy, max_tokens,
+            reserve_tokens=config_manager.get("context_reserve_tokens", 512),
+            session_id=session_id,
+            summarize=self._summarizer(llm) if config_manager.get("context_summary_enabled", False) else None,
+        )
+        stats["context_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        stats["prompt_messages"] = len(messages_copy)
+        stats["prompt_tokens"] = self.context.prompt_tokens(llm, model_path, messages_copy)
+        # History is trimmed to leave room for a reply; don't ask for more than is left in the window
+        reply_room = max(1, llm.n_ctx() - stats["prompt_tokens"])
+        max_tokens = min(max_tokens, reply_room) if max_tokens and max_tokens > 0 else reply_room
+        stats["max_tokens"] = max_tokens
+        
         print(f"[DEBUG] Messages after: {messages_copy}")
         print(f"[DEBUG] Temperature: {temperature}, Top-P: {top_p}, Max Tokens: {max_tokens}")
         
-        stream = self.llm.create_chat_completion(
+        stream = llm.create_chat_completion(
             messages=messages_copy,
             temperature=temperature,
             top_p=top_p,
@@ -102,17 +262,27 @@ class ModelService:
             if 'content' in delta:
                 yield delta['content']
 
+    def _summarizer(self, llm):
+        def summarize(prompt: str) -> str:
+            response = llm.create_chat_completion(
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+                max_tokens=config_manager.get("context_summary_max_tokens", 160)
+            )
+            return response['choices'][0]['message']['content']
+        return summarize
+
     def generate_title(self, user_message: str) -> str:
-        if not self.llm:
-            self.load_model()
+        model_path = self.resolve_model_path()
         
         prompt = f"Generate a short, concise title (3-5 words) for a chat session that starts with this message: '{user_message}'. Do not use quotes. Title:"
         
-        response = self.llm.create_chat_completion(
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=20
-        )
+        with self._model_locks[model_path]:
+            response = self.pool.get(model_path).create_chat_completion(
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens=20
+            )
         
         title = response['choices'][0]['message']['content'].strip()
         # Remove any surrounding quotes if the model adds them despite instructions
@@ -1,10 +1,16 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 import psutil
+import json
 import os
 from backend.cache_manager import cache_manager
 from backend.model_service import model_service
 from backend.telemetry import telemetry_manager
-from pydantic import BaseModel
+from backend.scheduler import inference_scheduler
+from backend.worker_pool import worker_pool
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 router = APIRouter()
 
@@ -19,6 +25,58 @@ class CacheSessionConfig(BaseModel):
 class ModelSelection(BaseModel):
     model_filename: str
 
+class ModelPoolConfig(BaseModel):
+    budget_mb: int = Field(ge=0)
+
+class SchedulerConfig(BaseModel):
+    max_concurrency: int = Field(ge=1)  # 0 would never dispatch anything
+    max_queue: int = Field(ge=0)
+
+class SemanticCacheConfig(BaseModel):
+    enabled: bool
+    threshold: float = Field(ge=0, le=1)  # Cosine similarity
+
+class SpeculativeConfig(BaseModel):
+    model_filename: str
+    mode: str
+    draft_model: Optional[str] = None
+    num_pred_tokens: int = 10
+    max_ngram_size: int = 2
+
+class RuntimeProfileConfig(BaseModel):
+    model_filename: str
+    n_ctx: Optional[int] = None
+    n_threads: Optional[int] = None
+    n_threads_batch: Optional[int] = None
+    n_batch: Optional[int] = None
+    use_mmap: Optional[bool] = None
+    use_mlock: Optional[bool] = None
+    type_k: Optional[str] = None
+    type_v: Optional[str] = None
+    verbose: Optional[bool] = None
+
+class HotTierConfig(BaseModel):
+    max_mb: float
+
+class CacheEvictionConfig(BaseModel):
+    policy: str
+    size_limit: Optional[int] = None
+
+class SafetyConfig(BaseModel):
+    lexicon_paths: List[str] = []
+    reload_interval_s: float = 5.0
+    output_action: str = "redact"  # "redact", "cut" or "off"
+    output_window: int = 48
+
+class TracingConfig(BaseModel):
+    enabled: bool
+    buffer_size: int = 500
+    jsonl_path: Optional[str] = None
+
+class ContextConfig(BaseModel):
+    reserve_tokens: int
+    summary_enabled: bool
+
 class ModelParams(BaseModel):
     temperature: float
     top_p: float
@@ -40,11 +98,94 @@ def get_system_stats():
 def get_cache_stats():
     return cache_manager.stats()
 
+@router.get("/session-stats")
+def get_session_stats():
+    from backend.database import get_stats_totals
+    return get_stats_totals()
+
+@router.get("/cache/eviction")
+def get_cache_eviction():
+    from backend.cache_eviction import EVICTION_POLICIES
+    return {**cache_manager.eviction_stats(), "size_limit": cache_manager.get_size_limit(), "policies": list(EVICTION_POLICIES)}
+
+@router.post("/cache/eviction")
+def set_cache_eviction(config: CacheEvictionConfig):
+    from backend.cache_eviction import EVICTION_POLICIES
+    if config.policy not in EVICTION_POLICIES:
+        raise HTTPException(status_code=400, detail=f"policy must be one of {', '.join(EVICTION_POLICIES)}")
+    if config.size_limit is not None:
+        if config.size_limit < 1:
+            raise HTTPException(status_code=400, detail="size_limit must be positive")
+        cache_manager.set_size_limit(config.size_limit)
+    config_manager.set("cache_eviction_policy", config.policy)
+    cache_manager.set_eviction_policy(config.policy)
+    return {"status": "Cache eviction updated", **get_cache_eviction()}
+
+@router.get("/cache/entries")
+def get_cache_entries(after: Optional[int] = None, limit: int = 50, session_prefix: Optional[str] = None,
+                      stored_after: Optional[float] = None, stored_before: Optional[float] = None,
+                      min_access: Optional[int] = None, values: bool = False, stream: bool = False):
+    """Browse the response cache a page at a time; values are only decoded when asked for."""
+    filters = {
+        "session_prefix": session_prefix,
+        "stored_after": stored_after,
+        "stored_before": stored_before,
+        "min_access": min_access,
+    }
+    if stream:
+        # The whole (filtered) cache as NDJSON, read a page at a time
+        lines = (json.dumps(entry) + "\n" for entry in cache_manager.browser.iter_entries(include_values=values, **filters))
+        return StreamingResponse(iterate_in_threadpool(lines), media_type="application/x-ndjson")
+    try:
+        return cache_manager.browser.page(after=after, limit=limit, include_values=values, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/cache/entries/{key}")
+def get_cache_entry(key: str):
+    entry = cache_manager.browser.get(key)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Cache entry not found")
+    return entry
+
+@router.get("/cache/hot-tier")
+def get_hot_tier():
+    return {"max_mb": config_manager.get("cache_hot_tier_mb", 64), **cache_manager.hot.stats()}
+
+@router.post("/cache/hot-tier")
+def set_hot_tier(config: HotTierConfig):
+    if config.max_mb < 0:
+        raise HTTPException(status_code=400, detail="max_mb cannot be negative")
+    config_manager.set("cache_hot_tier_mb", config.max_mb)
+    cache_manager.set_hot_tier_size(int(config.max_mb * 1024 * 1024))
+    return {"status": "Hot tier updated", **get_hot_tier()}
+
+@router.post("/cache/train-dictionary")
+def train_cache_dictionary(limit: int = 1000):
+    dict_id = cache_manager.train_dictionary(limit)
+    return {"status": "Cache dictionary trained" if dict_id else "Not enough cached responses to train on", **cache_manager.codec.stats()}
+
 @router.post("/clear-cache")
 def clear_cache():
     cache_manager.clear()
     return {"status": "Cache cleared"}
 
+@router.get("/semantic-cache")
+def get_semantic_cache():
+    semantic = cache_manager.semantic
+    return {
+        "enabled": config_manager.get("semantic_cache_enabled", False),
+        "threshold": config_manager.get("semantic_cache_threshold", 0.92),
+        "embedder": config_manager.get("semantic_cache_embedder", "hashing"),
+        "stats": semantic.stats() if semantic else None
+    }
+
+@router.post("/semantic-cache")
+def set_semantic_cache(config: SemanticCacheConfig):
+    config_manager.set("semantic_cache_enabled", config.enabled)
+    config_manager.set("semantic_cache_threshold", config.threshold)
+    return {"status": "Semantic cache config updated", "enabled": config.enabled, "threshold": config.threshold}
+
 @router.get("/session-config")
 def get_session_config():
     return {"max_prompts": config_manager.get("max_prompts", 20)}
@@ -67,19 +208,160 @@ def set_cache_session_config(config: CacheSessionConfig):
 def list_models():
     return {
         "models": model_service.list_models(),
-        "current_model": os.path.basename(model_service.current_model_path)
+        "current_model": os.path.basename(model_service.current_model_path),
+        "loaded_models": model_service.pool.loaded_models()
     }
 
 @router.post("/models/select")
 def select_model(selection: ModelSelection):
     try:
         model_service.set_model(selection.model_filename)
+        if worker_pool.running:
+            worker_pool.set_model(selection.model_filename)
         return {"status": "Model changed", "current_model": selection.model_filename}
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/model-pool")
+def get_model_pool():
+    return model_service.pool.stats()
+
+@router.post("/model-pool")
+def set_model_pool(config: ModelPoolConfig):
+    config_manager.set("model_pool_budget_mb", config.budget_mb)
+    model_service.set_pool_budget(config.budget_mb)
+    return {"status": "Model pool budget updated", "budget_mb": config.budget_mb}
+
+@router.get("/scheduler")
+def get_scheduler():
+    return inference_scheduler.stats()
+
+@router.post("/scheduler")
+async def set_scheduler(config: SchedulerConfig):
+    config_manager.set("max_concurrent_inferences", config.max_concurrency)
+    config_manager.set("max_queued_inferences", config.max_queue)
+    inference_scheduler.configure(config.max_concurrency, config.max_queue)
+    return {"status": "Scheduler config updated", "max_concurrency": config.max_concurrency, "max_queue": config.max_queue}
+
+@router.get("/speculative")
+def get_speculative():
+    from backend.worker_pool import inference_backend
+    return {
+        "models": config_manager.get("speculative_models", {}),
+        "drafts": inference_backend().speculative_stats(),
+        "decode": telemetry_manager.decode_stats()
+    }
+
+@router.post("/speculative")
+def set_speculative(config: SpeculativeConfig):
+    from backend.speculative import SPECULATIVE_MODES
+    from backend.worker_pool import inference_backend
+    models = model_service.list_models()
+    if config.model_filename not in models:
+        raise HTTPException(status_code=404, detail=f"Model {config.model_filename} not found")
+    if config.mode not in SPECULATIVE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(SPECULATIVE_MODES)}")
+    if config.mode == "draft" and (config.draft_model not in models or config.draft_model == config.model_filename):
+        raise HTTPException(status_code=400, detail="draft mode needs a different, installed draft_model")
+    if config.num_pred_tokens < 1:
+        raise HTTPException(status_code=400, detail="num_pred_tokens must be at least 1")
+
+    settings = {"mode": config.mode, "num_pred_tokens": config.num_pred_tokens}
+    if config.mode == "prompt_lookup":
+        settings["max_ngram_size"] = config.max_ngram_size
+    elif config.mode == "draft":
+        settings["draft_model"] = config.draft_model
+    speculative = dict(config_manager.get("speculative_models", {}))
+    speculative[config.model_filename] = settings
+    config_manager.set("speculative_models", speculative)
+    # The model is reloaded with the new settings the next time it is used
+    model_service.apply_speculative(config.model_filename, settings)
+    if inference_backend() is not model_service:
+        inference_backend().apply_speculative(config.model_filename, settings)
+    return {"status": "Speculative decoding updated", "model_filename": config.model_filename, **settings}
+
+@router.get("/runtime-profiles")
+def get_runtime_profiles():
+    from backend.runtime_profiles import get_profile
+    return {
+        "profiles": {model: get_profile(model) for model in model_service.list_models()},
+        "overrides": config_manager.get("runtime_profiles", {})
+    }
+
+@router.post("/runtime-profiles")
+def set_runtime_profile(config: RuntimeProfileConfig):
+    from backend.runtime_profiles import validate_profile, get_profile
+    from backend.worker_pool import inference_backend
+    if config.model_filename not in model_service.list_models():
+        raise HTTPException(status_code=404, detail=f"Model {config.model_filename} not found")
+    try:
+        # Fields left out fall back to the defaults
+        overrides = validate_profile(config.dict(exclude={"model_filename"}))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    profiles = dict(config_manager.get("runtime_profiles", {}))
+    profiles[config.model_filename] = overrides
+    config_manager.set("runtime_profiles", profiles)
+    # The model is reloaded with the new profile the next time it is used
+    model_service.apply_profile(config.model_filename, overrides)
+    if inference_backend() is not model_service:
+        inference_backend().apply_profile(config.model_filename, overrides)
+    return {"status": "Runtime profile updated", "model_filename": config.model_filename, "profile": get_profile(config.model_filename)}
+
+@router.get("/traces")
+def get_traces(limit: int = 50, min_duration_ms: Optional[float] = None, session_id: Optional[str] = None, status: Optional[str] = None):
+    from backend.tracing import tracer
+    return {
+        "stats": tracer.stats(),
+        "traces": tracer.recent(limit=limit, min_duration_ms=min_duration_ms, session_id=session_id, status=status)
+    }
+
+@router.get("/traces/{request_id}")
+def get_trace(request_id: str):
+    from backend.tracing import tracer
+    trace = tracer.get(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Trace {request_id} not found")
+    return trace
+
+@router.post("/traces/config")
+def set_tracing(config: TracingConfig):
+    from backend.tracing import tracer
+    if config.buffer_size < 1:
+        raise HTTPException(status_code=400, detail="buffer_size must be at least 1")
+    config_manager.set("tracing_enabled", config.enabled)
+    config_manager.set("trace_buffer_size", config.buffer_size)
+    config_manager.set("trace_jsonl_path", config.jsonl_path)
+    tracer.configure(capacity=config.buffer_size, jsonl_path=config.jsonl_path)
+    return {"status": "Tracing config updated", **tracer.stats(), "enabled": config.enabled}
+
+@router.get("/context")
+def get_context():
+    return {
+        "reserve_tokens": config_manager.get("context_reserve_tokens", 512),
+        "summary_enabled": config_manager.get("context_summary_enabled", False),
+        "stats": model_service.context.stats()
+    }
+
+@router.post("/context")
+def set_context(config: ContextConfig):
+    if config.reserve_tokens < 0:
+        raise HTTPException(status_code=400, detail="reserve_tokens must be non-negative")
+    config_manager.set("context_reserve_tokens", config.reserve_tokens)
+    config_manager.set("context_summary_enabled", config.summary_enabled)
+    return {"status": "Context config updated", "reserve_tokens": config.reserve_tokens, "summary_enabled": config.summary_enabled}
+
+@router.get("/message-writer")
+def get_message_writer():
+    from backend.database import message_writer
+    return message_writer.stats()
+
+@router.get("/workers")
+def get_workers():
+    return worker_pool.stats()
+
 @router.get("/model-params")
 def get_model_params():
     return {
@@ -98,3 +380,39 @@ def set_model_params(params: ModelParams):
     config_manager.set("system_prompt", params.system_prompt)
     config_manager.set("safety_enabled", params.safety_enabled)
     return {"status": "Model parameters updated", "params": params}
+
+@router.get("/safety")
+def get_safety():
+    from backend.safety import safety_filter
+    return {
+        **safety_filter.stats(),
+        "output_action": config_manager.get("safety_output_action", "redact"),
+        "output_window": config_manager.get("safety_output_window", 48)
+    }
+
+@router.post("/safety")
+def set_safety(config: SafetyConfig):
+    from backend.safety import safety_filter, OUTPUT_ACTIONS
+    if config.output_action not in OUTPUT_ACTIONS + ("off",):
+        raise HTTPException(status_code=400, detail=f"output_action must be one of {', '.join(OUTPUT_ACTIONS + ('off',))}")
+    if config.output_window < 1:
+        raise HTTPException(status_code=400, detail="output_window must be at least 1")
+    missing = [path for path in config.lexicon_paths if not os.path.exists(path)]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Lexicon paths not found: {', '.join(missing)}")
+    config_manager.set("safety_lexicon_paths", config.lexicon_paths)
+    config_manager.set("safety_reload_interval_s", config.reload_interval_s)
+    config_manager.set("safety_output_action", config.output_action)
+    config_manager.set("safety_output_window", config.output_window)
+    safety_filter.configure(lexicon_paths=config.lexicon_paths, reload_interval=config.reload_interval_s)
+    return {"status": "Safety config updated", **get_safety()}
+
+@router.post("/safety/reload")
+def reload_safety():
+    from backend.safety import safety_filter
+    safety_filter.reload(force=True)
+    return {"status": "Safety lexicons reloaded", **safety_filter.stats()}
+
+@router.get("/session-states")
+def get_session_states():
+    return model_service.session_states.stats()
@@ -2,18 +2,21 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 from backend.model_service import model_service
-from backend.cache_manager import cache_manager
+from backend.scheduler import inference_scheduler, QueueFullError
+from backend.worker_pool import inference_backend
+from backend.cache_keys import namespace_key, conversation_key
+from backend.async_io import async_database, async_cache
 from fastapi.responses import StreamingResponse
-import json
-import hashlib
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+import os
 
 router = APIRouter()
 
-from backend import database
-from backend import database
 from backend.config import config_manager
 from backend.telemetry import telemetry_manager
-from backend.safety import safety_filter
+from backend.tracing import tracer
+from backend.safety import safety_filter, OUTPUT_ACTIONS, CUT_NOTICE
+from backend.sse import SSEWriter, STREAM_FORMATS, DONE, event, with_deadline
 import time
 
 class Message(BaseModel):
@@ -24,91 +27,273 @@ class ChatRequest(BaseModel):
     messages: List[Message]
     temperature: Optional[float] = 0.7
     session_id: Optional[str] = None
+    model: Optional[str] = None
+    stream_format: Optional[str] = "json"  # "text" sends raw token events instead of JSON payloads
 
 @router.post("/completions")
 async def chat_completions(request: ChatRequest):
+    # Every turn is traced stage by stage; the id is returned so a slow turn can be looked up in /admin/traces
+    trace = tracer.start("chat", session_id=request.session_id, messages=len(request.messages))
+    try:
+        response = await _chat_completions(request, trace)
+    except HTTPException as e:
+        trace.finish(status=e.status_code)
+        raise
+    except Exception as e:
+        trace.set(error=str(e))
+        trace.finish(status="error")
+        raise
+    response.headers["X-Request-ID"] = trace.request_id
+    return response
+
+async def _chat_completions(request: ChatRequest, trace):
     start_time = time.time()
     telemetry_manager.record_request()
+    if request.stream_format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"stream_format must be one of {', '.join(STREAM_FORMATS)}")
+    writer = SSEWriter(
+        flush_ms=config_manager.get("stream_flush_ms", 20),
+        flush_bytes=config_manager.get("stream_flush_bytes", 64),
+        format=request.stream_format
+    )
 
     # Safety Check
     if config_manager.get("safety_enabled", True):
         # Check last user message
         last_user_msg = request.messages[-1].content
-        is_safe, reason, _ = safety_filter.check(last_user_msg)
+        with trace.span("safety"):
+            is_safe, reason, _ = safety_filter.check(last_user_msg)
         if not is_safe:
             telemetry_manager.record_blocked()
             raise HTTPException(status_code=400, detail=f"Safety violation: {reason}")
 
-    # Create session-based cache key
+    try:
+        model_name = os.path.basename(model_service.resolve_model_path(request.model))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    telemetry_manager.record_model_request(model_name)
+    trace.set(model=model_name)
+
     last_message = request.messages[-1].content
-    if request.session_id:
-        cache_key = f"{request.session_id}:{hashlib.md5(last_message.encode()).hexdigest()}"
-    else:
-        cache_key = hashlib.md5(last_message.encode()).hexdigest()
+    temperature = request.temperature or config_manager.get("default_temperature", 0.7)
+    top_p = config_manager.get("default_top_p", 0.9)
+    max_tokens = config_manager.get("default_max_tokens", 2048)
+    system_prompt = config_manager.get("system_prompt", "You are a helpful AI assistant.")
+
+    # Key the cache on everything that shapes the answer, so identical conversations
+    # share a response across sessions
+    namespace = namespace_key(model_name, temperature, top_p, max_tokens, system_prompt)
+    conversation = [m.dict() for m in request.messages]
+    cache_key = conversation_key(namespace, conversation)
     
     # Check session limit
     if request.session_id:
         max_prompts = config_manager.get("max_prompts", 20)
-        messages = database.get_messages(request.session_id)
-        user_messages = [m for m in messages if m['role'] == 'user']
-        if len(user_messages) >= max_prompts:
+        with trace.span("db.session_stats"):
+            stats = await async_database.get_session_stats(request.session_id)
+        if stats["user_messages"] >= max_prompts:
             raise HTTPException(status_code=403, detail="Limit has exceeded, open a new chat")
 
+    # Standalone prompts (no earlier turns) may be answered by a semantically similar cached one
+    semantic_prompt = None
+    if all(m.role != "assistant" for m in request.messages) and request.messages[-1].role == "user":
+        semantic_prompt = last_message
+
+    # Check cache
+    with trace.span("cache.lookup") as span:
+        cached_response = await async_cache.get_conversation(cache_key)
+        span["tier"] = "exact" if cached_response else None
+        if not cached_response and semantic_prompt:
+            cached_response = await async_cache.get_similar(semantic_prompt, namespace)
+            span["tier"] = "semantic" if cached_response else None
+    trace.set(cached=bool(cached_response))
+
+    # Reject up front when the queue is full, before anything is stored. The slot itself is
+    # only taken once the response body runs, so a request that never streams cannot hold it
+    if not cached_response:
+        try:
+            inference_scheduler.check_capacity()
+        except QueueFullError:
+            raise HTTPException(status_code=429, detail="Server is busy, try again shortly", headers={"Retry-After": "1"})
+
+    if request.session_id:
         # We assume the last message in request.messages is the new user message
         # In a robust app, we might want to be more explicit, but this works for now
         if request.messages[-1].role == "user":
-             database.add_message(request.session_id, "user", request.messages[-1].content)
+            with trace.span("db.add_user_message"):
+                await async_database.add_message(request.session_id, "user", request.messages[-1].content)
 
-    # Check cache
-    cached_response = cache_manager.get(cache_key)
     if cached_response:
-        telemetry_manager.record_cache_hit()
+        telemetry_manager.record_cache_hit(model_name)
         telemetry_manager.record_latency((time.time() - start_time) * 1000)
         if request.session_id:
-            cache_manager.track_session_cache(request.session_id)
+            await async_cache.track_session_cache(request.session_id, cache_key)
         # If cached, we stream it back as if it were generated
         # For simplicity in this demo, we'll just yield it in one go or chunks
-        def cached_stream():
-            yield f"data: {json.dumps({'content': cached_response, 'cached': True})}\n\n"
-            yield "data: [DONE]\n\n"
-            
-            # If session_id is provided, save the cached assistant response too
-            if request.session_id:
-                database.add_message(request.session_id, "assistant", cached_response)
+        async def cached_stream():
+            try:
+                if writer.format == "json":
+                    yield event({'content': cached_response, 'cached': True})
+                else:
+                    frame = writer.add(cached_response)
+                    if frame:
+                        yield frame
+                    frame = writer.flush()
+                    if frame:
+                        yield frame
+                yield DONE
+                
+                # If session_id is provided, save the cached assistant response too
+                if request.session_id:
+                    with trace.span("db.add_assistant_message"):
+                        await async_database.add_message(request.session_id, "assistant", cached_response)
+            finally:
+                trace.finish()
                 
         return StreamingResponse(cached_stream(), media_type="text/event-stream")
 
-    def generate():
+    async def generate():
         full_response = ""
+        stream = None
+        ticks = None
+        ticket = None
+        status = "aborted"  # Unless the stream completes or fails, the client went away
         try:
-            for chunk in model_service.stream_chat(
-                messages=[m.dict() for m in request.messages],
-                temperature=request.temperature or config_manager.get("default_temperature", 0.7),
-                top_p=config_manager.get("default_top_p", 0.9),
-                max_tokens=config_manager.get("default_max_tokens", 2048),
-                system_prompt=config_manager.get("system_prompt", "You are a helpful AI assistant."),
-                session_id=request.session_id  # Pass session_id for cache management
-            ):
-                full_response += chunk
-                telemetry_manager.record_tokens(1) # Approximate
-                yield f"data: {json.dumps({'content': chunk})}\n\n"
+            try:
+                ticket = inference_scheduler.submit(request.session_id)
+            except QueueFullError:
+                # The queue filled up between the check above and the body starting
+                status = "rejected"
+                yield writer.event({'error': 'Server is busy, try again shortly'})
+                return
+
+            # Report queue position while waiting for a slot, then the total wait
+            with trace.span("queue"):
+                async for queue_status in inference_scheduler.wait(ticket):
+                    yield event({'queue': queue_status})
+
+            # Screen the generated text as it streams, holding back only a short window
+            scanner = None
+            output_action = config_manager.get("safety_output_action", "redact")
+            if config_manager.get("safety_enabled", True) and output_action in OUTPUT_ACTIONS:
+                scanner = safety_filter.stream_scanner(output_action, config_manager.get("safety_output_window", 48))
+
+            inference_stats = {}
+            inference_start = time.perf_counter()
+            stream = inference_backend().stream_chat(
+                messages=conversation,
+                temperature=temperature,
+                top_p=top_p,
+                max_tokens=max_tokens,
+                system_prompt=system_prompt,
+                session_id=request.session_id,  # Pass session_id for cache management
+                model=request.model,
+                stats=inference_stats
+            )
+            # Drive the blocking llama generator from the threadpool, one token at a time;
+            # deltas are coalesced into frames, and None means buffered text came due
+            first_token_at = None
+            token_count = 0
+            last_token_at = None
+            ticks = with_deadline(iterate_in_threadpool(stream), writer)
+            async for chunk in ticks:
+                if chunk is None:
+                    frame = writer.flush()
+                    if frame:
+                        yield frame
+                    continue
+                now = time.time()
+                if first_token_at is None:
+                    first_token_at = now
+                    first_token_perf = time.perf_counter()
+                    telemetry_manager.record_ttft((now - start_time) * 1000)
+                else:
+                    telemetry_manager.record_itl((now - last_token_at) * 1000)
+                last_token_at = now
+                token_count += 1
+                telemetry_manager.record_tokens(1, model_name)  # One streamed chunk per token
+                if scanner:
+                    chunk = scanner.feed(chunk)
+                if chunk:
+                    full_response += chunk
+                    frame = writer.add(chunk)
+                    if frame:
+                        yield frame
+                if scanner and scanner.stopped:
+                    break  # Stop decoding; the finally block closes the generator and frees the model
+
+            if scanner:
+                tail = scanner.finish()
+                if tail:
+                    full_response += tail
+                    frame = writer.add(tail)
+                    if frame:
+                        yield frame
+                trace.set(output_redactions=scanner.redactions, output_cut=scanner.stopped)
+                if scanner.stopped:
+                    telemetry_manager.record_blocked()
+                    full_response += CUT_NOTICE
+                    yield writer.event({'content': CUT_NOTICE, 'safety': {'action': 'cut', 'reason': scanner.reason}})
+            frame = writer.flush()
+            if frame:
+                yield frame
+            trace.set(stream_frames=writer.frames)
             
             telemetry_manager.record_latency((time.time() - start_time) * 1000)
+            # Prefill runs until the first token (including any model load and KV restore); decode is the rest
+            end = time.perf_counter()
+            if first_token_at is None:
+                trace.add_span("prefill", inference_start, end, **inference_stats)
+            else:
+                trace.add_span("prefill", inference_start, first_token_perf, **inference_stats)
+                trace.add_span("decode", first_token_perf, end, tokens=token_count)
+            if first_token_at is not None:
+                # Decode rate after the first token, per model and speculative mode
+                mode = model_service.speculative_settings(model_name).get("mode", "off")
+                telemetry_manager.record_decode(model_name, mode, token_count - 1, time.time() - first_token_at)
             
-            # Cache the response and track session
-            cache_manager.set(cache_key, full_response)
-            if request.session_id:
-                cache_manager.track_session_cache(request.session_id)
-                # Cleanup old sessions if needed
-                max_cached_sessions = config_manager.get("max_cached_sessions", 10)
-                cache_manager.cleanup_old_sessions(max_cached_sessions)
+            # Cache the response and track session; a response cut short is not worth replaying
+            with trace.span("cache.store"):
+                stored = not (scanner and scanner.stopped)
+                if stored:
+                    meta = {
+                        "model": model_name,
+                        "tokens": token_count,
+                        "generation_ms": round((time.perf_counter() - inference_start) * 1000, 1),
+                        "created_at": time.time()
+                    }
+                    # The tag records which session generated the entry; sessions that use it are tracked below
+                    await async_cache.set(cache_key, full_response, tag=request.session_id, meta=meta)
+                    if semantic_prompt:
+                        await async_cache.set_similar(semantic_prompt, namespace, cache_key)
+                if request.session_id:
+                    await async_cache.track_session_cache(request.session_id, cache_key if stored else None)
+                    # Cleanup old sessions if needed
+                    max_cached_sessions = config_manager.get("max_cached_sessions", 10)
+                    await async_cache.cleanup_old_sessions(max_cached_sessions)
             
             # If session_id is provided, save the assistant response
             if request.session_id:
-                database.add_message(request.session_id, "assistant", full_response)
+                with trace.span("db.add_assistant_message"):
+                    await async_database.add_message(request.session_id, "assistant", full_response)
                 
-            yield "data: [DONE]\n\n"
+            status = "ok"
+            yield DONE
         except Exception as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            status = "error"
+            trace.set(error=str(e))
+            yield writer.event({'error': str(e)})
+        finally:
+            # Release the model lock promptly if the client went away mid-stream
+            if ticks is not None:
+                await ticks.aclose()
+            if stream is not None:
+                try:
+                    await run_in_threadpool(stream.close)
+                except ValueError:
+                    pass  # Still executing in an abandoned worker thread; it is closed when collected
+            if ticket is not None:
+                inference_scheduler.release(ticket)
+            trace.finish(status=status)
 
     return StreamingResponse(generate(), media_type="text/event-stream")
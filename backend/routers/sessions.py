@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException
+import json
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-from backend import database
+from backend.async_io import async_database
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter()
 
@@ -9,6 +12,16 @@ class Session(BaseModel):
     id: str
     title: str
     created_at: str
+    message_count: int = 0
+    last_activity: Optional[str] = None
+
+class SessionStats(BaseModel):
+    session_id: str
+    user_messages: int
+    assistant_messages: int
+    user_tokens: int
+    assistant_tokens: int
+    last_activity: Optional[str] = None
 
 class CreateSessionRequest(BaseModel):
     title: Optional[str] = "New Chat"
@@ -25,31 +38,78 @@ class AddMessageRequest(BaseModel):
     content: str
 
 @router.post("/", response_model=Session)
-def create_session(request: CreateSessionRequest):
-    return database.create_session(request.title)
+async def create_session(request: CreateSessionRequest):
+    return await async_database.create_session(request.title)
 
 @router.get("/", response_model=List[Session])
-def list_sessions():
-    return database.get_sessions()
+async def list_sessions(before: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=1000)):
+    """Every session, newest first; with limit/before, one keyset page of them."""
+    try:
+        return await async_database.get_sessions(before=before, limit=limit)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 @router.delete("/{session_id}")
-def delete_session(session_id: str):
-    database.delete_session(session_id)
+async def delete_session(session_id: str):
+    from backend.worker_pool import inference_backend
+    await async_database.delete_session(session_id)
+    await run_in_threadpool(inference_backend().forget_session, session_id)
     return {"status": "success"}
 
+@router.get("/{session_id}/stats", response_model=SessionStats)
+async def get_session_stats(session_id: str):
+    return await async_database.get_session_stats(session_id)
+
+STREAM_PAGE_SIZE = 500
+
 @router.get("/{session_id}/messages", response_model=List[Message])
-def get_session_messages(session_id: str):
-    return database.get_messages(session_id)
+async def get_session_messages(
+    session_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    stream: bool = False,
+):
+    """
+    Without parameters, the whole history as one list. With limit/before/after, one
+    keyset page (the newest page when no cursor is given). With stream=true, the
+    history from `after` onwards as NDJSON, read and sent page by page.
+    """
+    if stream:
+        if before:
+            raise HTTPException(status_code=400, detail="Streaming reads forwards; use after")
+        return StreamingResponse(_stream_messages(session_id, after), media_type="application/x-ndjson")
+    if limit is None and not before and not after:
+        return await async_database.get_messages(session_id)
+    try:
+        return await async_database.get_messages_page(session_id, before=before, after=after, limit=limit or 50)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _stream_messages(session_id: str, after: Optional[str]):
+    # Each page is its own short read, so a slow client never pins a pooled connection
+    if after is None:
+        page = await async_database.get_first_messages(session_id, limit=STREAM_PAGE_SIZE)
+    else:
+        page = await async_database.get_messages_page(session_id, after=after, limit=STREAM_PAGE_SIZE)
+    while page:
+        for message in page:
+            yield json.dumps(message) + "\n"
+        if len(page) < STREAM_PAGE_SIZE:
+            break
+        page = await async_database.get_messages_page(session_id, after=page[-1]["id"], limit=STREAM_PAGE_SIZE)
 
 @router.post("/{session_id}/messages", response_model=Message)
-def add_message(session_id: str, request: AddMessageRequest):
-    return database.add_message(session_id, request.role, request.content)
+async def add_message(session_id: str, request: AddMessageRequest):
+    return await async_database.add_message(session_id, request.role, request.content)
 
 class GenerateTitleRequest(BaseModel):
     user_message: str
 
 @router.post("/{session_id}/title", response_model=Session)
-def generate_session_title(session_id: str, request: GenerateTitleRequest):
-    from backend.model_service import model_service
-    title = model_service.generate_title(request.user_message)
-    return database.update_session_title(session_id, title)
+async def generate_session_title(session_id: str, request: GenerateTitleRequest):
+    from backend.worker_pool import inference_backend
+    title = await run_in_threadpool(inference_backend().generate_title, request.user_message)
+    return await async_database.update_session_title(session_id, title)
@@ -0,0 +1,59 @@
+from backend.config import config_manager
+
+# llama.cpp defaults, plus the context size and verbosity the app has always used.
+# None means "decide at load time" (all of the process's threads; the model's own cache type).
+DEFAULT_PROFILE = {
+    "n_ctx": 2048,
+    "n_threads": None,
+    "n_threads_batch": None,
+    "n_batch": 512,
+    "use_mmap": True,
+    "use_mlock": False,
+    "type_k": None,
+    "type_v": None,
+    "verbose": True,
+}
+
+# KV cache data types accepted by type_k / type_v (ggml_type values)
+KV_CACHE_TYPES = {"f32": 0, "f16": 1, "q4_0": 2, "q4_1": 3, "q5_0": 6, "q5_1": 7, "q8_0": 8}
+
+def get_profile(model_filename: str) -> dict:
+    """Effective runtime profile for a model: defaults overlaid with its saved overrides."""
+    overrides = config_manager.get("runtime_profiles", {}).get(model_filename, {})
+    return {**DEFAULT_PROFILE, **overrides}
+
+def validate_profile(overrides: dict) -> dict:
+    """Check a set of profile overrides, dropping unset fields. Raises ValueError."""
+    profile = {}
+    for key, value in overrides.items():
+        if key not in DEFAULT_PROFILE:
+            raise ValueError(f"Unknown profile setting: {key}")
+        if value is None:
+            continue
+        if key in ("type_k", "type_v"):
+            if value not in KV_CACHE_TYPES:
+                raise ValueError(f"{key} must be one of {', '.join(KV_CACHE_TYPES)}")
+        elif key in ("use_mmap", "use_mlock", "verbose"):
+            value = bool(value)
+        elif int(value) < 1:
+            raise ValueError(f"{key} must be at least 1")
+        profile[key] = value
+    return profile
+
+def llama_kwargs(profile: dict, max_threads: int) -> dict:
+    """Keyword arguments for Llama() from a profile, with thread counts capped to this process's share."""
+    n_threads = min(profile["n_threads"] or max_threads, max_threads)
+    n_threads_batch = min(profile["n_threads_batch"] or n_threads, max_threads)
+    kwargs = {
+        "n_ctx": profile["n_ctx"],
+        "n_threads": n_threads,
+        "n_threads_batch": n_threads_batch,
+        "n_batch": profile["n_batch"],
+        "use_mmap": profile["use_mmap"],
+        "use_mlock": profile["use_mlock"],
+        "verbose": profile["verbose"],
+    }
+    for key in ("type_k", "type_v"):
+        if profile[key]:
+            kwargs[key] = KV_CACHE_TYPES[profile[key]]
+    return kwargs
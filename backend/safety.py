@@ -1,37 +1,396 @@
+import os
 import re
+import time
+import threading
+from collections import deque
+from typing import NamedTuple
+from backend.config import config_manager
+
+# Built-in lexicons; each <category>.txt holds one term or phrase per line, '#' starts a comment
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicons")
+
+# PII detectors, in the order they are tried where they overlap: a 13-19 digit run is tried
+# as a card before a phone number
+PII_DETECTORS = (
+    ("email", r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b"),
+    ("iban", r"\b[A-Z]{2}\d{2}(?:[ ]?[A-Z0-9]){11,30}\b"),
+    ("ssn", r"\b\d{3}-\d{2}-\d{4}\b"),
+    ("card", r"\b\d(?:[ -]?\d){12,18}\b"),
+    ("phone", r"\b\d{3}[-.]?\d{3}[-.]?\d{4}\b"),
+    ("ip", r"\b(?:\d{1,3}\.){3}\d{1,3}\b"),
+)
+# All of them in one pattern, so a message is scanned by the regex engine once
+PII_PATTERN = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in PII_DETECTORS))
+# When a match fails its validator, the detectors after it get their turn at the same position
+PII_FALLBACKS = {
+    name: [(later, re.compile(pattern)) for later, pattern in PII_DETECTORS[i + 1:]]
+    for i, (name, _) in enumerate(PII_DETECTORS)
+}
+
+# What to do when streamed model output matches: replace the match, or stop the response
+OUTPUT_ACTIONS = ("redact", "cut")
+REDACTION = "[redacted]"
+CUT_NOTICE = "\n\n[Response stopped by the safety filter]"
+WHITESPACE = re.compile(r"\s")
+
+PII_LABELS = {"email": "Email", "iban": "IBAN", "ssn": "SSN", "card": "Card", "phone": "Phone", "ip": "IP"}
+
+class SafetyMatch(NamedTuple):
+    kind: str  # "lexicon" or "pii"
+    category: str
+    start: int
+    end: int
+    text: str
+
+def luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        n = int(ch)
+        if i % 2:
+            n = n * 2 - 9 if n > 4 else n * 2
+        total += n
+    return total % 10 == 0
+
+def iban_valid(iban: str) -> bool:
+    iban = iban.replace(" ", "")
+    if not 15 <= len(iban) <= 34:
+        return False
+    rearranged = iban[4:] + iban[:4]
+    return int("".join(str(int(ch, 36)) for ch in rearranged)) % 97 == 1
+
+def ssn_valid(ssn: str) -> bool:
+    area, group, serial = ssn.split("-")
+    return area not in ("000", "666") and area[0] != "9" and group != "00" and serial != "0000"
+
+def ip_valid(ip: str) -> bool:
+    return all(int(octet) <= 255 for octet in ip.split("."))
+
+PII_VALIDATORS = {
+    "card": lambda s: luhn_valid(re.sub(r"[ -]", "", s)),
+    "iban": iban_valid,
+    "ssn": ssn_valid,
+    "ip": ip_valid,
+}
+
+def pii_valid(category: str, text: str) -> bool:
+    validator = PII_VALIDATORS.get(category)
+    return validator is None or validator(text)
+
+def find_pii(text: str):
+    """Validated PII matches in text, in order."""
+    pos = 0
+    while True:
+        m = PII_PATTERN.search(text, pos)
+        if m is None:
+            return
+        category, end = m.lastgroup, m.end()
+        if not pii_valid(category, m.group()):
+            # e.g. a digit run that fails Luhn as a card may still be a phone number
+            category = None
+            for name, pattern in PII_FALLBACKS[m.lastgroup]:
+                alternative = pattern.match(text, m.start())
+                if alternative and pii_valid(name, alternative.group()):
+                    category, end = name, alternative.end()
+                    break
+        if category is None:
+            pos = m.start() + 1
+            continue
+        yield SafetyMatch("pii", category, m.start(), end, text[m.start():end])
+        pos = end
+
+def normalize_term(term: str) -> str:
+    return " ".join(term.lower().split())
+
+def _lower(text: str) -> str:
+    # Match offsets must line up with the original text, so keep characters whose
+    # lowercase form has a different length (e.g. 'İ') as they are
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+class Automaton:
+    """
+    Aho-Corasick matcher over a set of terms. Scanning follows one transition per
+    character (plus amortised failure links), so the cost does not grow with the
+    number of terms.
+    """
+
+    def __init__(self, terms: dict):
+        # terms maps normalized term -> category
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for term, category in terms.items():
+            state = 0
+            for ch in term:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = next_state
+            self._out[state] = ((len(term), category),)
+        self.terms = len(terms)
+
+        # Breadth-first, so every failure target is finished before it is used
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    @property
+    def states(self) -> int:
+        return len(self._goto)
+
+    def find(self, text: str):
+        """Yields (start, end, category) for whole-word matches in text, which should already be lowercased."""
+        goto, fail, out = self._goto, self._fail, self._out
+        size = len(text)
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                end = i + 1
+                for length, category in out[state]:
+                    start = end - length
+                    # Only whole words: "hell" should not fire inside "hello"
+                    if (start == 0 or not text[start - 1].isalnum()) and (end == size or not text[end].isalnum()):
+                        yield start, end, category
 
 class SafetyFilter:
-    def __init__(self):
-        self.profanity_list = {
-            "damn", "hell", "crap", "idiot", "stupid"
-        }
-        # Basic PII regex patterns
-        self.email_pattern = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
-        self.phone_pattern = re.compile(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b')
+    """
+    Lexicon and PII screening for chat messages.
+
+    Lexicon terms are loaded from text files (the built-in lexicons directory plus
+    any extra files or directories passed in) and compiled into one automaton;
+    files are re-read when they change. PII is found with a single combined regex
+    whose matches are then validated (Luhn for cards, mod-97 for IBANs).
+    """
+
+    def __init__(self, lexicon_paths: list = None, reload_interval: float = 5.0):
+        self.lexicon_paths = [LEXICON_DIR] + list(lexicon_paths or [])
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._automaton = Automaton({})
+        self._signature = None
+        self._checked_at = 0.0
+        self.reloads = 0
+        self.build_ms = 0.0
+        self.scans = 0
+        self.matches = 0
+        self.output_streams = 0
+        self.output_redactions = 0
+        self.output_cuts = 0
+        self.reload(force=True)
+
+    def _lexicon_files(self) -> list:
+        files = []
+        for path in self.lexicon_paths:
+            if os.path.isdir(path):
+                files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".txt"))
+            elif os.path.isfile(path):
+                files.append(path)
+        return files
+
+    def reload(self, force: bool = False) -> bool:
+        """Rebuild the automaton if any lexicon file was added, removed or modified."""
+        with self._lock:
+            files = self._lexicon_files()
+            signature = {}
+            for path in files:
+                try:
+                    signature[path] = os.path.getmtime(path)
+                except OSError:
+                    pass
+            if not force and signature == self._signature:
+                return False
+
+            start = time.perf_counter()
+            terms = {}
+            for path in signature:
+                category = os.path.splitext(os.path.basename(path))[0]
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        for line in f:
+                            term = normalize_term(line.split("#", 1)[0])
+                            if term:
+                                terms[term] = category
+                except OSError as e:
+                    print(f"Error loading lexicon {path}: {e}")
+            automaton = Automaton(terms)
+            # Swapped in whole, so concurrent scans see either the old or the new lexicon
+            self._automaton = automaton
+            self._signature = signature
+            self.build_ms = round((time.perf_counter() - start) * 1000, 3)
+            self.reloads += 1
+            print(f"Loaded {automaton.terms} safety terms from {len(signature)} lexicon files in {self.build_ms} ms")
+            return True
+
+    def configure(self, lexicon_paths: list = None, reload_interval: float = None):
+        if lexicon_paths is not None:
+            self.lexicon_paths = [LEXICON_DIR] + list(lexicon_paths)
+        if reload_interval is not None:
+            self.reload_interval = reload_interval
+        self.reload(force=True)
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self.reload_interval and now - self._checked_at >= self.reload_interval:
+            self._checked_at = now
+            self.reload()
+
+    def scan(self, text: str) -> list:
+        """All lexicon and PII matches in text, ordered by position."""
+        self._maybe_reload()
+        matches = self._find(text)
+        self.scans += 1
+        self.matches += len(matches)
+        return matches
+
+    def _find(self, text: str) -> list:
+        matches = [
+            SafetyMatch("lexicon", category, start, end, text[start:end])
+            for start, end, category in self._automaton.find(_lower(text))
+        ]
+        matches.extend(find_pii(text))
+        matches.sort(key=lambda match: (match.start, -match.end))
+        return matches
 
     def check(self, text: str) -> tuple[bool, str, str]:
         """
         Checks text for safety violations.
         Returns: (is_safe, reason, sanitized_text)
         """
-        # Normalize text for checking
-        text_lower = text.lower()
-        
-        # Check profanity
-        words = text_lower.split()
-        for word in words:
-            # Remove common punctuation from word
-            clean_word = word.strip('.,!?;:"\'-')
-            if clean_word in self.profanity_list:
-                return False, f"Profanity detected: '{word}'", text
-
-        # Check PII (use original text for regex)
-        if self.email_pattern.search(text):
-            return False, "PII (Email) detected", text
-        
-        if self.phone_pattern.search(text):
-            return False, "PII (Phone) detected", text
-
-        return True, "", text
-
-safety_filter = SafetyFilter()
+        matches = self.scan(text)
+        if not matches:
+            return True, "", text
+        return False, describe(matches[0]), text
+
+    def stream_scanner(self, action: str = "redact", window: int = 48) -> "StreamScanner":
+        """A scanner for one streamed response; see StreamScanner."""
+        self._maybe_reload()
+        self.output_streams += 1
+        return StreamScanner(self, action=action, window=window)
+
+    def stats(self):
+        automaton = self._automaton
+        return {
+            "lexicon_files": list(self._signature or {}),
+            "terms": automaton.terms,
+            "states": automaton.states,
+            "build_ms": self.build_ms,
+            "reloads": self.reloads,
+            "reload_interval_s": self.reload_interval,
+            "pii_detectors": list(PII_LABELS),
+            "scans": self.scans,
+            "matches": self.matches,
+            "output_streams": self.output_streams,
+            "output_redactions": self.output_redactions,
+            "output_cuts": self.output_cuts,
+        }
+
+class StreamScanner:
+    """
+    Screens generated text while it streams.
+
+    Each chunk is scanned together with a short window of text already released,
+    so a match spanning a chunk boundary is still found without rescanning the
+    whole response. The last `window` characters are held back until more text
+    (or finish()) shows whether they start a match, so nothing that is later
+    matched has been sent yet. With action "redact" matches are replaced by
+    REDACTION; with "cut" the stream stops before the first match.
+    """
+
+    def __init__(self, safety: SafetyFilter, action: str = "redact", window: int = 48):
+        if action not in OUTPUT_ACTIONS:
+            raise ValueError(f"Unknown output safety action: {action}")
+        self.safety = safety
+        self.action = action
+        self.window = window
+        self._context = ""  # Tail of the released text
+        self._pending = ""  # Scanned but not yet released
+        self.stopped = False
+        self.reason = ""
+        self.redactions = 0
+
+    def feed(self, chunk: str) -> str:
+        """Add generated text; returns the text that is safe to send now (possibly empty)."""
+        if self.stopped:
+            return ""
+        self._pending += chunk
+        return self._advance(final=False)
+
+    def finish(self) -> str:
+        """Release whatever is still held back once generation has ended."""
+        if self.stopped:
+            return ""
+        return self._advance(final=True)
+
+    def _advance(self, final: bool) -> str:
+        offset = len(self._context)
+        text = self._context + self._pending
+        hits = []
+        for match in self.safety._find(text):
+            if match.end <= offset:
+                continue  # Entirely in released text, already dealt with
+            if not final and match.end == len(text):
+                continue  # May still grow with the next chunk ("hell" -> "hello")
+            hits.append(match)
+
+        if hits and self.action == "cut":
+            self.stopped = True
+            self.reason = describe(hits[0])
+            self.safety.output_cuts += 1
+            return self._release(max(0, hits[0].start - offset))
+
+        if hits:
+            # Rewrite right to left so earlier offsets stay valid; a match that started
+            # in released text only has its unreleased part replaced
+            spans = []
+            for match in hits:
+                start = max(match.start, offset) - offset
+                if spans and start < spans[-1][1]:
+                    spans[-1][1] = max(spans[-1][1], match.end - offset)
+                else:
+                    spans.append([start, match.end - offset])
+            for start, end in reversed(spans):
+                self._pending = self._pending[:start] + REDACTION + self._pending[end:]
+            self.redactions += len(hits)
+            self.safety.output_redactions += len(hits)
+
+        if final:
+            return self._release(len(self._pending))
+        return self._release(max(0, len(self._pending) - self.window))
+
+    def _release(self, upto: int) -> str:
+        released, self._pending = self._pending[:upto], self._pending[upto:]
+        context = self._context + released
+        if len(context) > self.window:
+            # Keep whole words only, so a cut-off word is not mistaken for a lexicon term
+            context = context[-self.window:]
+            space = WHITESPACE.search(context)
+            context = context[space.start():] if space else ""
+        self._context = context
+        return released
+
+def describe(match: SafetyMatch) -> str:
+    if match.kind == "pii":
+        return f"PII ({PII_LABELS[match.category]}) detected"
+    return f"{match.category.replace('_', ' ').capitalize()} detected: '{match.text}'"
+
+safety_filter = SafetyFilter(
+    lexicon_paths=config_manager.get("safety_lexicon_paths", []),
+    reload_interval=config_manager.get("safety_reload_interval_s", 5.0),
+)
@@ -0,0 +1,161 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from backend.config import config_manager
+
+class QueueFullError(Exception):
+    pass
+
+class Ticket:
+    def __init__(self, ticket_id: int, session_key: str):
+        self.id = ticket_id
+        self.session_key = session_key
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self.future = asyncio.get_running_loop().create_future()
+        self.released = False
+
+    @property
+    def granted(self) -> bool:
+        return self.started_at is not None
+
+    @property
+    def wait_ms(self) -> float:
+        end = self.started_at or time.time()
+        return (end - self.enqueued_at) * 1000
+
+class InferenceScheduler:
+    """
+    Admits inference requests up to max_concurrency at a time.
+    Waiting requests are kept in a bounded queue and granted round-robin across
+    sessions, so one chatty session cannot starve the others.
+    """
+
+    def __init__(self, max_concurrency: int = 1, max_queue: int = 32, report_interval: float = 1.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.report_interval = report_interval
+        self._ids = itertools.count(1)
+        self._queues = OrderedDict()  # session_key -> deque of waiting tickets, in round-robin order
+        self._waiting = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_wait_ms = 0.0
+
+    def submit(self, session_key: str = None) -> Ticket:
+        """Register a request, raising QueueFullError if it would have to wait in a full queue."""
+        ticket_id = next(self._ids)
+        ticket = Ticket(ticket_id, session_key or f"_anonymous:{ticket_id}")
+        if self._running < self.max_concurrency and self._waiting == 0:
+            self._grant(ticket)
+            return ticket
+        self.check_capacity()
+        self._queues.setdefault(ticket.session_key, deque()).append(ticket)
+        self._waiting += 1
+        return ticket
+
+    def check_capacity(self):
+        """Raise QueueFullError if a request submitted now would be rejected."""
+        if self._running < self.max_concurrency and self._waiting == 0:
+            return
+        if self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError("Inference queue is full")
+
+    async def wait(self, ticket: Ticket):
+        """Yield queue status until the ticket is granted, then a final status with position 0."""
+        last_position = None
+        while not ticket.granted:
+            position = self.position(ticket)
+            if position != last_position:
+                last_position = position
+                yield {"position": position, "wait_ms": round(ticket.wait_ms, 2)}
+            try:
+                await asyncio.wait_for(asyncio.shield(ticket.future), timeout=self.report_interval)
+            except asyncio.TimeoutError:
+                pass
+        yield {"position": 0, "wait_ms": round(ticket.wait_ms, 2)}
+
+    def release(self, ticket: Ticket):
+        """Give up a ticket, whether it is still waiting or has finished running."""
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.granted:
+            self._running -= 1
+            self.completed += 1
+        else:
+            queue = self._queues.get(ticket.session_key)
+            if queue and ticket in queue:
+                queue.remove(ticket)
+                self._waiting -= 1
+                if not queue:
+                    del self._queues[ticket.session_key]
+        self._dispatch()
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based position the ticket would be granted at under the current round-robin order."""
+        queue = self._queues.get(ticket.session_key)
+        if not queue or ticket not in queue:
+            return 0
+        depth = queue.index(ticket)
+        ahead = 0
+        for session_key, other in self._queues.items():
+            if session_key == ticket.session_key:
+                ahead += depth
+            else:
+                # Sessions earlier in the rotation get one more turn before ours at the same depth
+                ahead += min(len(other), depth + (1 if self._before(session_key, ticket.session_key) else 0))
+        return ahead + 1
+
+    def configure(self, max_concurrency: int = None, max_queue: int = None):
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        if max_queue is not None:
+            self.max_queue = max_queue
+        self._dispatch()
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": self._running,
+            "queued": self._waiting,
+            "queued_sessions": len(self._queues),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
+
+    def _before(self, session_key: str, other_key: str) -> bool:
+        for key in self._queues:
+            if key == session_key:
+                return True
+            if key == other_key:
+                return False
+        return False
+
+    def _dispatch(self):
+        while self._running < self.max_concurrency and self._queues:
+            session_key, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            self._waiting -= 1
+            # Rotate: the session goes to the back of the line for its next request
+            del self._queues[session_key]
+            if queue:
+                self._queues[session_key] = queue
+            self._grant(ticket)
+
+    def _grant(self, ticket: Ticket):
+        ticket.started_at = time.time()
+        self._running += 1
+        self.max_wait_ms = max(self.max_wait_ms, ticket.wait_ms)
+        if not ticket.future.done():
+            ticket.future.set_result(True)
+
+inference_scheduler = InferenceScheduler(
+    max_concurrency=config_manager.get("max_concurrent_inferences", 1),
+    max_queue=config_manager.get("max_queued_inferences", 32),
+)
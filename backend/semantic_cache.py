@@ -0,0 +1,219 @@
+import os
+import re
+import zlib
+import threading
+import numpy as np
+
+CONTRACTIONS = [
+    (re.compile(r"n't\b"), " not"),
+    (re.compile(r"'s\b"), " is"),
+    (re.compile(r"'re\b"), " are"),
+    (re.compile(r"'m\b"), " am"),
+    (re.compile(r"'ll\b"), " will"),
+    (re.compile(r"'ve\b"), " have"),
+    (re.compile(r"'d\b"), " would"),
+]
+PUNCTUATION = re.compile(r"[^\w\s]")
+
+def normalize_prompt(text: str) -> str:
+    """Lowercase, expand common contractions and drop punctuation so trivial rewordings embed alike."""
+    text = text.lower().replace("’", "'")
+    for pattern, replacement in CONTRACTIONS:
+        text = pattern.sub(replacement, text)
+    return " ".join(PUNCTUATION.sub(" ", text).split())
+
+class HashingEmbedder:
+    """Dependency-free embedder: hashed word unigrams/bigrams and character trigrams."""
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = text.split()
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        padded = f" {text} "
+        features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        return vector
+
+class LlamaEmbedder:
+    """Embeds prompts with a GGUF embedding model through llama-cpp-python."""
+
+    def __init__(self, model_path: str, n_threads: int = None):
+        from llama_cpp import Llama
+        self.llm = Llama(model_path=model_path, embedding=True, n_ctx=512, n_threads=n_threads or os.cpu_count(), verbose=False)
+
+    def embed(self, text: str) -> np.ndarray:
+        embedding = np.asarray(self.llm.create_embedding(text)["data"][0]["embedding"], dtype=np.float32)
+        # Models without a pooling layer return one vector per token
+        return embedding.mean(axis=0) if embedding.ndim == 2 else embedding
+
+class SemanticCache:
+    """
+    Nearest-neighbour index from prompt embeddings to response cache keys.
+    Vectors are L2-normalized rows of one NumPy matrix, so a lookup is a single
+    matrix-vector product; entries are partitioned by namespace (model and
+    sampling settings) so answers are only reused under the same conditions.
+    """
+
+    def __init__(self, embedder, index_path: str, threshold: float = 0.92, max_entries: int = 50000, save_every: int = 50):
+        self.embedder = embedder
+        self.index_path = index_path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._vectors = None  # (capacity, dim) float32
+        self._namespace_ids = None  # (capacity,) int32, row -> namespace id
+        self._size = 0
+        self._keys = []
+        self._namespaces = {}  # namespace -> id
+        self._dirty = 0
+        self.hits = 0
+        self.misses = 0
+        self._hit_similarity_total = 0.0
+        self._load()
+
+    def _embed(self, prompt: str) -> np.ndarray:
+        vector = np.asarray(self.embedder.embed(normalize_prompt(prompt)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, prompt: str, namespace: str):
+        """Return (cache_key, similarity) of the closest entry above threshold, or (None, best similarity)."""
+        query = self._embed(prompt)
+        with self._lock:
+            if self._size == 0 or query.shape[0] != self._vectors.shape[1]:
+                self.misses += 1
+                return None, 0.0
+            namespace_id = self._namespaces.get(namespace)
+            if namespace_id is None:
+                self.misses += 1
+                return None, 0.0
+            scores = self._vectors[:self._size] @ query
+            scores[self._namespace_ids[:self._size] != namespace_id] = -1.0
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None, similarity
+            self.hits += 1
+            self._hit_similarity_total += similarity
+            return self._keys[best], similarity
+
+    def add(self, prompt: str, namespace: str, cache_key: str):
+        vector = self._embed(prompt)
+        with self._lock:
+            if self._vectors is None or vector.shape[0] != self._vectors.shape[1]:
+                self._reset(vector.shape[0])
+            if self._size >= self.max_entries:
+                # Drop the oldest half rather than shifting the matrix on every insert
+                self._compact(np.arange(self.max_entries // 2, self._size))
+            if self._size == self._vectors.shape[0]:
+                grown = np.zeros((self._vectors.shape[0] * 2, self._vectors.shape[1]), dtype=np.float32)
+                grown[:self._size] = self._vectors[:self._size]
+                self._vectors = grown
+                self._namespace_ids = np.resize(self._namespace_ids, grown.shape[0])
+            self._vectors[self._size] = vector
+            self._namespace_ids[self._size] = self._namespaces.setdefault(namespace, len(self._namespaces))
+            self._keys.append(cache_key)
+            self._size += 1
+            self._dirty += 1
+            if self._dirty >= self.save_every:
+                self._save()
+
+    def discard(self, cache_key: str):
+        """Forget entries pointing at a response that is no longer cached."""
+        with self._lock:
+            keep = [i for i, key in enumerate(self._keys) if key != cache_key]
+            if len(keep) != self._size:
+                self._compact(np.asarray(keep, dtype=np.int64))
+                self._dirty += 1
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._namespace_ids = None
+            self._size = 0
+            self._keys = []
+            self._namespaces = {}
+            self._dirty = 0
+            try:
+                os.remove(self.index_path)
+            except OSError:
+                pass
+
+    def save(self):
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._size,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0,
+                "avg_hit_similarity": round(self._hit_similarity_total / self.hits, 4) if self.hits else 0.0,
+                "index_bytes": int(self._vectors.nbytes) if self._vectors is not None else 0,
+            }
+
+    def _reset(self, dim: int, capacity: int = 1024):
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._namespace_ids = np.zeros(capacity, dtype=np.int32)
+        self._size = 0
+        self._keys = []
+        self._namespaces = {}
+
+    def _compact(self, keep: np.ndarray):
+        kept = self._vectors[keep]
+        capacity = max(1024, len(keep) * 2)
+        self._vectors = np.zeros((capacity, self._vectors.shape[1]), dtype=np.float32)
+        self._vectors[:len(keep)] = kept
+        namespace_ids = self._namespace_ids[keep]
+        self._namespace_ids = np.zeros(capacity, dtype=np.int32)
+        self._namespace_ids[:len(keep)] = namespace_ids
+        self._keys = [self._keys[i] for i in keep]
+        self._size = len(keep)
+
+    def _save(self):
+        tmp_path = self.index_path + ".tmp.npz"
+        try:
+            names = np.asarray(sorted(self._namespaces, key=self._namespaces.get), dtype=str)
+            np.savez(
+                tmp_path,
+                vectors=self._vectors[:self._size],
+                keys=np.asarray(self._keys, dtype=str),
+                namespaces=names[self._namespace_ids[:self._size]] if len(names) else names,
+            )
+            os.replace(tmp_path, self.index_path)
+            self._dirty = 0
+        except Exception as e:
+            print(f"Error saving semantic index: {e}")
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with np.load(self.index_path) as data:
+                vectors = data["vectors"].astype(np.float32)
+                self._reset(vectors.shape[1], capacity=max(1024, len(vectors) * 2))
+                self._vectors[:len(vectors)] = vectors
+                self._keys = data["keys"].tolist()
+                names, namespace_ids = np.unique(data["namespaces"], return_inverse=True)
+                self._namespaces = {name: i for i, name in enumerate(names.tolist())}
+                self._namespace_ids[:len(vectors)] = namespace_ids
+                self._size = len(vectors)
+        except Exception as e:
+            print(f"Error loading semantic index: {e}")
+            self._vectors = None
+            self._namespace_ids = None
+            self._size = 0
+            self._keys = []
+            self._namespaces = {}
@@ -0,0 +1,149 @@
+import os
+import atexit
+import pickle
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache", "session_states")
+
+def _state_size(state) -> int:
+    """Approximate the in-memory footprint of a llama context snapshot."""
+    size = getattr(state, "llama_state_size", 0) or 0
+    for attr in ("input_ids", "scores"):
+        value = getattr(state, attr, None)
+        size += getattr(value, "nbytes", 0) or 0
+    if size == 0:
+        size = len(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+    return size
+
+class SessionStateStore:
+    """
+    LRU store of llama context snapshots keyed by session.
+    Snapshots are kept in RAM up to memory_budget bytes; the least recently used
+    ones spill to disk, which is bounded by disk_budget bytes.
+    """
+
+    def __init__(self, state_dir: str = None, memory_budget: int = 512 * 1024**2, disk_budget: int = 2048 * 1024**2):
+        # Each process (API server or inference worker) spills into its own directory
+        self.state_dir = state_dir or os.path.join(STATE_DIR, str(os.getpid()))
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (state, size)
+        self._disk = OrderedDict()  # key -> (path, size)
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # Snapshots from a previous process may belong to a different model, so start clean
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+        os.makedirs(self.state_dir, exist_ok=True)
+        atexit.register(shutil.rmtree, self.state_dir, True)
+
+    def _path_for(self, key) -> str:
+        return os.path.join(self.state_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".state")
+
+    def save(self, key, state):
+        size = _state_size(state)
+        with self._lock:
+            self._discard(key)
+            if size > self.memory_budget:
+                self._spill(key, state, size)
+                return
+            self._memory[key] = (state, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_budget:
+                old_key, (old_state, old_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= old_size
+                self._spill(old_key, old_state, old_size)
+
+    def load(self, key):
+        """Pop and return the snapshot for key, or None if it is not stored."""
+        with self._lock:
+            if key in self._memory:
+                state, size = self._memory.pop(key)
+                self._memory_bytes -= size
+                self.hits += 1
+                return state
+            if key in self._disk:
+                path, size = self._disk.pop(key)
+                self._disk_bytes -= size
+                try:
+                    with open(path, "rb") as f:
+                        state = pickle.load(f)
+                    self.hits += 1
+                    return state
+                except Exception as e:
+                    print(f"Error loading session state {key}: {e}")
+                finally:
+                    self._remove_file(path)
+            self.misses += 1
+            return None
+
+    def discard(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def discard_where(self, predicate):
+        """Drop every snapshot whose key matches predicate."""
+        with self._lock:
+            for key in [k for k in list(self._memory) + list(self._disk) if predicate(k)]:
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            for path, _ in self._disk.values():
+                self._remove_file(path)
+            self._memory.clear()
+            self._disk.clear()
+            self._memory_bytes = 0
+            self._disk_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_budget": self.memory_budget,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "disk_budget": self.disk_budget,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _discard(self, key):
+        if key in self._memory:
+            _, size = self._memory.pop(key)
+            self._memory_bytes -= size
+        if key in self._disk:
+            path, size = self._disk.pop(key)
+            self._disk_bytes -= size
+            self._remove_file(path)
+
+    def _spill(self, key, state, size: int):
+        if size > self.disk_budget:
+            return
+        while self._disk and self._disk_bytes + size > self.disk_budget:
+            _, (old_path, old_size) = self._disk.popitem(last=False)
+            self._disk_bytes -= old_size
+            self._remove_file(old_path)
+        path = self._path_for(key)
+        try:
+            with open(path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            print(f"Error spilling session state {key}: {e}")
+            self._remove_file(path)
+            return
+        self._disk[key] = (path, size)
+        self._disk_bytes += size
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,114 @@
+import abc
+import threading
+import numpy as np
+
+try:
+    from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+except ImportError:  # Only needed with the llama backend
+    LlamaDraftModel, LlamaPromptLookupDecoding = abc.ABC, None
+
+SPECULATIVE_MODES = ("off", "prompt_lookup", "draft")
+
+class SpeculativeDraft(LlamaDraftModel):
+    """
+    Base for draft models handed to Llama(draft_model=...).
+
+    Llama calls the draft after every verification step with the sequence so far.
+    The accepted length of the previous draft is inferred from how far that
+    sequence advanced: the accepted draft tokens plus the one token sampled by
+    the target model.
+    """
+
+    def __init__(self, num_pred_tokens: int = 10):
+        self.num_pred_tokens = num_pred_tokens
+        self._lock = threading.Lock()
+        self._last_length = None
+        self._last_drafted = 0
+        self.calls = 0
+        self.drafted = 0
+        self.accepted = 0
+
+    @abc.abstractmethod
+    def propose(self, input_ids: np.ndarray) -> np.ndarray:
+        """Up to num_pred_tokens tokens predicted to follow input_ids."""
+
+    def __call__(self, input_ids, /, **kwargs):
+        length = len(input_ids)
+        with self._lock:
+            if self._last_length is not None and self._last_length < length <= self._last_length + self._last_drafted + 1:
+                self.accepted += length - self._last_length - 1
+            elif self._last_length is not None:
+                # A new generation started; the previous draft's outcome is unknown
+                self.drafted -= self._last_drafted
+        draft = np.asarray(self.propose(input_ids), dtype=np.intc)[:self.num_pred_tokens]
+        with self._lock:
+            self.calls += 1
+            self.drafted += len(draft)
+            self._last_length = length
+            self._last_drafted = len(draft)
+        return draft
+
+    def stats(self):
+        with self._lock:
+            # The most recent draft has not been verified yet
+            drafted = self.drafted - self._last_drafted
+            return {
+                "calls": self.calls,
+                "drafted_tokens": drafted,
+                "accepted_tokens": self.accepted,
+                "acceptance_rate": round(self.accepted / drafted, 4) if drafted > 0 else 0.0,
+            }
+
+    def close(self):
+        pass
+
+class PromptLookupDraft(SpeculativeDraft):
+    """Drafts by copying what followed the last n-gram's earlier occurrence in the context."""
+
+    def __init__(self, num_pred_tokens: int = 10, max_ngram_size: int = 2):
+        super().__init__(num_pred_tokens)
+        self.max_ngram_size = max_ngram_size
+
+    def propose(self, input_ids):
+        return LlamaPromptLookupDecoding.find_candidate_pred_tokens(
+            input_ids=np.asarray(input_ids, dtype=np.intc),
+            max_ngram_size=self.max_ngram_size,
+            num_pred_tokens=self.num_pred_tokens,
+        )
+
+class DraftModelDraft(SpeculativeDraft):
+    """Drafts greedily with a smaller model sharing the target's vocabulary."""
+
+    def __init__(self, draft_llm, num_pred_tokens: int = 10):
+        super().__init__(num_pred_tokens)
+        self.llm = draft_llm
+
+    def propose(self, input_ids):
+        llm = self.llm
+        if llm is None:
+            return []  # Closed with its model; the target just decodes without a draft
+        draft = []
+        eos = llm.token_eos()
+        # generate() keeps the KV cache for the longest prefix shared with the previous call
+        for token in llm.generate([int(t) for t in input_ids], top_k=1, temp=0.0):
+            if token == eos:
+                break
+            draft.append(token)
+            if len(draft) >= self.num_pred_tokens:
+                break
+        return draft
+
+    def close(self):
+        self.llm = None
+
+def build_draft(settings: dict, load_draft_llm):
+    """Draft for a model's speculative settings, or None when speculation is off."""
+    mode = (settings or {}).get("mode", "off")
+    if mode not in SPECULATIVE_MODES:
+        raise ValueError(f"Unknown speculative mode: {mode}")
+    num_pred_tokens = settings.get("num_pred_tokens", 10) if settings else 10
+    if mode == "prompt_lookup":
+        return PromptLookupDraft(num_pred_tokens, settings.get("max_ngram_size", 2))
+    if mode == "draft":
+        return DraftModelDraft(load_draft_llm(settings["draft_model"]), num_pred_tokens)
+    return None
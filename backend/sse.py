@@ -0,0 +1,115 @@
+import time
+import json
+import asyncio
+from typing import AsyncIterator, Optional
+
+try:
+    import orjson
+except ImportError:  # Falls back to the standard library encoder
+    orjson = None
+
+STREAM_FORMATS = ("json", "text")
+
+def dumps(payload) -> str:
+    if orjson is not None:
+        return orjson.dumps(payload).decode("utf-8")
+    return json.dumps(payload, separators=(",", ":"))
+
+def event(payload) -> str:
+    """One SSE frame carrying a JSON payload."""
+    return f"data: {dumps(payload)}\n\n"
+
+DONE = "data: [DONE]\n\n"
+
+class SSEWriter:
+    """
+    Coalesces streamed token deltas into SSE frames.
+
+    Text is buffered until flush_bytes have accumulated or flush_ms have passed
+    since the first buffered delta, then sent as one frame. With both set to 0
+    every delta gets its own frame. Format "json" sends {"content": ..., "tokens": n}
+    payloads (what the web UI reads), n being the number of deltas coalesced;
+    "text" sends the raw text as a `token` event, split into data lines, which
+    skips JSON encoding and escaping altogether.
+    """
+
+    def __init__(self, flush_ms: float = 20, flush_bytes: int = 64, format: str = "json", clock=time.monotonic):
+        if format not in STREAM_FORMATS:
+            raise ValueError(f"Unknown stream format: {format}")
+        self.flush_ms = flush_ms
+        self.flush_bytes = flush_bytes
+        self.format = format
+        self._clock = clock
+        self._parts = []
+        self._size = 0
+        self._first_at = None
+        self.deltas = 0
+        self.frames = 0
+        self.bytes = 0
+
+    def add(self, text: str) -> Optional[str]:
+        """Buffer a delta; returns a frame when the flush threshold is reached."""
+        if not text:
+            return None
+        self.deltas += 1
+        self._parts.append(text)
+        self._size += len(text)
+        if self._first_at is None:
+            self._first_at = self._clock()
+        if self._size >= self.flush_bytes or self.time_to_flush() == 0:
+            return self.flush()
+        return None
+
+    def time_to_flush(self) -> Optional[float]:
+        """Seconds until buffered text is due, or None when nothing is buffered."""
+        if self._first_at is None:
+            return None
+        return max(0.0, self._first_at + self.flush_ms / 1000 - self._clock())
+
+    def flush(self) -> Optional[str]:
+        if not self._parts:
+            return None
+        text = "".join(self._parts)
+        tokens = len(self._parts)
+        self._parts, self._size, self._first_at = [], 0, None
+        if self.format == "text":
+            frame = "event: token\n" + "".join(f"data: {line}\n" for line in text.split("\n")) + "\n"
+        else:
+            frame = event({"content": text, "tokens": tokens})
+        self.frames += 1
+        self.bytes += len(frame)
+        return frame
+
+    def event(self, payload) -> str:
+        """A control frame, preceded by any buffered text so ordering is kept."""
+        frame = event(payload)
+        pending = self.flush()
+        return pending + frame if pending else frame
+
+    def stats(self):
+        return {"deltas": self.deltas, "frames": self.frames, "bytes": self.bytes}
+
+async def with_deadline(chunks: AsyncIterator, writer: SSEWriter) -> AsyncIterator:
+    """
+    Items from chunks, plus None whenever the writer's buffered text comes due
+    before the next item arrives, so a slow token does not hold back earlier ones.
+    """
+    iterator = chunks.__aiter__()
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=writer.time_to_flush())
+            if not done:
+                yield None
+                continue
+            task, pending = pending, None
+            try:
+                item = task.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        if pending is not None:
+            pending.cancel()
@@ -0,0 +1,81 @@
+import time
+import hashlib
+
+class StubState:
+    def __init__(self, input_ids: list):
+        self.input_ids = list(input_ids)
+        self.llama_state_size = 4 * len(self.input_ids)
+
+class StubLlama:
+    """
+    Deterministic stand-in for llama_cpp.Llama, used when model_backend is "stub".
+    It tokenizes bytes, "prefills" only the part of the prompt that differs from
+    its current context, and streams back a reply derived from the last message,
+    so the rest of the stack can run without model files or llama-cpp-python.
+    """
+
+    def __init__(self, model_path: str = None, n_ctx: int = 2048, token_delay: float = 0.0, prefill_delay: float = 0.0, reply_tokens: int = 32, **kwargs):
+        self.model_path = model_path
+        self._n_ctx = n_ctx
+        self.token_delay = token_delay
+        self.prefill_delay = prefill_delay
+        self.reply_tokens = reply_tokens
+        self._input_ids = []
+        self.prefilled_tokens = 0
+
+    def n_ctx(self) -> int:
+        return self._n_ctx
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> list:
+        if isinstance(text, str):
+            text = text.encode("utf-8")
+        return list(text)
+
+    def detokenize(self, tokens: list) -> bytes:
+        return bytes(tokens)
+
+    def save_state(self) -> StubState:
+        return StubState(self._input_ids)
+
+    def load_state(self, state: StubState):
+        self._input_ids = list(state.input_ids)
+
+    def reset(self):
+        self._input_ids = []
+
+    def _prefill(self, messages: list):
+        prompt = "".join(f"<|{m['role']}|>{m['content']}" for m in messages)
+        tokens = self.tokenize(prompt)
+        common = 0
+        for cached, new in zip(self._input_ids, tokens):
+            if cached != new:
+                break
+            common += 1
+        new_tokens = len(tokens) - common
+        self.prefilled_tokens += new_tokens
+        if self.prefill_delay:
+            time.sleep(self.prefill_delay * new_tokens)
+        self._input_ids = tokens
+
+    def _reply(self, messages: list, max_tokens: int) -> list:
+        last = messages[-1]["content"] if messages else ""
+        digest = hashlib.sha1(last.encode("utf-8")).hexdigest()
+        words = [f"stub-{digest[i:i + 4]}" for i in range(0, 40, 4)]
+        count = min(self.reply_tokens, max_tokens or self.reply_tokens)
+        return [words[i % len(words)] + " " for i in range(count)]
+
+    def create_chat_completion(self, messages: list, temperature: float = 0.7, top_p: float = 0.9, max_tokens: int = 256, stream: bool = False, **kwargs):
+        self._prefill(messages)
+        pieces = self._reply(messages, max_tokens)
+        if not stream:
+            return {"choices": [{"message": {"role": "assistant", "content": "".join(pieces).strip()}}]}
+
+        def generator():
+            yield {"choices": [{"delta": {"role": "assistant"}}]}
+            for piece in pieces:
+                if self.token_delay:
+                    time.sleep(self.token_delay)
+                yield {"choices": [{"delta": {"content": piece}}]}
+            yield {"choices": [{"delta": {}, "finish_reason": "stop"}]}
+
+        return generator()
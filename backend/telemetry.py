@@ -1,60 +1,244 @@
 import time
-from collections import deque
+import bisect
 import threading
+from collections import defaultdict
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TTFT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ITL_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a binary search and an increment."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+class WindowedCounter:
+    """Count and sum of events over a sliding window, kept in one-second slots."""
+
+    def __init__(self, window: int = 60):
+        self.window = window
+        self._seconds = [0] * window
+        self._counts = [0] * window
+        self._sums = [0.0] * window
+
+    def _slot(self, now: int) -> int:
+        slot = now % self.window
+        if self._seconds[slot] != now:
+            self._seconds[slot] = now
+            self._counts[slot] = 0
+            self._sums[slot] = 0.0
+        return slot
+
+    def add(self, count: int = 1, value: float = 0.0):
+        slot = self._slot(int(time.time()))
+        self._counts[slot] += count
+        self._sums[slot] += value
+
+    def totals(self):
+        now = int(time.time())
+        count, total = 0, 0.0
+        for second, slot_count, slot_sum in zip(self._seconds, self._counts, self._sums):
+            if now - second < self.window:
+                count += slot_count
+                total += slot_sum
+        return count, total
+
+    def rate(self) -> float:
+        return self.totals()[0] / self.window
 
 class TelemetryManager:
     def __init__(self):
         self._lock = threading.Lock()
-        self.request_timestamps = deque(maxlen=1000)  # For QPS calculation
-        self.latencies = deque(maxlen=100)
         self.total_requests = 0
         self.cache_hits = 0
         self.blocked_requests = 0
         self.total_tokens = 0
+        self.requests_window = WindowedCounter()  # For QPS
+        self.latency_window = WindowedCounter()  # For recent average latency
+        self.tokens_window = WindowedCounter()
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.ttft = Histogram(TTFT_BUCKETS)
+        self.itl = Histogram(ITL_BUCKETS)
+        self.model_requests = defaultdict(int)
+        self.model_tokens = defaultdict(int)
+        self.model_cache_hits = defaultdict(int)
+        self.route_requests = defaultdict(int)  # (method, route, status) -> count
+        self.route_seconds = defaultdict(float)  # (method, route) -> total time to response start
+        self.decode = {}  # (model, speculative mode) -> [tokens, seconds]
         self.start_time = time.time()
 
     def record_request(self):
         with self._lock:
             self.total_requests += 1
-            self.request_timestamps.append(time.time())
+            self.requests_window.add()
+
+    def record_model_request(self, model):
+        with self._lock:
+            self.model_requests[model] += 1
 
     def record_latency(self, latency_ms):
         with self._lock:
-            self.latencies.append(latency_ms)
+            self.latency.observe(latency_ms / 1000)
+            self.latency_window.add(1, latency_ms)
+
+    def record_ttft(self, ttft_ms):
+        with self._lock:
+            self.ttft.observe(ttft_ms / 1000)
 
-    def record_cache_hit(self):
+    def record_itl(self, itl_ms):
+        with self._lock:
+            self.itl.observe(itl_ms / 1000)
+
+    def record_cache_hit(self, model=None):
         with self._lock:
             self.cache_hits += 1
+            if model:
+                self.model_cache_hits[model] += 1
 
     def record_blocked(self):
         with self._lock:
             self.blocked_requests += 1
 
-    def record_tokens(self, count):
+    def record_tokens(self, count, model=None):
+        with self._lock:
+            self.total_tokens += count
+            self.tokens_window.add(count)
+            if model:
+                self.model_tokens[model] += count
+
+    def record_route(self, method, route, status, seconds):
+        with self._lock:
+            self.route_requests[(method, route, status)] += 1
+            self.route_seconds[(method, route)] += seconds
+
+    def record_decode(self, model, mode, tokens, seconds):
+        if tokens <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            totals = self.decode.setdefault((model, mode), [0, 0.0])
+            totals[0] += tokens
+            totals[1] += seconds
+
+    def decode_stats(self):
+        """Decode tokens/sec per model and speculative mode, with the gain over plain decoding."""
         with self._lock:
-            self.total_tokens += 1
+            stats = {}
+            for (model, mode), (tokens, seconds) in self.decode.items():
+                stats.setdefault(model, {})[mode] = {"tokens": tokens, "tokens_per_sec": round(tokens / seconds, 2)}
+            for modes in stats.values():
+                baseline = modes.get("off")
+                for mode, entry in modes.items():
+                    if mode != "off" and baseline:
+                        entry["speedup"] = round(entry["tokens_per_sec"] / baseline["tokens_per_sec"], 3)
+            return stats
 
     def get_stats(self):
+        decode = self.decode_stats()
         with self._lock:
             now = time.time()
-            # Calculate QPS (requests in last 60 seconds)
-            recent_requests = [t for t in self.request_timestamps if now - t <= 60]
-            qps = len(recent_requests) / 60.0 if recent_requests else 0.0
+            # Requests and average latency over the last 60 seconds
+            qps = self.requests_window.rate()
+            latency_count, latency_sum = self.latency_window.totals()
+            avg_latency = latency_sum / latency_count if latency_count else 0
 
-            avg_latency = sum(self.latencies) / len(self.latencies) if self.latencies else 0
-            
             hit_ratio = (self.cache_hits / self.total_requests * 100) if self.total_requests > 0 else 0
-            
+
             uptime = now - self.start_time
             tokens_per_sec = self.total_tokens / uptime if uptime > 0 else 0
 
             return {
                 "qps": round(qps, 2),
                 "avg_latency_ms": round(avg_latency, 2),
+                "p50_latency_ms": round(self.latency.quantile(0.5) * 1000, 2),
+                "p95_latency_ms": round(self.latency.quantile(0.95) * 1000, 2),
+                "p95_ttft_ms": round(self.ttft.quantile(0.95) * 1000, 2),
+                "p95_itl_ms": round(self.itl.quantile(0.95) * 1000, 2),
                 "cache_hit_ratio": round(hit_ratio, 2),
                 "blocked_requests": self.blocked_requests,
                 "total_requests": self.total_requests,
-                "tokens_per_sec": round(tokens_per_sec, 2)
+                "tokens_per_sec": round(tokens_per_sec, 2),
+                "recent_tokens_per_sec": round(self.tokens_window.rate(), 2),
+                "decode": decode
             }
 
+    def render_prometheus(self, gauges: dict = None, counters: dict = None) -> str:
+        """All metrics in the Prometheus text exposition format. gauges and counters map name -> (help, value)."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        def histogram(name, help_text, hist):
+            samples = []
+            cumulative = 0
+            for bound, count in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                cumulative += count
+                samples.append(({"le": bound}, cumulative))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, value in samples:
+                lines.append(f'{name}_bucket{{le="{labels["le"]}"}} {value}')
+            lines.append(f"{name}_sum {hist.sum}")
+            lines.append(f"{name}_count {hist.count}")
+
+        decode = self.decode_stats()
+        with self._lock:
+            metric("pocketllm_requests_total", "counter", "Chat completion requests", [({}, self.total_requests)])
+            metric("pocketllm_blocked_requests_total", "counter", "Requests rejected by the safety filter", [({}, self.blocked_requests)])
+            metric("pocketllm_cache_hits_total", "counter", "Requests answered from the response cache", [({}, self.cache_hits)])
+            metric("pocketllm_tokens_total", "counter", "Generated tokens", [({}, self.total_tokens)])
+            metric("pocketllm_requests_per_second", "gauge", "Chat requests per second over the last minute", [({}, round(self.requests_window.rate(), 4))])
+            metric("pocketllm_tokens_per_second", "gauge", "Generated tokens per second over the last minute", [({}, round(self.tokens_window.rate(), 4))])
+            metric("pocketllm_model_requests_total", "counter", "Chat requests per model",
+                   [({"model": model}, count) for model, count in sorted(self.model_requests.items())])
+            metric("pocketllm_model_tokens_total", "counter", "Generated tokens per model",
+                   [({"model": model}, count) for model, count in sorted(self.model_tokens.items())])
+            metric("pocketllm_model_cache_hits_total", "counter", "Cache hits per model",
+                   [({"model": model}, count) for model, count in sorted(self.model_cache_hits.items())])
+            metric("pocketllm_http_requests_total", "counter", "HTTP requests per route and status",
+                   [({"method": m, "route": r, "status": s}, count) for (m, r, s), count in sorted(self.route_requests.items())])
+            metric("pocketllm_http_response_start_seconds_total", "counter", "Time until the response started, per route",
+                   [({"method": m, "route": r}, round(total, 6)) for (m, r), total in sorted(self.route_seconds.items())])
+            histogram("pocketllm_request_latency_seconds", "End-to-end chat completion latency", self.latency)
+            histogram("pocketllm_time_to_first_token_seconds", "Time from request to first generated token", self.ttft)
+            histogram("pocketllm_inter_token_seconds", "Gap between consecutive generated tokens", self.itl)
+        metric("pocketllm_decode_tokens_per_second", "gauge", "Decode throughput per model and speculative mode",
+               [({"model": model, "mode": mode}, entry["tokens_per_sec"]) for model, modes in sorted(decode.items()) for mode, entry in sorted(modes.items())])
+        for name, (help_text, value) in (gauges or {}).items():
+            metric(name, "gauge", help_text, [({}, value)])
+        for name, (help_text, value) in (counters or {}).items():
+            metric(name, "counter", help_text, [({}, value)])
+        return "\n".join(lines) + "\n"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
 telemetry_manager = TelemetryManager()
@@ -0,0 +1,126 @@
+import json
+import time
+import uuid
+import threading
+from collections import deque
+from contextlib import contextmanager
+from backend.config import config_manager
+
+class Trace:
+    """Timeline of one request: named stage spans, offsets in ms from the start of the request."""
+
+    def __init__(self, name: str, request_id: str = None, **attrs):
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.attrs = dict(attrs)
+        self.spans = []
+        self.duration_ms = None
+        self.status = None
+
+    def _offset_ms(self, at: float) -> float:
+        return round((at - self._start) * 1000, 3)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        start = time.perf_counter()
+        span = dict(attrs)
+        try:
+            yield span
+        finally:
+            self.add_span(name, start, time.perf_counter(), **span)
+
+    def add_span(self, name: str, start: float, end: float, **attrs):
+        """Record a stage from two time.perf_counter() readings."""
+        self.spans.append({
+            "name": name,
+            "start_ms": self._offset_ms(start),
+            "duration_ms": round((end - start) * 1000, 3),
+            **attrs,
+        })
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, status="ok"):
+        if self.duration_ms is None:
+            self.duration_ms = self._offset_ms(time.perf_counter())
+            self.status = status
+            tracer.record(self)
+
+    def to_dict(self):
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attrs": self.attrs,
+            "spans": self.spans,
+        }
+
+class Tracer:
+    """Keeps the most recent finished traces in a ring, optionally appending each one to a JSONL file."""
+
+    def __init__(self, capacity: int = 500, jsonl_path: str = None):
+        self._lock = threading.Lock()
+        self._traces = deque(maxlen=capacity)
+        self.jsonl_path = jsonl_path
+        self.recorded = 0
+
+    def start(self, name: str, **attrs) -> Trace:
+        return Trace(name, **attrs)
+
+    def record(self, trace: Trace):
+        if not config_manager.get("tracing_enabled", True):
+            return
+        entry = trace.to_dict()
+        with self._lock:
+            self._traces.append(entry)
+            self.recorded += 1
+            if self.jsonl_path:
+                try:
+                    with open(self.jsonl_path, "a") as f:
+                        f.write(json.dumps(entry) + "\n")
+                except OSError as e:
+                    print(f"Error writing trace: {e}")
+
+    def configure(self, capacity: int = None, jsonl_path: str = None):
+        with self._lock:
+            if capacity is not None and capacity != self._traces.maxlen:
+                self._traces = deque(self._traces, maxlen=capacity)
+            self.jsonl_path = jsonl_path or None
+
+    def recent(self, limit: int = 50, min_duration_ms: float = None, session_id: str = None, status=None) -> list:
+        """Newest first, optionally only slow requests, one session's, or one status"""
+        with self._lock:
+            traces = list(self._traces)
+        result = []
+        for trace in reversed(traces):
+            if min_duration_ms is not None and (trace["duration_ms"] or 0) < min_duration_ms:
+                continue
+            if session_id is not None and trace["attrs"].get("session_id") != session_id:
+                continue
+            if status is not None and str(trace["status"]) != str(status):
+                continue
+            result.append(trace)
+            if len(result) >= limit:
+                break
+        return result
+
+    def get(self, request_id: str):
+        with self._lock:
+            for trace in reversed(self._traces):
+                if trace["request_id"] == request_id:
+                    return trace
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {"capacity": self._traces.maxlen, "buffered": len(self._traces), "recorded": self.recorded, "jsonl_path": self.jsonl_path}
+
+tracer = Tracer(
+    capacity=config_manager.get("trace_buffer_size", 500),
+    jsonl_path=config_manager.get("trace_jsonl_path", None),
+)
@@ -0,0 +1,329 @@
+import os
+import time
+import queue
+import itertools
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from typing import Generator
+from backend.config import config_manager
+from backend.model_service import model_service
+
+class WorkerError(Exception):
+    pass
+
+def _worker_main(conn, worker_id: int, n_threads: int):
+    """Entry point of an inference worker process: serve requests from the API process over a pipe."""
+    from backend.model_service import model_service as service
+    service.n_threads = n_threads
+    print(f"Inference worker {worker_id} started (pid {os.getpid()}, {n_threads} threads)")
+
+    pending = deque()
+    while True:
+        try:
+            message = pending.popleft() if pending else conn.recv()
+        except (EOFError, OSError):
+            break
+        op, request_id, payload = message
+        if op == "stop":
+            break
+        if op == "cancel":
+            continue
+        try:
+            if op == "chat":
+                cancelled = False
+                stats = {}
+                stream = service.stream_chat(**payload, stats=stats)
+                try:
+                    for chunk in stream:
+                        # Look for cancellations between tokens without blocking generation
+                        while conn.poll():
+                            incoming = conn.recv()
+                            if incoming[0] == "cancel" and incoming[1] == request_id:
+                                cancelled = True
+                            elif incoming[0] == "cancel":
+                                pending = deque(m for m in pending if m[1] != incoming[1])
+                            else:
+                                pending.append(incoming)
+                        if cancelled:
+                            break
+                        conn.send(("chunk", request_id, chunk))
+                finally:
+                    stream.close()
+                conn.send(("done", request_id, stats))
+            elif op == "title":
+                conn.send(("done", request_id, service.generate_title(payload)))
+            elif op == "set_model":
+                service.set_model(payload)
+                conn.send(("done", request_id, None))
+            elif op == "forget":
+                service.forget_session(payload)
+                conn.send(("done", request_id, None))
+            elif op == "speculative":
+                service.apply_speculative(*payload)
+                conn.send(("done", request_id, None))
+            elif op == "profile":
+                service.apply_profile(*payload)
+                conn.send(("done", request_id, None))
+            elif op == "speculative_stats":
+                conn.send(("done", request_id, service.speculative_stats()))
+        except Exception as e:
+            conn.send(("error", request_id, str(e)))
+
+class _Worker:
+    def __init__(self, worker_id: int, n_threads: int):
+        self.id = worker_id
+        self.n_threads = n_threads
+        self.process = None
+        self.conn = None
+        self.send_lock = threading.Lock()
+        self.inflight = 0
+        self.pinned_sessions = 0
+        self.completed = 0
+        self.pending = set()  # request ids awaiting a reply from this worker
+
+class WorkerPool:
+    """
+    Pool of inference worker processes, each with its own model and a share of the CPU threads.
+    Sessions are pinned to a worker so their KV state stays warm there; a session
+    is moved to the least loaded worker when its own has max_inflight requests running.
+    """
+
+    def __init__(self, num_workers: int = 0, threads_per_worker: int = None, max_inflight: int = 1, max_pinned_sessions: int = 10000):
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // max(1, num_workers))
+        self.max_inflight = max_inflight
+        self.max_pinned_sessions = max_pinned_sessions
+        self._ctx = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._workers = []
+        self._affinity = OrderedDict()  # session_id -> worker id, least recently used first
+        self._responses = {}  # request_id -> queue of (kind, value) replies
+        self._ids = itertools.count(1)
+        self._stopping = False
+        self.rebalanced = 0
+        self.restarts = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self):
+        self._stopping = False
+        self._workers = [_Worker(i, self.threads_per_worker) for i in range(self.num_workers)]
+        for worker in self._workers:
+            self._spawn(worker)
+
+    def stop(self):
+        self._stopping = True
+        for worker in self._workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(("stop", 0, None))
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._workers = []
+        self._affinity.clear()
+
+    def _spawn(self, worker: _Worker):
+        parent_conn, child_conn = self._ctx.Pipe()
+        worker.conn = parent_conn
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, worker.id, worker.n_threads),
+            name=f"inference-worker-{worker.id}",
+            daemon=True,
+        )
+        worker.process.start()
+        child_conn.close()
+        threading.Thread(target=self._read_loop, args=(worker, parent_conn), daemon=True).start()
+
+    def _read_loop(self, worker: _Worker, conn):
+        while True:
+            try:
+                kind, request_id, value = conn.recv()
+            except (EOFError, OSError):
+                break
+            responses = self._responses.get(request_id)
+            if responses is not None:
+                responses.put((kind, value))
+
+        # The worker exited; fail whatever it still owed and bring up a replacement
+        with self._lock:
+            orphaned = list(worker.pending)
+            worker.pending.clear()
+            worker.inflight -= len(orphaned)
+        for request_id in orphaned:
+            responses = self._responses.get(request_id)
+            if responses is not None:
+                responses.put(("error", f"Inference worker {worker.id} exited"))
+        if not self._stopping and conn is worker.conn:
+            print(f"Inference worker {worker.id} exited, restarting")
+            self.restarts += 1
+            time.sleep(1)  # Avoid a tight respawn loop if the worker cannot start at all
+            self._spawn(worker)
+
+    def _route(self, session_id: str = None) -> _Worker:
+        with self._lock:
+            least_loaded = min(self._workers, key=lambda w: (w.inflight, w.pinned_sessions))
+            if session_id is None:
+                return least_loaded
+
+            pinned_id = self._affinity.get(session_id)
+            if pinned_id is not None:
+                pinned = self._workers[pinned_id]
+                self._affinity.move_to_end(session_id)
+                if pinned.inflight < self.max_inflight or least_loaded.inflight >= pinned.inflight:
+                    return pinned
+                # Overloaded: move the session, giving up its warm KV state for lower latency
+                pinned.pinned_sessions -= 1
+                self.rebalanced += 1
+
+            self._affinity[session_id] = least_loaded.id
+            least_loaded.pinned_sessions += 1
+            while len(self._affinity) > self.max_pinned_sessions:
+                _, old_id = self._affinity.popitem(last=False)
+                self._workers[old_id].pinned_sessions -= 1
+            return least_loaded
+
+    def _submit(self, worker: _Worker, op: str, payload):
+        request_id = next(self._ids)
+        responses = queue.Queue()
+        self._responses[request_id] = responses
+        with self._lock:
+            worker.inflight += 1
+            worker.pending.add(request_id)
+        try:
+            with worker.send_lock:
+                worker.conn.send((op, request_id, payload))
+        except (OSError, ValueError) as e:
+            self._finish(worker, request_id)
+            raise WorkerError(f"Inference worker {worker.id} is unavailable: {e}")
+        return request_id, responses
+
+    def _finish(self, worker: _Worker, request_id: int, cancel: bool = False):
+        self._responses.pop(request_id, None)
+        with self._lock:
+            if request_id in worker.pending:
+                worker.pending.discard(request_id)
+                worker.inflight -= 1
+                worker.completed += 1
+            else:
+                cancel = False
+        if cancel:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(("cancel", request_id, None))
+            except (OSError, ValueError):
+                pass
+
+    def _call(self, worker: _Worker, op: str, payload):
+        request_id, responses = self._submit(worker, op, payload)
+        try:
+            kind, value = responses.get()
+        finally:
+            self._finish(worker, request_id)
+        if kind == "error":
+            raise WorkerError(value)
+        return value
+
+    def stream_chat(self, messages: list, temperature: float = 0.7, top_p: float = 0.9, max_tokens: int = 2048, system_prompt: str = None, session_id: str = None, model: str = None, stats: dict = None) -> Generator[str, None, None]:
+        worker = self._route(session_id)
+        if stats is not None:
+            stats["worker"] = worker.id
+        request_id, responses = self._submit(worker, "chat", {
+            "messages": messages,
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_tokens": max_tokens,
+            "system_prompt": system_prompt,
+            "session_id": session_id,
+            "model": model,
+        })
+        finished = False
+        try:
+            while True:
+                kind, value = responses.get()
+                if kind == "chunk":
+                    yield value
+                elif kind == "done":
+                    finished = True
+                    if stats is not None and value:
+                        stats.update(value)
+                    return
+                else:
+                    finished = True
+                    raise WorkerError(value)
+        finally:
+            self._finish(worker, request_id, cancel=not finished)
+
+    def generate_title(self, user_message: str) -> str:
+        return self._call(self._route(), "title", user_message)
+
+    def set_model(self, model_filename: str):
+        for worker in self._workers:
+            self._call(worker, "set_model", model_filename)
+
+    def forget_session(self, session_id: str):
+        with self._lock:
+            worker_id = self._affinity.pop(session_id, None)
+            if worker_id is not None:
+                self._workers[worker_id].pinned_sessions -= 1
+        if worker_id is not None:
+            self._call(self._workers[worker_id], "forget", session_id)
+
+    def apply_speculative(self, model_filename: str, settings: dict):
+        for worker in self._workers:
+            self._call(worker, "speculative", (model_filename, settings))
+
+    def apply_profile(self, model_filename: str, profile: dict):
+        for worker in self._workers:
+            self._call(worker, "profile", (model_filename, profile))
+
+    def speculative_stats(self) -> dict:
+        """Draft statistics summed over the workers"""
+        totals = {}
+        for worker in self._workers:
+            for model, stats in self._call(worker, "speculative_stats", None).items():
+                total = totals.setdefault(model, {"mode": stats["mode"], "calls": 0, "drafted_tokens": 0, "accepted_tokens": 0})
+                for field in ("calls", "drafted_tokens", "accepted_tokens"):
+                    total[field] += stats[field]
+        for total in totals.values():
+            total["acceptance_rate"] = round(total["accepted_tokens"] / total["drafted_tokens"], 4) if total["drafted_tokens"] else 0.0
+        return totals
+
+    def stats(self):
+        with self._lock:
+            return {
+                "num_workers": len(self._workers),
+                "threads_per_worker": self.threads_per_worker,
+                "max_inflight": self.max_inflight,
+                "pinned_sessions": len(self._affinity),
+                "rebalanced": self.rebalanced,
+                "restarts": self.restarts,
+                "workers": [
+                    {
+                        "id": w.id,
+                        "pid": w.process.pid if w.process else None,
+                        "alive": bool(w.process and w.process.is_alive()),
+                        "inflight": w.inflight,
+                        "pinned_sessions": w.pinned_sessions,
+                        "completed": w.completed,
+                    }
+                    for w in self._workers
+                ],
+            }
+
+worker_pool = WorkerPool(
+    num_workers=config_manager.get("inference_workers", 0),
+    threads_per_worker=config_manager.get("inference_worker_threads", None),
+    max_inflight=config_manager.get("inference_worker_max_inflight", 1),
+)
+
+def inference_backend():
+    """The worker pool when it is running, otherwise the in-process model service."""
+    return worker_pool if worker_pool.running else model_service
@@ -0,0 +1,178 @@
+import time
+import threading
+from collections import deque
+from typing import Callable
+
+DURABILITY_MODES = ("sync", "group", "batched")
+
+class _Commit(threading.Event):
+    """Set once a row's batch is done; error is set when the row could not be written."""
+    error = None
+
+class WriteBehindQueue:
+    """
+    Buffers rows and writes them in batches, one transaction per batch.
+
+    Durability modes:
+      sync     write and commit each row before returning (no batching)
+      group    return once the batch holding the row has committed (group commit)
+      batched  return immediately; rows are committed within flush_interval
+    Rows stay visible through pending() until their batch has committed.
+
+    A failing batch is retried max_retries times, then written a row at a time;
+    rows that still fail are logged and kept in dead_letters, so one bad row
+    cannot hold up the rest or keep flush() from returning.
+    """
+
+    def __init__(self, writer: Callable[[list], None], flush_count: int = 64, flush_interval: float = 0.05, durability: str = "batched",
+                 max_retries: int = 3, dead_letter_limit: int = 1000):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.writer = writer
+        self.flush_count = flush_count
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.max_retries = max_retries
+        self.dead_letters = deque(maxlen=dead_letter_limit)  # (row, error) of rows given up on
+        self._cond = threading.Condition()
+        self._buffer = deque()  # (row, enqueued_at, committed event or None)
+        self._inflight = []  # rows of the batch currently being written
+        self._thread = None
+        self._stopping = False
+        self.batches = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.dead_lettered = 0
+
+    def add(self, row: dict):
+        if self.durability == "sync":
+            self.writer([row])
+            self._count(batches=1, rows=1)
+            return
+        committed = _Commit() if self.durability == "group" else None
+        with self._cond:
+            self._ensure_started()
+            self._buffer.append((row, time.monotonic(), committed))
+            if len(self._buffer) >= self.flush_count:
+                self._cond.notify()
+        if committed is not None:
+            committed.wait()
+            if committed.error is not None:
+                raise committed.error
+
+    def pending(self, predicate: Callable[[dict], bool] = None) -> list:
+        """Rows not yet committed, oldest first, optionally filtered."""
+        with self._cond:
+            rows = list(self._inflight) + [row for row, _, _ in self._buffer]
+        return [row for row in rows if predicate is None or predicate(row)]
+
+    def flush(self):
+        """Write everything buffered so far before returning."""
+        while True:
+            with self._cond:
+                if not self._buffer and not self._inflight:
+                    return
+                if self._thread is None or not self._thread.is_alive():
+                    batch = self._take_batch(len(self._buffer))
+                else:
+                    batch = None
+                    self._cond.notify()
+            if batch is not None:
+                self._write(batch)
+            else:
+                time.sleep(self.flush_interval / 4)
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self._stopping = False
+
+    def stats(self):
+        with self._cond:
+            queued = len(self._buffer) + len(self._inflight)
+            batches, rows_written = self.batches, self.rows_written
+            failures, dead_lettered = self.failures, self.dead_lettered
+        return {
+            "durability": self.durability,
+            "queued": queued,
+            "batches": batches,
+            "rows_written": rows_written,
+            "avg_batch_size": round(rows_written / batches, 2) if batches else 0.0,
+            "failures": failures,
+            "dead_lettered": dead_lettered,
+        }
+
+    def _count(self, batches: int = 0, rows: int = 0, failures: int = 0, dead_lettered: int = 0):
+        # Rows are written by the writer thread and by request threads (sync mode, flush())
+        with self._cond:
+            self.batches += batches
+            self.rows_written += rows
+            self.failures += failures
+            self.dead_lettered += dead_lettered
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+            self._thread.start()
+
+    def _take_batch(self, limit: int) -> list:
+        batch = [self._buffer.popleft() for _ in range(min(limit, len(self._buffer)))]
+        self._inflight = [row for row, _, _ in batch]
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if len(self._buffer) >= self.flush_count:
+                        break
+                    if self._buffer:
+                        age = time.monotonic() - self._buffer[0][1]
+                        if age >= self.flush_interval:
+                            break
+                        self._cond.wait(self.flush_interval - age)
+                    else:
+                        self._cond.wait()
+                if self._stopping and not self._buffer:
+                    return
+                batch = self._take_batch(self.flush_count)
+            self._write(batch)
+
+    def _write(self, batch: list):
+        rows = [row for row, _, _ in batch]
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.writer(rows)
+            except Exception as e:
+                print(f"Error writing message batch (attempt {attempt + 1}): {e}")
+                self._count(failures=1)
+                if attempt < self.max_retries:
+                    time.sleep(self.flush_interval)
+            else:
+                self._count(batches=1, rows=len(rows))
+                self._done(batch)
+                return
+        # Still failing: write the rows one at a time so only the bad ones are lost
+        for row, _, committed in batch:
+            try:
+                self.writer([row])
+                self._count(batches=1, rows=1)
+            except Exception as e:
+                print(f"Dropping message {row.get('id')} for session {row.get('session_id')}: {e}")
+                self.dead_letters.append((row, str(e)))
+                self._count(dead_lettered=1)
+                if committed is not None:
+                    committed.error = e
+        self._done(batch)
+
+    def _done(self, batch: list):
+        with self._cond:
+            self._inflight = []
+        for _, _, committed in batch:
+            if committed is not None:
+                committed.set()
@@ -0,0 +1,118 @@
+"""
+Micro-benchmark for backend/database.py.
+
+Builds a throwaway database with many sessions and messages, then times the
+per-call latency of the functions used on the chat path.
+
+    python benchmarks/bench_database.py --sessions 100000 --messages 10000000
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import sqlite3
+import tempfile
+import statistics
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import database
+
+def populate(db_path: str, sessions: int, messages: int, batch: int = 50000):
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    conn.executemany("INSERT INTO sessions (id, title) VALUES (?, ?)", ((sid, "Benchmark chat") for sid in session_ids))
+    conn.commit()
+
+    roles = ("user", "assistant")
+    content = "lorem ipsum dolor sit amet " * 4
+    token_count = database.estimate_tokens(content)
+    # Per-session counters, kept as add_message would so the session_stats reads have real rows
+    counts = [[0, 0] for _ in range(sessions)]
+    written = 0
+    while written < messages:
+        count = min(batch, messages - written)
+        rows = []
+        for i in range(count):
+            n = written + i
+            role = (n // sessions) % 2
+            counts[n % sessions][role] += 1
+            rows.append((str(uuid.uuid4()), session_ids[n % sessions], roles[role], content, token_count))
+        conn.executemany("INSERT INTO messages (id, session_id, role, content, token_count) VALUES (?, ?, ?, ?, ?)", rows)
+        conn.commit()
+        written += count
+        print(f"\r  {written:,}/{messages:,} messages", end="", flush=True)
+    print()
+    conn.executemany(
+        "INSERT INTO session_stats (session_id, user_messages, assistant_messages, user_tokens, assistant_tokens, last_activity) "
+        "VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+        ((sid, users, assistants, users * token_count, assistants * token_count)
+         for sid, (users, assistants) in zip(session_ids, counts) if users or assistants),
+    )
+    conn.commit()
+    conn.close()
+    return session_ids
+
+def message_row(session_id: str, content: str = "benchmark message") -> dict:
+    """A row as database.add_message builds it, for timing the insert itself."""
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": session_id,
+        "role": "user",
+        "content": content,
+        "token_count": database.estimate_tokens(content),
+        "created_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+def measure(name: str, fn, iterations: int):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p50 = statistics.median(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"{name:<24} p50 {p50:8.3f} ms   p95 {p95:8.3f} ms   p99 {p99:8.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--messages", type=int, default=10000000)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--db", help="Reuse an existing benchmark database instead of building one")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="pocketllm-bench-"), "chat.db")
+    database.DB_PATH = db_path
+    fresh = not os.path.exists(db_path)
+    database.init_db()
+    if fresh:
+        print(f"Populating {db_path} with {args.sessions:,} sessions and {args.messages:,} messages")
+        session_ids = populate(db_path, args.sessions, args.messages)
+    else:
+        with database.get_db_connection() as conn:
+            session_ids = [row[0] for row in conn.execute("SELECT id FROM sessions")]
+    print(f"Database size: {os.path.getsize(db_path) / 1024**2:,.1f} MB\n")
+
+    rng = random.Random(0)
+    measure("get_messages", lambda: database.get_messages(rng.choice(session_ids)), args.iterations)
+    measure("get_messages_page", lambda: database.get_messages_page(rng.choice(session_ids), limit=50), args.iterations)
+    measure("get_session_stats", lambda: database.get_session_stats(rng.choice(session_ids)), args.iterations)
+    measure("get_sessions (page)", lambda: database.get_sessions(limit=50), args.iterations)
+    measure("get_sessions (cursor)", lambda: database.get_sessions(before=rng.choice(session_ids), limit=50), args.iterations)
+    # add_message only enqueues for the write-behind queue; time the insert and commit separately
+    measure("add_message (enqueue)", lambda: database.add_message(rng.choice(session_ids), "user", "benchmark message"), args.iterations)
+    database.message_writer.flush()
+    measure("insert_message (commit)", lambda: database._insert_messages([message_row(rng.choice(session_ids))]), args.iterations)
+    measure("create_session", lambda: database.create_session("Benchmark chat"), args.iterations)
+    measure("update_session_title", lambda: database.update_session_title(rng.choice(session_ids), "Renamed"), args.iterations)
+
+if __name__ == "__main__":
+    main()
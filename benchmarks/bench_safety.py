@@ -0,0 +1,98 @@
+"""
+Throughput benchmark for the safety filter in backend/safety.py.
+
+Builds synthetic lexicons of increasing size (single words and multi-word
+phrases), compiles each into the filter, and scans the same set of chat-sized
+messages with it. Scan time should stay roughly flat as the lexicon grows.
+
+    python benchmarks/bench_safety.py --sizes 10 1000 10000 100000 --messages 5000
+    python benchmarks/bench_safety.py --lexicon my_terms.txt
+"""
+import os
+import sys
+import time
+import random
+import string
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.safety import SafetyFilter
+
+FILLER = ("the quick brown fox jumps over a lazy dog while we discuss databases, "
+          "compilers and gardening in some detail before lunch").split()
+
+PII_SAMPLES = ["jane.doe@example.com", "555-123-4567", "4111 1111 1111 1111", "GB82 WEST 1234 5698 7654 32", "192.168.10.4", "123-45-6789"]
+
+def random_word(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+
+def write_lexicon(path: str, size: int, rng: random.Random):
+    with open(path, "w") as f:
+        for i in range(size):
+            # One in five entries is a phrase
+            words = rng.randint(2, 3) if i % 5 == 0 else 1
+            f.write(" ".join(random_word(rng) for _ in range(words)) + "\n")
+
+def make_messages(count: int, words: int, rng: random.Random, pii_ratio: float) -> list:
+    messages = []
+    for _ in range(count):
+        text = [rng.choice(FILLER) for _ in range(words)]
+        if rng.random() < pii_ratio:
+            text.insert(rng.randrange(len(text)), rng.choice(PII_SAMPLES))
+        messages.append(" ".join(text))
+    return messages
+
+def run(safety: SafetyFilter, messages: list, rounds: int) -> dict:
+    chars = sum(len(m) for m in messages)
+    timings = []
+    flagged = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        flagged = sum(1 for m in messages if not safety.check(m)[0])
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {
+        "messages_per_sec": round(len(messages) / best),
+        "mb_per_sec": round(chars / best / 1e6, 2),
+        "us_per_message": round(best / len(messages) * 1e6, 1),
+        "median_s": round(statistics.median(timings), 4),
+        "flagged": flagged,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000, 100000], help="Synthetic lexicon sizes (terms)")
+    parser.add_argument("--lexicon", nargs="*", default=[], help="Benchmark these lexicon files instead of synthetic ones")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--words", type=int, default=60, help="Words per message")
+    parser.add_argument("--pii-ratio", type=float, default=0.05, help="Share of messages containing PII")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    messages = make_messages(args.messages, args.words, rng, args.pii_ratio)
+    print(f"{len(messages)} messages, {sum(len(m) for m in messages) / 1e6:.2f} MB per round")
+    print(f"{'terms':>8} {'states':>9} {'build ms':>10} {'msgs/s':>9} {'MB/s':>7} {'us/msg':>8} {'flagged':>8}")
+
+    def report(safety):
+        stats = safety.stats()
+        result = run(safety, messages, args.rounds)
+        print(f"{stats['terms']:>8} {stats['states']:>9} {stats['build_ms']:>10} {result['messages_per_sec']:>9} "
+              f"{result['mb_per_sec']:>7} {result['us_per_message']:>8} {result['flagged']:>8}")
+
+    if args.lexicon:
+        report(SafetyFilter(lexicon_paths=args.lexicon, reload_interval=0))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, f"bench_{size}.txt")
+            write_lexicon(path, size, rng)
+            report(SafetyFilter(lexicon_paths=[path], reload_interval=0))
+
+if __name__ == "__main__":
+    main()
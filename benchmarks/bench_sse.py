@@ -0,0 +1,77 @@
+"""
+Benchmark for token streaming in backend/sse.py.
+
+Replays a synthetic token stream (short word-piece deltas arriving at a steady
+inter-token interval) through several flush policies and reports frames per
+streamed token, bytes on the wire and CPU time per token. The first row is the
+old behaviour: one json.dumps frame per token.
+
+Arrival times are simulated, so the time threshold behaves as it would with a
+real model, while CPU time covers only framing and encoding.
+
+    python benchmarks/bench_sse.py --tokens 200000 --itl-ms 8
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import sse
+from backend.sse import SSEWriter
+
+PIECES = ["the", " quick", " brown", " fox", ",", " jumps", " over", " a", " lazy", " dog", ".", "\n", " \"quoted\"", " naïve", " résumé", " 42", " tokens"]
+
+def make_tokens(count: int, rng: random.Random) -> list:
+    return [rng.choice(PIECES) for _ in range(count)]
+
+def legacy(tokens: list):
+    frames, size = 0, 0
+    for token in tokens:
+        frame = f"data: {json.dumps({'content': token})}\n\n"
+        frames += 1
+        size += len(frame)
+    return frames, size
+
+def coalesced(tokens: list, itl: float, flush_ms: float, flush_bytes: int, format: str):
+    now = [0.0]
+    writer = SSEWriter(flush_ms=flush_ms, flush_bytes=flush_bytes, format=format, clock=lambda: now[0])
+    for token in tokens:
+        now[0] += itl
+        # The deadline would have fired while waiting for this token
+        if writer.time_to_flush() == 0:
+            writer.flush()
+        writer.add(token)
+    writer.flush()
+    return writer.frames, writer.bytes
+
+def measure(fn, *args):
+    start_cpu = time.process_time()
+    frames, size = fn(*args)
+    return frames, size, time.process_time() - start_cpu
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=200000)
+    parser.add_argument("--itl-ms", type=float, default=8.0, help="Simulated inter-token latency")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tokens = make_tokens(args.tokens, random.Random(args.seed))
+    itl = args.itl_ms / 1000
+    print(f"{args.tokens} tokens at {args.itl_ms} ms apart; encoder: {'orjson' if sse.orjson else 'json'}")
+    print(f"{'policy':<34} {'frames/token':>12} {'bytes/token':>11} {'cpu us/token':>12} {'frames/s':>9}")
+
+    def report(name, frames, size, cpu):
+        stream_seconds = args.tokens * itl
+        print(f"{name:<34} {frames / args.tokens:>12.3f} {size / args.tokens:>11.1f} {cpu / args.tokens * 1e6:>12.2f} {frames / stream_seconds:>9.1f}")
+
+    report("per token, json.dumps", *measure(legacy, tokens))
+    for flush_ms, flush_bytes, format in [(0, 0, "json"), (20, 64, "json"), (50, 256, "json"), (20, 64, "text"), (50, 256, "text")]:
+        report(f"{format}, {flush_ms} ms / {flush_bytes} bytes", *measure(coalesced, tokens, itl, flush_ms, flush_bytes, format))
+
+if __name__ == "__main__":
+    main()
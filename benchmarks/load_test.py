@@ -0,0 +1,301 @@
+"""
+Load test for the chat API with realistic multi-session workloads.
+
+By default the FastAPI app runs in-process on the deterministic stub model
+(model_backend "stub"), with its database and cache in a temporary directory,
+so it needs neither model files nor llama-cpp-python. Pass --url to drive a
+running server over HTTP instead.
+
+Each simulated user holds a chat session and sends its full history with every
+turn; after each turn it may start a new session (--churn), and sessions are
+capped at --history turns. A share of prompts (--repeat-ratio) is drawn from a
+small common pool, so conversations that open the same way hit the response cache.
+
+Reports TTFT, inter-token latency and end-to-end latency (p50/p95/p99),
+throughput, cache hit rate and, in-process, time spent in database calls.
+
+    python benchmarks/load_test.py --users 8 --requests 400 --output results.json
+    python benchmarks/load_test.py --url http://localhost:8000 --users 4 --requests 100
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import socket
+import tempfile
+import functools
+import statistics
+import contextlib
+from collections import defaultdict
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COMMON_PROMPTS = [
+    "What is the capital of France?",
+    "Explain recursion in one paragraph.",
+    "Write a haiku about autumn.",
+    "How do I reverse a list in Python?",
+    "What are the benefits of unit testing?",
+    "Summarize the plot of Hamlet.",
+    "What is the difference between TCP and UDP?",
+    "Give me three tips for better sleep.",
+]
+
+TOPICS = ["databases", "gardening", "jazz", "compilers", "hiking", "chess", "baking", "astronomy", "typography", "sailing"]
+
+# Database calls timed when running in-process
+DB_FUNCTIONS = ["add_message", "get_messages", "get_messages_page", "get_session_stats", "create_session", "get_sessions", "update_session_title"]
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered), 3),
+        "p50": round(pick(0.50), 3),
+        "p95": round(pick(0.95), 3),
+        "p99": round(pick(0.99), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+class Results:
+    def __init__(self):
+        self.ttft_ms = []
+        self.itl_ms = []
+        self.frame_gap_ms = []
+        self.latency_ms = []
+        self.queue_wait_ms = []
+        self.requests = 0
+        self.cached = 0
+        self.rejected = 0
+        self.errors = 0
+        self.tokens = 0
+        self.sessions = 0
+
+def instrument_database(database) -> dict:
+    """Wrap the database module's functions to record how long each call takes."""
+    timings = defaultdict(list)
+
+    def timed(name, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings[name].append((time.perf_counter() - start) * 1000)
+        return wrapper
+
+    for name in DB_FUNCTIONS:
+        if hasattr(database, name):
+            setattr(database, name, timed(name, getattr(database, name)))
+    return timings
+
+@contextlib.asynccontextmanager
+async def in_process_client(args):
+    """Start the app on the stub model with its database and cache in a temporary directory."""
+    workdir = tempfile.mkdtemp(prefix="pocketllm-load-")
+    # Read when backend.cache_manager is first imported: the cache, its side indexes and
+    # compression dictionaries then all live in the temporary directory
+    os.environ["POCKETLLM_CACHE_DIR"] = os.path.join(workdir, "cache")
+    from backend.config import config_manager
+    # In-memory overrides only; nothing is written back to config.json
+    config_manager.config.update({
+        "model_backend": "stub",
+        "stub_model_options": {
+            "token_delay": args.token_delay,
+            "prefill_delay": args.prefill_delay,
+            "reply_tokens": args.reply_tokens,
+        },
+        "max_prompts": args.history + 1,
+        "max_concurrent_inferences": args.max_concurrency,
+        "semantic_cache_enabled": args.semantic,
+        "inference_workers": 0,
+    })
+
+    from backend import database, cache_manager as cache_module
+    if cache_module.cache_manager.cache_dir != os.environ["POCKETLLM_CACHE_DIR"]:
+        raise RuntimeError("backend.cache_manager was imported before the load test could redirect the cache")
+    database.DB_PATH = os.path.join(workdir, "chat.db")
+    database.init_db()
+    timings = instrument_database(database)
+
+    from backend.main import app
+    from backend.scheduler import inference_scheduler
+    inference_scheduler.configure(max_concurrency=args.max_concurrency, max_queue=max(args.users * 2, 32))
+
+    # Serve on a loopback socket from this event loop: unlike httpx's ASGI transport,
+    # this streams responses as they are produced, so TTFT and inter-token gaps are real
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan="on"))
+    serving = asyncio.create_task(server.serve(sockets=[sock]))
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.01)
+    try:
+        host, port = sock.getsockname()
+        async with httpx.AsyncClient(base_url=f"http://{host}:{port}", timeout=None) as client:
+            yield client, timings
+    finally:
+        server.should_exit = True
+        await serving
+    print(f"Temporary data left in {workdir}")
+
+@contextlib.asynccontextmanager
+async def http_client(args):
+    async with httpx.AsyncClient(base_url=args.url.rstrip("/"), timeout=None) as client:
+        yield client, None
+
+async def chat_turn(client, results: Results, session_id: str, history: list):
+    start = time.perf_counter()
+    last = None
+    reply = ""
+    payload = {"messages": history, "session_id": session_id}
+    async with client.stream("POST", "/chat/completions", json=payload) as response:
+        if response.status_code == 429:
+            results.rejected += 1
+            await response.aread()
+            return None
+        if response.status_code != 200:
+            results.errors += 1
+            await response.aread()
+            return None
+        async for line in response.aiter_lines():
+            if not line.startswith("data: ") or line == "data: [DONE]":
+                continue
+            event = json.loads(line[6:])
+            now = time.perf_counter()
+            if "queue" in event:
+                results.queue_wait_ms.append(event["queue"].get("wait_ms", 0))
+                continue
+            if "error" in event:
+                results.errors += 1
+                return None
+            if "content" not in event:
+                continue
+            reply += event["content"]
+            if last is None:
+                results.ttft_ms.append((now - start) * 1000)
+            if event.get("cached"):
+                results.cached += 1
+                last = now
+                continue
+            # Frames coalesce several tokens; the server says how many. The gap since the
+            # previous frame is spread over them for the inter-token latency
+            tokens = event.get("tokens", 1)
+            if last is not None:
+                gap_ms = (now - last) * 1000
+                results.frame_gap_ms.append(gap_ms)
+                results.itl_ms.extend([gap_ms / tokens] * tokens)
+            last = now
+            results.tokens += tokens
+    results.latency_ms.append((time.perf_counter() - start) * 1000)
+    results.requests += 1
+    return reply
+
+async def user(client, results: Results, rng: random.Random, turns: int, args):
+    session_id, history = None, []
+    for _ in range(turns):
+        if session_id is None or len(history) // 2 >= args.history or rng.random() < args.churn:
+            session = (await client.post("/sessions/", json={"title": "Load test"})).json()
+            session_id, history = session["id"], []
+            results.sessions += 1
+        if rng.random() < args.repeat_ratio:
+            prompt = rng.choice(COMMON_PROMPTS)
+        else:
+            prompt = f"Tell me something new about {rng.choice(TOPICS)} (#{rng.randrange(10**6)})"
+        history.append({"role": "user", "content": prompt})
+        reply = await chat_turn(client, results, session_id, history)
+        if reply is None:
+            history.pop()
+            continue
+        history.append({"role": "assistant", "content": reply})
+        if args.think_time:
+            await asyncio.sleep(rng.expovariate(1 / args.think_time))
+
+async def run(args):
+    results = Results()
+    connect = http_client if args.url else in_process_client
+    async with connect(args) as (client, db_timings):
+        per_user = [args.requests // args.users + (1 if i < args.requests % args.users else 0) for i in range(args.users)]
+        started = time.perf_counter()
+        await asyncio.gather(*(user(client, results, random.Random(args.seed + i), per_user[i], args) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+        try:
+            server_stats = (await client.get("/admin/cache-stats")).json()
+        except Exception:
+            server_stats = None
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "elapsed_s": round(elapsed, 3),
+        "requests": results.requests,
+        "sessions": results.sessions,
+        "rejected": results.rejected,
+        "errors": results.errors,
+        "throughput": {
+            "requests_per_sec": round(results.requests / elapsed, 3),
+            "tokens_per_sec": round(results.tokens / elapsed, 3),
+        },
+        "cache_hit_rate": round(results.cached / results.requests, 4) if results.requests else 0.0,
+        "ttft_ms": percentiles(results.ttft_ms),
+        "itl_ms": percentiles(results.itl_ms),
+        "frame_gap_ms": percentiles(results.frame_gap_ms),
+        "latency_ms": percentiles(results.latency_ms),
+        "queue_wait_ms": percentiles(results.queue_wait_ms),
+        "db_ms": {name: {**percentiles(samples), "total": round(sum(samples), 3)} for name, samples in db_timings.items()} if db_timings is not None else None,
+        "server_cache": server_stats,
+    }
+    return report
+
+def print_report(report: dict):
+    print(f"\n{report['requests']} requests over {report['sessions']} sessions in {report['elapsed_s']} s "
+          f"({report['rejected']} rejected, {report['errors']} errors)")
+    print(f"Throughput: {report['throughput']['requests_per_sec']} req/s, {report['throughput']['tokens_per_sec']} tok/s")
+    print(f"Cache hit rate: {report['cache_hit_rate'] * 100:.1f}%")
+    for metric in ("ttft_ms", "itl_ms", "frame_gap_ms", "latency_ms", "queue_wait_ms"):
+        stats = report[metric]
+        if stats.get("count"):
+            print(f"{metric:<16} p50 {stats['p50']:9.3f}   p95 {stats['p95']:9.3f}   p99 {stats['p99']:9.3f}")
+    if report["db_ms"]:
+        print("Database:")
+        for name, stats in sorted(report["db_ms"].items()):
+            print(f"  {name:<22} calls {stats['count']:6}   p50 {stats['p50']:8.3f} ms   p99 {stats['p99']:8.3f} ms   total {stats['total']:9.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Drive a running server instead of an in-process app")
+    parser.add_argument("--users", type=int, default=8, help="concurrent simulated users")
+    parser.add_argument("--requests", type=int, default=200, help="total chat turns across all users")
+    parser.add_argument("--churn", type=float, default=0.2, help="chance of starting a new session after each turn")
+    parser.add_argument("--history", type=int, default=8, help="maximum turns per session")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="share of prompts drawn from a common pool")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between turns, in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-concurrency", type=int, default=1, help="in-process: concurrent inferences")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="in-process: stub seconds per generated token")
+    parser.add_argument("--prefill-delay", type=float, default=0.00002, help="in-process: stub seconds per prefilled byte")
+    parser.add_argument("--reply-tokens", type=int, default=32, help="in-process: stub reply length")
+    parser.add_argument("--semantic", action="store_true", help="in-process: enable the semantic cache tier")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
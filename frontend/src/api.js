@@ -21,8 +21,14 @@ export const deleteSession = async (sessionId) => {
     return response.json();
 };
 
-export const getSessionMessages = async (sessionId) => {
-    const response = await fetch(`${API_BASE}/sessions/${sessionId}/messages`);
+export const HISTORY_PAGE_SIZE = 100;
+export const CACHE_PAGE_SIZE = 50;
+
+// Newest page by default; pass `before` (a message id) to page back through older history
+export const getSessionMessages = async (sessionId, { before, limit = HISTORY_PAGE_SIZE } = {}) => {
+    const params = new URLSearchParams({ limit });
+    if (before) params.set('before', before);
+    const response = await fetch(`${API_BASE}/sessions/${sessionId}/messages?${params}`);
     return response.json();
 };
 
@@ -39,6 +45,14 @@ export const adminApi = {
     getSystemStats: () => fetch(`${API_BASE}/admin/system-stats`).then(res => res.json().then(data => ({ data }))),
     getCacheStats: () => fetch(`${API_BASE}/admin/cache-stats`).then(res => res.json().then(data => ({ data }))),
     clearCache: () => fetch(`${API_BASE}/admin/clear-cache`, { method: 'POST' }).then(res => res.json()),
+    // One page of cache entries; pass the returned next_after as `after` for the next page
+    getCacheEntries: (params = {}) => {
+        const query = new URLSearchParams(Object.entries(params).filter(([, value]) => value !== undefined && value !== null && value !== ''));
+        return fetch(`${API_BASE}/admin/cache/entries?${query}`).then(res => {
+            if (!res.ok) throw new Error('Failed to fetch cache data');
+            return res.json().then(data => ({ data }));
+        });
+    },
     getSessionConfig: () => fetch(`${API_BASE}/admin/session-config`).then(res => res.json().then(data => ({ data }))),
     setSessionConfig: (max_prompts) => fetch(`${API_BASE}/admin/session-config`, {
         method: 'POST',
@@ -1,22 +1,32 @@
 import React, { useState, useEffect } from 'react';
-import { adminApi } from '../api';
-import { Trash2, RefreshCw, Database, Clock, Hash, Eye, AlertCircle } from 'lucide-react';
+import { adminApi, CACHE_PAGE_SIZE } from '../api';
+import { Trash2, RefreshCw, Database, Clock, Hash, Eye, AlertCircle, Search } from 'lucide-react';
 
 const CacheViewer = () => {
     const [cacheData, setCacheData] = useState([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
     const [expandedKeys, setExpandedKeys] = useState(new Set());
+    const [nextAfter, setNextAfter] = useState(null);
+    const [totalCount, setTotalCount] = useState(0);
+    const [sessionFilter, setSessionFilter] = useState('');
 
-    const fetchCache = async () => {
+    // Loads the first page, or the next one after what is already shown
+    const fetchCache = async (more = false) => {
         try {
             setLoading(true);
-            const response = await fetch('http://localhost:8000/cache');
-            if (!response.ok) {
-                throw new Error('Failed to fetch cache data');
-            }
-            const data = await response.json();
-            setCacheData(data);
+            const [{ data: page }, { data: stats }] = await Promise.all([
+                adminApi.getCacheEntries({
+                    limit: CACHE_PAGE_SIZE,
+                    values: true,
+                    after: more ? nextAfter : undefined,
+                    session_prefix: sessionFilter.trim()
+                }),
+                adminApi.getCacheStats()
+            ]);
+            setCacheData(prev => more ? [...prev, ...page.entries] : page.entries);
+            setNextAfter(page.next_after);
+            setTotalCount(stats.count);
             setError(null);
         } catch (err) {
             setError(err.message);
@@ -69,7 +79,7 @@ const CacheViewer = () => {
                     <h3 className="text-xl font-semibold text-white mb-2">Error Loading Cache</h3>
                     <p className="text-red-400">{error}</p>
                     <button
-                        onClick={fetchCache}
+                        onClick={() => fetchCache()}
                         className="mt-4 px-4 py-2 bg-primary hover:bg-primary-hover text-white rounded-xl transition-all"
                     >
                         Try Again
@@ -89,8 +99,20 @@ const CacheViewer = () => {
                         <p className="text-gray-400">View and manage cached responses</p>
                     </div>
                     <div className="flex gap-3">
+                        <form
+                            onSubmit={(e) => { e.preventDefault(); fetchCache(); }}
+                            className="flex items-center gap-2 px-4 py-3 bg-white/5 rounded-xl border border-white/10"
+                        >
+                            <Search size={18} className="text-gray-400" />
+                            <input
+                                value={sessionFilter}
+                                onChange={(e) => setSessionFilter(e.target.value)}
+                                placeholder="Filter by session id"
+                                className="bg-transparent text-white text-sm outline-none placeholder-gray-500 w-48"
+                            />
+                        </form>
                         <button
-                            onClick={fetchCache}
+                            onClick={() => fetchCache()}
                             disabled={loading}
                             className="flex items-center gap-2 px-4 py-3 bg-white/5 hover:bg-white/10 text-white rounded-xl transition-all duration-300 border border-white/10 hover:border-white/20 disabled:opacity-50"
                         >
@@ -116,14 +138,14 @@ const CacheViewer = () => {
                             </div>
                             <span className="text-gray-400 text-sm font-medium">Total Items</span>
                         </div>
-                        <h3 className="text-3xl font-bold text-white">{cacheData.length}</h3>
+                        <h3 className="text-3xl font-bold text-white">{totalCount}</h3>
                     </div>
                     <div className="glass-card p-6 rounded-2xl">
                         <div className="flex items-center gap-3 mb-2">
                             <div className="p-3 bg-emerald-500/10 rounded-xl text-emerald-400">
                                 <Eye size={20} />
                             </div>
-                            <span className="text-gray-400 text-sm font-medium">Total Access</span>
+                            <span className="text-gray-400 text-sm font-medium">Total Access (shown)</span>
                         </div>
                         <h3 className="text-3xl font-bold text-white">
                             {cacheData.reduce((sum, item) => sum + item.access_count, 0)}
@@ -134,7 +156,7 @@ const CacheViewer = () => {
                             <div className="p-3 bg-accent/10 rounded-xl text-accent">
                                 <Hash size={20} />
                             </div>
-                            <span className="text-gray-400 text-sm font-medium">Avg Access</span>
+                            <span className="text-gray-400 text-sm font-medium">Avg Access (shown)</span>
                         </div>
                         <h3 className="text-3xl font-bold text-white">
                             {cacheData.length > 0
@@ -195,6 +217,15 @@ const CacheViewer = () => {
                             );
                         })
                     )}
+                    {nextAfter !== null && (
+                        <button
+                            onClick={() => fetchCache(true)}
+                            disabled={loading}
+                            className="w-full py-3 bg-white/5 hover:bg-white/10 text-gray-300 rounded-xl transition-all border border-white/10 disabled:opacity-50"
+                        >
+                            {loading ? 'Loading...' : `Load more (${cacheData.length} of ${totalCount} shown)`}
+                        </button>
+                    )}
                 </div>
             </div>
         </div>
@@ -1,7 +1,7 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { Send, Bot, User, Loader2, Sparkles, Plus, MessageSquare, Trash2 } from 'lucide-react';
 import { clsx } from 'clsx';
-import { getSessions, createSession, deleteSession, getSessionMessages, generateSessionTitle } from '../api';
+import { getSessions, createSession, deleteSession, getSessionMessages, generateSessionTitle, HISTORY_PAGE_SIZE } from '../api';
 
 const ChatInterface = () => {
     const [sessions, setSessions] = useState([]);
@@ -10,8 +10,11 @@ const ChatInterface = () => {
     const [input, setInput] = useState('');
     const [isLoading, setIsLoading] = useState(false);
     const [deleteConfirm, setDeleteConfirm] = useState(null);
+    const [hasOlder, setHasOlder] = useState(false);
+    const [loadingOlder, setLoadingOlder] = useState(false);
     const messagesContainerRef = useRef(null);
     const messagesEndRef = useRef(null);
+    const prependHeightRef = useRef(null);
 
     const scrollToBottom = () => {
         if (messagesContainerRef.current) {
@@ -20,6 +23,13 @@ const ChatInterface = () => {
     };
 
     useEffect(() => {
+        const container = messagesContainerRef.current;
+        if (container && prependHeightRef.current !== null) {
+            // Older history was prepended: keep the same messages in view
+            container.scrollTop = container.scrollHeight - prependHeightRef.current;
+            prependHeightRef.current = null;
+            return;
+        }
         scrollToBottom();
     }, [messages]);
 
@@ -45,17 +55,40 @@ const ChatInterface = () => {
         try {
             const msgs = await getSessionMessages(sessionId);
             setMessages(msgs);
+            setHasOlder(msgs.length === HISTORY_PAGE_SIZE);
         } catch (error) {
             console.error("Failed to load messages", error);
         }
     };
 
+    const loadOlderMessages = async () => {
+        if (!hasOlder || loadingOlder || !currentSessionId || !messages[0]?.id) return;
+        setLoadingOlder(true);
+        try {
+            const older = await getSessionMessages(currentSessionId, { before: messages[0].id });
+            prependHeightRef.current = messagesContainerRef.current?.scrollHeight ?? null;
+            setMessages(prev => [...older, ...prev]);
+            setHasOlder(older.length === HISTORY_PAGE_SIZE);
+        } catch (error) {
+            console.error("Failed to load older messages", error);
+        } finally {
+            setLoadingOlder(false);
+        }
+    };
+
+    const handleMessagesScroll = (e) => {
+        if (e.currentTarget.scrollTop < 50) {
+            loadOlderMessages();
+        }
+    };
+
     const handleNewChat = async () => {
         try {
             const newSession = await createSession();
             setSessions([newSession, ...sessions]);
             setCurrentSessionId(newSession.id);
             setMessages([]);
+            setHasOlder(false);
         } catch (error) {
             console.error("Failed to create session", error);
         }
@@ -143,13 +176,16 @@ const ChatInterface = () => {
             const reader = response.body.getReader();
             const decoder = new TextDecoder();
             let assistantContent = '';
+            let buffered = '';
 
             while (true) {
                 const { value, done } = await reader.read();
                 if (done) break;
 
-                const chunk = decoder.decode(value);
-                const lines = chunk.split('\n');
+                // A frame can be split across reads; keep the trailing partial line for the next one
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split('\n');
+                buffered = lines.pop();
 
                 for (const line of lines) {
                     if (line.startsWith('data: ')) {
@@ -245,7 +281,7 @@ const ChatInterface = () => {
                 {/* Header Area */}
                 <div className="absolute top-0 left-0 right-0 h-20 bg-gradient-to-b from-background/80 to-transparent z-10 pointer-events-none" />
 
-                <div ref={messagesContainerRef} className="flex-1 overflow-y-auto p-6 space-y-6 pt-10">
+                <div ref={messagesContainerRef} onScroll={handleMessagesScroll} className="flex-1 overflow-y-auto p-6 space-y-6 pt-10">
                     {messages.length === 0 && (
                         <div className="flex flex-col items-center justify-center h-full text-center animate-fade-in">
                             <div className="relative group">
@@ -261,6 +297,12 @@ const ChatInterface = () => {
                         </div>
                     )}
 
+                    {loadingOlder && (
+                        <div className="flex justify-center">
+                            <Loader2 className="w-4 h-4 animate-spin text-gray-500" />
+                        </div>
+                    )}
+
                     {messages.map((msg, idx) => (
                         <div key={idx} className={clsx(
                             "flex gap-4 max-w-[85%] animate-slide-up",
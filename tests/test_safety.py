@@ -0,0 +1,17 @@
+from backend.safety import find_pii
+
+def categories(text):
+    return [(m.category, m.text) for m in find_pii(text)]
+
+def test_failed_card_falls_back_to_phone():
+    # 14 digits match the card pattern but fail Luhn; the phone number inside must still be found
+    assert categories("5551234567 1234") == [("phone", "5551234567")]
+
+def test_valid_card_is_not_reported_as_phone():
+    assert categories("card 4111 1111 1111 1111 ok") == [("card", "4111 1111 1111 1111")]
+
+def test_invalid_card_alone_is_not_pii():
+    assert categories("4111111111111112") == []
+
+def test_invalid_ip_is_skipped():
+    assert categories("ip 10.0.0.1 and 999.1.1.1") == [("ip", "10.0.0.1")]